@@ -0,0 +1,350 @@
+"""
+Benchmark do pipeline de análise (root.py), etapa por etapa.
+
+Gera vídeos sintéticos (um "corredor" de palitos numa esteira) em várias resoluções, durações e fps
+e mede cada etapa separadamente: decode puro, hash do upload, inferência (decode + Pose), análise
+dos landmarks e coleta dos resultados. Roda com o MediaPipe de verdade e/ou com um backend de pose
+stub determinístico (mede só o overhead do pipeline, sem o modelo). Para cada etapa reporta tempo,
+frames por segundo, pico de RSS (processo principal e workers) e bytes gravados em disco, e salva
+tudo em um JSON para comparar execuções entre commits.
+
+Uso:
+    python benchmark.py --backend stub --resolutions 640x360,1280x720 --seconds 5,20 --fps 30 \
+        --mode multiproc,sequential --output benchmark_results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime
+
+import cv2
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+import root
+
+# ======================= CONFIG =======================
+WORKDIR = 'benchmark_work'          # vídeos gerados + saídas das análises (apagadas a cada caso)
+OUTPUT = 'benchmark_results.json'   # resultados (JSON)
+RESOLUTIONS = '640x360,1280x720'    # resoluções dos vídeos sintéticos (LxA, separadas por vírgula)
+SECONDS = '5,20'                    # durações (s)
+FPS_VALUES = '30'                   # taxas de quadros
+BACKENDS = 'stub'                   # stub | mediapipe | stub,mediapipe
+MODES = 'multiproc,sequential'      # multiproc | sequential
+STRIDE_SECONDS = 0.8                # período da passada do corredor sintético
+CODE_BITS = 20                      # bits do número do frame desenhados no topo do vídeo (lidos pelo stub)
+
+MEDIAPIPE_POSE = root.mp_pose.Pose  # backend real (root.mp_pose.Pose é trocado pelo StubPose nos casos 'stub')
+
+
+# ------------------ VÍDEO SINTÉTICO ------------------
+def gait_pose(idx, fps):
+    """
+    Pose sintética normalizada do frame 'idx': dict landmark -> (x, y). Mesma função usada para
+    desenhar o vídeo e para o stub, então os contatos do calcanhar aparecem nos dois backends.
+    """
+    phase = 2 * np.pi * idx / max(1.0, fps * STRIDE_SECONDS)
+    # a cada ~3 s o tronco inclina para frente (ângulo das costas abaixo de BACK_ANGLE_BAD_THRESH no pico)
+    slouch = float(np.clip((np.sin(2 * np.pi * idx / max(1.0, 3 * fps)) - 0.5) / 0.5, 0.0, 1.0))
+    shoulder = (0.50 + 0.28 * slouch, 0.30 + 0.15 * slouch)
+    heel = (0.47 + 0.10 * np.cos(phase), 0.85 + 0.05 * np.sin(phase))
+    return {
+        root.mp_pose.PoseLandmark.NOSE.value: (shoulder[0], shoulder[1] - 0.12),
+        root.SHOULDER_IDX: shoulder,
+        root.HIP_IDX: (0.50, 0.52),
+        root.KNEE_IDX: (0.52 + 0.04 * np.cos(phase), 0.70),
+        root.HEEL_IDX: heel,
+        root.FOOT_IDX: (heel[0] + 0.06, heel[1] + 0.01),
+    }
+
+def code_blocks(w, h):
+    """
+    Retângulos (x0, y0, x1, y1) dos bits do número do frame, na faixa do topo da imagem.
+    """
+    bw = max(4, w // (2 * CODE_BITS))
+    bh = max(4, h // 24)
+    return [(b * bw, 0, (b + 1) * bw, bh) for b in range(CODE_BITS)]
+
+def draw_synthetic_frame(idx, w, h, fps):
+    """
+    Frame BGR sintético: fundo com textura, esteira em movimento, corredor de palitos e o número
+    do frame codificado em blocos preto/branco no topo.
+    """
+    img = np.full((h, w, 3), 90, dtype=np.uint8)
+    img[:, :, 1] = (np.arange(w) * 120 // max(1, w))[None, :]
+    belt_y = int(0.88 * h)
+    img[belt_y:] = 40
+    shift = (idx * 7) % 40
+    for x in range(-shift, w, 40):
+        cv2.line(img, (x, belt_y), (x + 20, h - 1), (70, 70, 70), 2)
+
+    pts = {k: (int(x * w), int(y * h)) for k, (x, y) in gait_pose(idx, fps).items()}
+    thick = max(2, w // 160)
+    for a, b in ((root.SHOULDER_IDX, root.HIP_IDX), (root.HIP_IDX, root.KNEE_IDX),
+                 (root.KNEE_IDX, root.HEEL_IDX), (root.HEEL_IDX, root.FOOT_IDX)):
+        cv2.line(img, pts[a], pts[b], (230, 200, 180), thick)
+    cv2.circle(img, pts[root.mp_pose.PoseLandmark.NOSE.value], max(6, w // 40), (230, 200, 180), -1)
+
+    for b, (x0, y0, x1, y1) in enumerate(code_blocks(w, h)):
+        img[y0:y1, x0:x1] = 255 if (idx >> b) & 1 else 0
+    return img
+
+def make_synthetic_video(path, w, h, fps, seconds):
+    """
+    Grava (se ainda não existir) o vídeo sintético em 'path' (mp4v). Retorna o número de frames.
+    """
+    n = int(round(fps * seconds))
+    if os.path.exists(path):
+        return n
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    if not writer.isOpened():
+        raise RuntimeError(f"[BENCH] não foi possível criar {path}")
+    for i in range(n):
+        writer.write(draw_synthetic_frame(i, w, h, fps))
+    writer.release()
+    return n
+
+
+# ------------------ BACKEND STUB ------------------
+class StubPose:
+    """
+    Substituto determinístico do mp_pose.Pose: lê o número do frame dos blocos do topo da imagem
+    (funciona com a imagem reduzida por prepare_pose_input) e devolve a pose sintética desse frame.
+    Custo quase zero, então o tempo medido é só o do pipeline (decode, cópias, desenho, IPC, disco).
+    """
+    fps = 30.0  # definido pelo benchmark antes de criar o pool
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def process(self, rgb):
+        h, w = rgb.shape[:2]
+        idx = 0
+        for b, (x0, y0, x1, y1) in enumerate(code_blocks(w, h)):
+            cy, cx = (y0 + y1) // 2, (x0 + x1) // 2
+            if rgb[cy, cx].mean() > 127:
+                idx |= 1 << b
+
+        proto = landmark_pb2.NormalizedLandmarkList()
+        pose = gait_pose(idx, StubPose.fps)
+        for k in range(root.NUM_LANDMARKS):
+            x, y = pose.get(k, (0.5, 0.5))
+            # joelho encoberto em 2 de cada 50 frames (caminho de baixa visibilidade)
+            vis = 0.1 if k == root.KNEE_IDX and idx % 50 < 2 else 0.95
+            proto.landmark.add(x=float(x), y=float(y), z=0.0, visibility=vis)
+        return type('StubResults', (), {'pose_landmarks': proto})()
+
+
+# ------------------ MEDIÇÕES ------------------
+def read_peak_rss_mb(pid='self'):
+    """
+    Pico de memória residente (VmHWM) do processo em MB; None se não disponível.
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid == 'self':
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+    return None
+
+def reset_peak_rss():
+    """
+    Zera o pico de RSS do processo (Linux), para medir cada caso separadamente.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def worker_pids():
+    """
+    PIDs dos processos do pool persistente de root.py (vazio sem pool).
+    """
+    pool = root.WORKER_POOL
+    return [p.pid for p in getattr(pool, '_pool', [])] if pool is not None else []
+
+def dir_bytes(*paths):
+    """
+    Soma do tamanho dos arquivos sob as pastas.
+    """
+    total = 0
+    for path in paths:
+        for base, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(base, name))
+                except OSError:
+                    pass
+    return total
+
+def timed_stage(stages, name, frames, fn, *args):
+    """
+    Roda fn(*args) e registra em stages[name]: tempo, fps, bytes gravados e pico de RSS até aqui.
+    """
+    before = dir_bytes(root.OUT_DIR, root.LANDMARK_CACHE_DIR)
+    t0 = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - t0
+    stages[name] = {
+        'seconds': round(seconds, 4),
+        'fps': round(frames / seconds, 1) if seconds > 0 else None,
+        'bytes_written': dir_bytes(root.OUT_DIR, root.LANDMARK_CACHE_DIR) - before,
+        'peak_rss_mb': read_peak_rss_mb(),
+    }
+    return result
+
+def decode_only(video_path):
+    """
+    Decodifica o vídeo inteiro sem inferência (custo do decode isolado).
+    """
+    n = 0
+    for _ in root.iter_video_frames(video_path):
+        n += 1
+    return n
+
+
+# ------------------ EXECUÇÃO ------------------
+def run_case(video_path, frames, fps, backend, mode, procs):
+    """
+    Executa e mede todas as etapas de uma análise de 'video_path' com o backend e o modo informados.
+    """
+    StubPose.fps = fps
+    root.mp_pose.Pose = StubPose if backend == 'stub' else MEDIAPIPE_POSE
+    root.NUM_PROCS = procs if mode == 'multiproc' else 1
+    root.FRAME_COST_EMA = None
+    if mode == 'multiproc' and procs > 1:
+        root.start_worker_pool()  # fora da medição: o pool é persistente na API
+    reset_peak_rss()
+
+    stages = {}
+    try:
+        timed_stage(stages, 'decode', frames, decode_only, video_path)
+        timed_stage(stages, 'hash', frames, root.file_sha256, video_path)
+
+        meta = root.probe_video(video_path)
+        meta.update(root.create_job_workspace())
+        process = root.process_frames_multiproc if mode == 'multiproc' else root.process_frames_sequential
+        landmarks = timed_stage(stages, 'inference', frames, process, meta)
+        store = timed_stage(stages, 'analysis', frames, root.analyze_landmarks, landmarks, meta)
+        result = timed_stage(stages, 'collection', frames, root.collect_analysis_results, meta, video_path, store)
+        workers_rss = [read_peak_rss_mb(pid) for pid in worker_pids()]
+    finally:
+        root.stop_worker_pool()
+
+    return {
+        'backend': backend,
+        'mode': mode,
+        'procs': root.NUM_PROCS,
+        'stages': stages,
+        'total_seconds': round(sum(stages[k]['seconds'] for k in ('hash', 'inference', 'analysis', 'collection')), 4),
+        'peak_rss_mb': read_peak_rss_mb(),
+        'workers_peak_rss_mb': max((r for r in workers_rss if r is not None), default=None),
+        'schedule': meta.get('schedule'),
+        'counters': dict(meta.get('counters', {})),
+        'summary': result['summary'],
+    }
+
+def git_commit():
+    """
+    Commit atual do repositório (para comparar resultados entre commits), ou None.
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def parse_list(text, cast=str):
+    return [cast(v) for v in text.split(',') if v.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de análise de vídeo (root.py).")
+    parser.add_argument('--resolutions', default=RESOLUTIONS, help="LxA separados por vírgula (ex.: 640x360,1920x1080)")
+    parser.add_argument('--seconds', default=SECONDS, help="durações dos vídeos (s)")
+    parser.add_argument('--fps', default=FPS_VALUES, help="taxas de quadros")
+    parser.add_argument('--backend', default=BACKENDS, help="stub, mediapipe ou stub,mediapipe")
+    parser.add_argument('--mode', default=MODES, help="multiproc, sequential ou os dois")
+    parser.add_argument('--procs', type=int, default=root.NUM_PROCS, help="workers no modo multiproc")
+    parser.add_argument('--repeat', type=int, default=1, help="repetições de cada caso")
+    parser.add_argument('--workdir', default=WORKDIR)
+    parser.add_argument('--output', default=OUTPUT)
+    parser.add_argument('--verbose', action='store_true', help="mantém o log INFO do pipeline")
+    args = parser.parse_args(argv)
+
+    root.logger.setLevel('INFO' if args.verbose else 'WARNING')
+    os.makedirs(args.workdir, exist_ok=True)
+    root.OUT_DIR = os.path.join(args.workdir, 'out')
+    root.LANDMARK_CACHE_ENABLED = False  # toda execução mede decode + inferência de verdade
+
+    results = []
+    for res in parse_list(args.resolutions):
+        w, h = (int(v) for v in res.lower().split('x'))
+        for fps in parse_list(args.fps, float):
+            for seconds in parse_list(args.seconds, float):
+                video_path = os.path.join(args.workdir, f"synthetic_{w}x{h}_{fps:g}fps_{seconds:g}s.mp4")
+                frames = make_synthetic_video(video_path, w, h, fps, seconds)
+                for backend in parse_list(args.backend):
+                    for mode in parse_list(args.mode):
+                        for run in range(args.repeat):
+                            case = run_case(video_path, frames, fps, backend, mode, args.procs)
+                            case.update(video={'width': w, 'height': h, 'fps': fps, 'seconds': seconds,
+                                               'frames': frames, 'bytes': os.path.getsize(video_path)},
+                                        run=run)
+                            results.append(case)
+                            inf = case['stages']['inference']
+                            print(f"[BENCH] {w}x{h} {fps:g}fps {seconds:g}s | {backend:9s} {mode:10s} | "
+                                  f"decode {case['stages']['decode']['fps']} fps | inferência {inf['fps']} fps | "
+                                  f"total {case['total_seconds']:.2f}s | RSS {case['peak_rss_mb']} MB "
+                                  f"(workers {case['workers_peak_rss_mb']}) | disco {sum(s['bytes_written'] for s in case['stages'].values())} B")
+                            shutil.rmtree(root.OUT_DIR, ignore_errors=True)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'config': {
+            'MODEL_COMPLEXITY': root.MODEL_COMPLEXITY,
+            'POSE_INPUT_MAX_SIDE': root.POSE_INPUT_MAX_SIDE,
+            'ROI_CROP_ENABLED': root.ROI_CROP_ENABLED,
+            'ADAPTIVE_FPS_ENABLED': root.ADAPTIVE_FPS_ENABLED,
+            'CHUNKS_PER_WORKER': root.CHUNKS_PER_WORKER,
+            'IMAGE_WRITER_THREADS': root.IMAGE_WRITER_THREADS,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[BENCH] {len(results)} casos salvos em {os.path.abspath(args.output)}")
+    root.stop_image_writer()
+    return report
+
+if __name__ == '__main__':
+    main()
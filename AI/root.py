@@ -1,17 +1,33 @@
 # ====================== IMPORT DAS BIBLIOTECAS ======================
 import os
+import re
+import hashlib
 import shutil
+import time
+import uuid
+import asyncio
+import atexit
+import threading
+import argparse
+import bisect
+import sys
+import pickle
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from multiprocessing import Pool, cpu_count
 import tempfile
 import json
+import logging
+from collections import Counter
 from datetime import datetime
-from typing import Dict, List, Any
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from typing import Dict, List, Any, Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.routing import Match
 import uvicorn
 
 #desabilita threads internas 
@@ -21,11 +37,154 @@ except Exception:
     pass
 
 import mediapipe as mp
+from mediapipe.framework.formats import landmark_pb2
 
 # atalhos para facilitar leitura do código
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
+# ======================= LOG =======================
+# Log com níveis (LOG_LEVEL): INFO = etapas e resumos por análise; DEBUG = detalhes e amostras por frame.
+# Linhas por frame só com TRACE_FRAMES=True (debug); os workers devolvem contadores, não texto.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+FRAME_LOG_SAMPLE_EVERY = 100        # em DEBUG, loga 1 a cada N frames (0 = nenhum)
+TRACE_FRAMES = False                # True: loga todos os frames (em DEBUG), inclusive dentro dos workers
+
+logger = logging.getLogger('analysis')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(processName)s] %(message)s'))
+    logger.addHandler(_log_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+def should_log_frame(idx):
+    """
+    True se a linha de log do frame 'idx' deve ser emitida (TRACE_FRAMES ou amostra de FRAME_LOG_SAMPLE_EVERY, em DEBUG).
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return TRACE_FRAMES or (FRAME_LOG_SAMPLE_EVERY > 0 and idx % FRAME_LOG_SAMPLE_EVERY == 0)
+
+# ======================= MÉTRICAS =======================
+# Histogramas de latência por etapa (expostos em /metrics, formato Prometheus). Cada trecho de inferência
+# acumula os seus em um dict etapa -> histograma (observe_stage) e devolve junto com o resultado, também
+# dos workers; o processo da API soma tudo em STAGE_METRICS (record_stage_timings).
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+STAGE_METRICS = {}
+STAGE_METRICS_LOCK = threading.Lock()
+
+def new_histogram():
+    """
+    Histograma vazio: contagem por faixa de STAGE_BUCKETS (+ a faixa acima do último) e soma em segundos.
+    """
+    return {'counts': [0] * (len(STAGE_BUCKETS) + 1), 'sum': 0.0}
+
+def observe_stage(timings, stage, seconds):
+    """
+    Soma uma duração (s) ao histograma 'stage' de 'timings' (dict etapa -> histograma).
+    """
+    hist = timings.get(stage)
+    if hist is None:
+        hist = timings[stage] = new_histogram()
+    hist['counts'][bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+    hist['sum'] += seconds
+
+def merge_stage_timings(total_timings, timings):
+    """
+    Soma os histogramas de 'timings' nos de 'total_timings' (ambos etapa -> histograma).
+    """
+    for stage, hist in timings.items():
+        total = total_timings.setdefault(stage, new_histogram())
+        total['counts'] = [a + b for a, b in zip(total['counts'], hist['counts'])]
+        total['sum'] += hist['sum']
+
+def record_stage_timings(timings, meta=None):
+    """
+    Junta os histogramas de um trecho (ou de uma etapa medida neste processo) em STAGE_METRICS
+    e, com 'meta', também nos da análise (meta['stage_timings'], usado no perfil do job).
+    """
+    if meta is not None:
+        merge_stage_timings(meta.setdefault('stage_timings', {}), timings)
+    with STAGE_METRICS_LOCK:
+        merge_stage_timings(STAGE_METRICS, timings)
+
+# ======================= PERFIL POR JOB =======================
+# Com profile=true na análise, uma thread amostra a pilha de execução (a cada PROFILE_SAMPLE_INTERVAL)
+# da thread do job e, nos workers, da thread que processa cada chunk. As pilhas são contadas no formato
+# "folded" (raiz;...;folha -> amostras) e somadas entre os processos.
+class StackSampler:
+    """
+    Amostrador da pilha da thread que o cria. Uso: start(), ..., stop() -> Counter.
+    As pilhas começam na função que criou o amostrador (o que está abaixo dela não entra).
+    """
+    def __init__(self, interval=None):
+        self.thread_id = threading.get_ident()
+        self.base = sys._getframe(1)
+        self.interval = interval or PROFILE_SAMPLE_INTERVAL
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back if frame is not self.base else None
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+def summarize_stage_timings(timings):
+    """
+    Resumo dos histogramas de uma análise: {etapa: {'count', 'total_seconds', 'mean_ms'}}.
+    """
+    summary = {}
+    for stage, hist in sorted(timings.items()):
+        count = sum(hist['counts'])
+        summary[stage] = {'count': count, 'total_seconds': round(hist['sum'], 4),
+                          'mean_ms': round(1000 * hist['sum'] / count, 3) if count else None}
+    return summary
+
+def summarize_profile(stacks, top=None):
+    """
+    Relatório das pilhas amostradas: total de amostras, funções com mais amostras próprias (self, a
+    função estava no topo da pilha) e totais (inclusive, estava em algum ponto da pilha) e as pilhas
+    mais frequentes (folded).
+    """
+    top = top or PROFILE_TOP_N
+    total = sum(stacks.values())
+    self_counts = Counter()
+    inclusive_counts = Counter()
+    for stack, n in stacks.items():
+        names = stack.split(';')
+        self_counts[names[-1]] += n
+        for name in set(names):
+            inclusive_counts[name] += n
+
+    def table(counter):
+        return [{'function': name, 'samples': n, 'percent': round(100.0 * n / total, 1)}
+                for name, n in counter.most_common(top)]
+
+    return {
+        'samples': total,
+        'interval_ms': PROFILE_SAMPLE_INTERVAL * 1000,
+        'top_self': table(self_counts),
+        'top_inclusive': table(inclusive_counts),
+        'stacks': [{'stack': stack, 'samples': n} for stack, n in stacks.most_common(top)]
+    }
+
 # ======================= TO DO =======================
 #TO DO: definir se vai desenhar algo no frame
 #TO DO: JSON para o front
@@ -36,27 +195,70 @@ mp_pose = mp.solutions.pose
 VIDEO_PATH = 'runsakai.mp4'         # caminho do vídeo 
 
 # Pastas e formatos de I/O
-FRAMES_DIR = 'frames_raw'           # pasta onde os frames do vídeo serão salvos
+SAVE_RAW_FRAMES = False             # debug: True salva também os frames decodificados em FRAMES_DIR/<job_id>
+FRAMES_DIR = 'frames_raw'           # pasta onde os frames do vídeo serão salvos (apenas com SAVE_RAW_FRAMES)
 FRAMES_EXT = '.jpg'                 # formato dos frames extraídos: '.jpg' 
 FRAMES_JPEG_QUALITY = 92            # qualidade JPEG dos frames extraídos (0-100)
 
-OUT_DIR = 'out'                     # pasta raiz de saída 
+OUT_DIR = 'out'                     # pasta raiz de saída (cada análise usa a subpasta OUT_DIR/<job_id>)
 IMG_EXT = '.jpg'                    # extensão das imagens salvas nas pastas de saída
 JPEG_QUALITY = 92                   # qualidade JPEG para as saídas anotadas
 
 # Flags de salvamento (controlam o que será escrito em disco)
 SAVE_ALL_FRAMES = False             # True: salva TODOS os frames anotados (alto custo de I/O)
-SAVE_LOW_VIS_FRAMES = True          # True: salva frames com visibilidade insuficiente
+SAVE_POSTURE_FRAMES = False         # True: salva durante a inferência todos os frames com postura ruim (senão são renderizados sob demanda)
+SAVE_LOW_VIS_FRAMES = False         # True: salva durante a inferência todos os frames com visibilidade insuficiente
+RENDER_CACHE_MAX_BYTES = 64 * 1024**2  # cache LRU (em memória) dos JPEGs renderizados sob demanda em /jobs/{job_id}/frames/{idx}
+LANDMARKS_FILENAME = 'landmarks.npy'   # landmarks do job salvos no workspace (base da renderização sob demanda)
+IMAGE_WRITER_THREADS = 2            # threads (por processo) que codificam/salvam as imagens anotadas em background
+IMAGE_WRITER_MAX_PENDING = 32       # imagens na fila do writer; acima disso a inferência espera (backpressure)
+SAVE_FRAME_DATA = False             # debug: True salva as colunas por frame em OUT_DIR/<job_id>/frame_data.npz
+PROFILE_SAMPLE_INTERVAL = 0.005     # análises com profile=true: intervalo (s) entre amostras da pilha de execução
+PROFILE_TOP_N = 25                  # funções/pilhas mais frequentes no relatório de perfil do job
+
+# Workspaces por análise (permite várias análises simultâneas no mesmo container)
+JOB_RETENTION_SECONDS = 6 * 3600    # workspaces de jobs mais antigos que isso são apagados (ao criar um novo e a cada PURGE_INTERVAL_SECONDS)
+JOB_VIDEO_MAX_BYTES = 4 * 1024**3   # vídeos de /jobs/ guardados para renderizar frames sob demanda; acima disso sai o menos usado
+PURGE_INTERVAL_SECONDS = 10 * 60    # intervalo da limpeza periódica (jobs, lotes e workspaces expirados)
+JOB_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')  # formato aceito para job_id (vira nome de pasta e URL)
+MAX_CONCURRENT_JOBS = 2             # análises executadas ao mesmo tempo em background (as demais ficam na fila)
+MAX_QUEUED_JOBS = 8                 # análises esperando vaga; com a fila cheia novos uploads recebem 503 + Retry-After
+RETRY_AFTER_DEFAULT_SECONDS = 30    # Retry-After enquanto ainda não há duração média de análise medida
+PROGRESS_EVERY_FRAMES = 30          # no modo sequencial, atualiza o progresso do job a cada N frames
+LIVE_MAX_SESSIONS = 2               # sessões simultâneas do WebSocket em tempo real (/ws/live), cada uma com o seu Pose
+LIVE_DEFAULT_FPS = 30.0             # fps da câmera quando o cliente não informa (?fps=), base da janela do calcanhar
+LIVE_MAX_FRAME_BYTES = 4 * 1024**2  # tamanho máximo de um frame codificado recebido no WebSocket
+SSE_POLL_SECONDS = 0.5              # intervalo em que o stream de progresso (/jobs/{job_id}/events) verifica o job
+SSE_KEEPALIVE_SECONDS = 15.0        # comentário de keep-alive no stream quando nada mudou nesse tempo
+UPLOAD_MAX_BYTES = 1024**3          # tamanho máximo de um vídeo enviado (acima disso: 413)
+UPLOAD_CHUNK_BYTES = 1024**2        # bloco de leitura/gravação do upload (memória por upload fica limitada a isso)
+BATCH_CONCURRENT_VIDEOS = 2         # modo em lote: vídeos analisados ao mesmo tempo (os chunks deles dividem o mesmo pool)
+BATCH_MAX_FILES = 50                # vídeos por requisição em POST /batches/
+BATCH_DIR = 'batch_results'         # pasta dos resultados (JSON Lines) dos lotes enviados pela API
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.avi', '.mkv', '.webm', '.mpg', '.mpeg', '.ts', '.3gp')  # vídeos ao varrer uma pasta (CLI em lote)
 
 # ============== VARIÁVEIS DO MEDIAPIPE ====================
 MODEL_COMPLEXITY = 1                # 0|1|2 — 1 equilibrio entre custo e qualidade
 MIN_DET_CONF = 0.5                  # confiança mínima de detecção 
 MIN_TRK_CONF = 0.5                  # confiança mínima de tracking 
+POSE_INPUT_MAX_SIDE = 1280          # maior lado (px) da imagem enviada ao Pose; frames maiores (ex.: 4K) são reduzidos antes (None = resolução original)
+ROI_CROP_ENABLED = False            # True: recorta o frame na caixa da pessoa (landmarks do frame anterior) antes do Pose
+ROI_PADDING = 0.25                  # margem da caixa da pessoa, em fração do maior lado da caixa
+ROI_MIN_SIZE = 64                   # caixas menores que isso (px) são descartadas e o frame inteiro é usado
+ROI_EDGE_MARGIN = 0.08              # o recorte fica parado e só é refeito quando a pessoa chega a menos que isso (fração do recorte) da borda...
+ROI_REFIT_RATIO = 0.5               # ...ou passa a ocupar menos que isso do recorte (afastou-se da câmera); ver track_roi
+
+# Cache dos landmarks (evita rodar o MediaPipe de novo para o mesmo vídeo)
+LANDMARK_CACHE_ENABLED = True       # True: reaproveita landmarks de vídeos já analisados (mesmo conteúdo + mesmo modelo)
+LANDMARK_CACHE_DIR = 'landmark_cache'  # pasta do cache (um .npy por vídeo/configuração do modelo)
+LANDMARK_CACHE_MAX_BYTES = 2 * 1024**3  # tamanho máximo do cache em disco; acima disso remove os menos usados
+LANDMARK_CACHE_VERSION = 2          # incrementar quando o formato dos landmarks salvos mudar
 
 # Lógica de análise
 MIN_VIS = 0.30                      # visibilidade mínima de um landmark para ser considerado confiável
 BACK_ANGLE_BAD_THRESH = 110.0       # threshold para angulo das costas
 WINDOW_SECONDS = 0.8                # janela de segundos para captura do overstride
+HEEL_TOL = 1e-3                     # tolerancia no pico do calcanhar, pra evitar problemas com casas decimais
 COOLDOWN_SECONDS = 0.2             # tempo mínimo entre detecções consecutivas do calcanhar, evitar pegar o pe no meio da esteira
 
 # PONTO DE CONTATO DO CALCANHAR: 2/8 DO PÉ
@@ -65,43 +267,102 @@ CONTACT_RATIO = 2.0 / 8.0           # define o ponto de contato calcanhar com a
 # Paralelismo
 MULTIPROCESS = True                 # True: processa em chunks com multiprocessing (ideal para videos maiores de 30 segundos) / False: assiste o video em tempo real
 NUM_PROCS = max(4, cpu_count() - 1) # número de processos/workers | aqui preferimos usar (N-1) ou 4, o que for maior
-CHUNK_SIZE_FRAMES = 200             # quantidade (aprox.) de frames por chunk no multiprocess
+CHUNKS_PER_WORKER = 3               # chunks por worker no plano (mais chunks = melhor balanceamento, mais overlap)
+CHUNK_MIN_FRAMES = 60               # tamanho mínimo de um chunk (frames efetivos, sem o overlap); vídeo curto divide em ceil(n / isso) chunks
+CHUNK_MAX_OVERLAP_RATIO = 0.15      # overlap máximo por chunk (fração do chunk); limita o tamanho mínimo no vídeo longo
+CHUNK_TARGET_SECONDS = 20.0         # tempo alvo (s) do maior chunk, a partir do custo medido por frame
+WORKER_MAX_TASKS = 100              # chunks processados por um worker do pool antes de ser reciclado (libera memória)
+
+# Taxa de frames adaptativa: Pose a ADAPTIVE_BASE_FPS no vídeo todo e taxa cheia só perto dos contatos do
+# calcanhar e das mudanças de postura/visibilidade; os demais frames são interpolados.
+# Custo contado em chamadas reais do Pose (counters['pose_calls']), incluindo aquecimento e a chamada extra
+# quando o recorte do ROI muda. Medido com MediaPipe (4 workers, pessoa real andando, raio 0,15 s): a 30 fps
+# (passo 2) o adaptativo fez 108-124% das chamadas do modo completo e com passo 3 ainda 94-100%, por isso
+# passos abaixo de ADAPTIVE_MIN_STEP rodam direto em taxa cheia; a 60 fps (passo 4) fez 79% das chamadas.
+# Tolerância (60 fps): frames refinados NÃO saem iguais ao modo completo (o tracking reinicia a cada trecho):
+# landmarks com mediana de 1,2 px e p90 de 6,2 px de diferença (diagonal de 1101 px), contatos iguais ou
+# deslocados até 3 frames, ângulo de overstride até ~2° (um contato com 10°), e contagens de postura e
+# overstride maiores (45 contra 30 e 8 contra 6 frames); quedas de visibilidade mais curtas que um passo
+# podem sumir da contagem.
+ADAPTIVE_FPS_ENABLED = False        # True: usa a inferência adaptativa (process_frames_adaptive)
+ADAPTIVE_BASE_FPS = 15.0            # taxa (fps) do primeiro passo, no vídeo inteiro
+ADAPTIVE_REFINE_SECONDS = 0.15      # raio (s) da vizinhança refinada em taxa cheia ao redor de cada evento
+ADAPTIVE_WARMUP_FRAMES = 5          # frames de aquecimento do tracking antes de cada trecho refinado
+ADAPTIVE_MIN_STEP = 4               # passo (fps / ADAPTIVE_BASE_FPS) mínimo para valer a pena; abaixo disso roda em taxa cheia
+ADAPTIVE_MAX_REFINE_RATIO = 0.8     # trechos refinados (com aquecimento) acima dessa fração do vídeo: passo 2 em taxa cheia no vídeo todo
 # ===========================================================
 
 
 # ------------------ UTIL ------------------
-def reset_out_dir():
+def new_job_id():
+    """
+    Gera um identificador único para uma análise: data/hora + sufixo aleatório.
     """
-    Apaga e recria a pasta de saída OUT_DIR para garantir um ambiente limpo em cada execução.
-    Útil para não misturar resultados de runs anteriores.
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+def cleanup_old_workspaces():
+    """
+    Apaga os workspaces (OUT_DIR/<job_id> e FRAMES_DIR/<job_id>) mais antigos que JOB_RETENTION_SECONDS.
+    """
+    limit = time.time() - JOB_RETENTION_SECONDS
+    for root_dir in (OUT_DIR, FRAMES_DIR):
+        if not os.path.isdir(root_dir):
+            continue
+        for name in os.listdir(root_dir):
+            path = os.path.join(root_dir, name)
+            try:
+                if os.path.isdir(path) and JOB_ID_RE.match(name) and os.path.getmtime(path) < limit:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+def create_job_workspace(job_id=None):
     """
-    if os.path.isdir(OUT_DIR):
-        shutil.rmtree(OUT_DIR)
-    os.makedirs(OUT_DIR, exist_ok=True)
+    Cria um workspace isolado para uma análise, no lugar de apagar as pastas globais:
+      - out_dir: OUT_DIR/<job_id> (imagens anotadas);
+      - url_prefix: prefixo estático servido pelo mount /out ("out/<job_id>");
+      - frames_dir: FRAMES_DIR/<job_id>, apenas com SAVE_RAW_FRAMES=True (senão None).
+    Assim duas análises simultâneas não apagam os arquivos uma da outra.
+    """
+    job_id = job_id or new_job_id()
+    if not JOB_ID_RE.match(job_id):
+        raise ValueError(f"job_id inválido: {job_id!r}")
+
+    cleanup_old_workspaces()
 
-def ensure_dirs():
+    out_dir = os.path.join(OUT_DIR, job_id)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    frames_dir = None
+    if SAVE_RAW_FRAMES:
+        frames_dir = os.path.join(FRAMES_DIR, job_id)
+        if os.path.isdir(frames_dir):
+            shutil.rmtree(frames_dir)
+        os.makedirs(frames_dir, exist_ok=True)
+
+    return {
+        "job_id": job_id,
+        "out_dir": out_dir,
+        "url_prefix": f"out/{job_id}",
+        "frames_dir": frames_dir,
+    }
+
+def ensure_dirs(out_dir):
     """
-    Cria as subpastas de saída necessárias:
+    Cria as subpastas de saída necessárias dentro do workspace do job:
       - postura_incorreta: quando o ângulo das costas é considerado ruim;
       - min_heel: quando detectamos o "mínimo" do calcanhar e desenhamos o overstride;
       - baixa_visibilidade: quando landmarks chave não atingem MIN_VIS;
       - all (opcional): todos os frames anotados (se SAVE_ALL_FRAMES=True).
     """
-    os.makedirs(OUT_DIR, exist_ok=True)
-    os.makedirs(os.path.join(OUT_DIR, 'postura_incorreta'), exist_ok=True)
-    os.makedirs(os.path.join(OUT_DIR, 'min_heel'), exist_ok=True)
-    os.makedirs(os.path.join(OUT_DIR, 'baixa_visibilidade'), exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'postura_incorreta'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'min_heel'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'baixa_visibilidade'), exist_ok=True)
     if SAVE_ALL_FRAMES:
-        os.makedirs(os.path.join(OUT_DIR, 'all'), exist_ok=True)
-
-def reset_frames_dir():
-    """
-    Apaga e recria a pasta dos frames extraídos do vídeo. Isso impede confusão entre
-    frames antigos e os do vídeo atual.
-    """
-    if os.path.isdir(FRAMES_DIR):
-        shutil.rmtree(FRAMES_DIR)
-    os.makedirs(FRAMES_DIR, exist_ok=True)
+        os.makedirs(os.path.join(out_dir, 'all'), exist_ok=True)
 
 def save_img(path, img):
     """
@@ -112,47 +373,97 @@ def save_img(path, img):
     else:
         cv2.imwrite(path, img)
 
-def is_visible(lm, thr=MIN_VIS):
+# Writer de imagens em background: JPEG + disco saem do loop de inferência. Um pool de threads por
+# processo (o cv2 libera o GIL no imwrite), com no máximo IMAGE_WRITER_MAX_PENDING imagens na fila.
+_IMAGE_WRITER = None
+_IMAGE_WRITER_PID = None
+_IMAGE_WRITER_SLOTS = threading.BoundedSemaphore(IMAGE_WRITER_MAX_PENDING)
+_IMAGE_WRITER_LOCK = threading.Lock()
+
+def get_image_writer():
+    """
+    Pool de threads do writer deste processo (recriado em processos filhos, já que threads não sobrevivem ao fork).
     """
-    Verifica se o frame é minimamente visivel.
+    global _IMAGE_WRITER, _IMAGE_WRITER_PID, _IMAGE_WRITER_SLOTS
+    with _IMAGE_WRITER_LOCK:
+        if _IMAGE_WRITER is None or _IMAGE_WRITER_PID != os.getpid():
+            _IMAGE_WRITER = ThreadPoolExecutor(IMAGE_WRITER_THREADS, thread_name_prefix="image-writer")
+            _IMAGE_WRITER_SLOTS = threading.BoundedSemaphore(IMAGE_WRITER_MAX_PENDING)
+            _IMAGE_WRITER_PID = os.getpid()
+        return _IMAGE_WRITER
+
+def timed_save_img(path, img):
     """
-    return (hasattr(lm, 'visibility') and lm.visibility is not None and lm.visibility > thr)
+    save_img medindo o tempo (codificação JPEG + disco); retorna os segundos gastos.
+    """
+    t0 = time.perf_counter()
+    save_img(path, img)
+    return time.perf_counter() - t0
 
-def frame_path(idx):
+def save_img_async(path, img, pending):
     """
-    Cria a indexacao dos frames na pasta.
+    Enfileira save_img(path, img) no writer em background e guarda o future em 'pending'
+    (lista do chamador, esvaziada por flush_image_writes). Bloqueia se a fila estiver cheia.
+    A imagem não pode ser alterada depois de enviada.
     """
-    return os.path.join(FRAMES_DIR, f"frame_{idx:06d}{FRAMES_EXT}")
+    writer = get_image_writer()
+    slots = _IMAGE_WRITER_SLOTS
+    slots.acquire()
+    try:
+        future = writer.submit(timed_save_img, path, img)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    pending.append(future)
 
-def annotated_path(subdir, idx):
+def flush_image_writes(pending, timings=None):
     """
-    Constrói o caminho onde será salvo um frame anotado, organizado por subpasta temática:
-      OUT_DIR/<subdir>/frame_000000.jpg
+    Espera as imagens de 'pending' serem gravadas (propaga o primeiro erro de escrita).
+    Com 'timings', o tempo de cada gravação entra no histograma 'image_encode'.
     """
-    return os.path.join(OUT_DIR, subdir, f"frame_{idx:06d}{IMG_EXT}")
+    try:
+        for future in pending:
+            seconds = future.result()
+            if timings is not None:
+                observe_stage(timings, 'image_encode', seconds)
+    finally:
+        pending.clear()
+
+def stop_image_writer():
+    """
+    Encerra o writer deste processo depois de gravar o que ainda está na fila (shutdown da API).
+    """
+    global _IMAGE_WRITER
+    with _IMAGE_WRITER_LOCK:
+        if _IMAGE_WRITER is not None and _IMAGE_WRITER_PID == os.getpid():
+            _IMAGE_WRITER.shutdown(wait=True)
+        _IMAGE_WRITER = None
+
+def frame_path(frames_dir, idx):
+    """
+    Cria a indexacao dos frames na pasta.
+    """
+    return os.path.join(frames_dir, f"frame_{idx:06d}{FRAMES_EXT}")
 
-def to_pixel(pt_norm, w, h):
+def annotated_path(out_dir, subdir, idx):
     """
-    Converte um ponto normalizado (x,y em [0,1]) do MediaPipe para coordenadas em pixels.
-    Ou seja, garante que videos de resolucoes de diferentes sejam compativeis com o mesmo codigo, ja que converte para pixels
+    Constrói o caminho onde será salvo um frame anotado, organizado por subpasta temática:
+      OUT_DIR/<job_id>/<subdir>/frame_000000.jpg
     """
-    x = float(np.clip(getattr(pt_norm, 'x', np.nan), 0.0, 1.0))
-    y = float(np.clip(getattr(pt_norm, 'y', np.nan), 0.0, 1.0))
-    if not np.isfinite(x): x = 0.0
-    if not np.isfinite(y): y = 0.0
-    return np.array([x * w, y * h], dtype=float)
+    return os.path.join(out_dir, subdir, f"frame_{idx:06d}{IMG_EXT}")
 
 
-# ------------------ FASE 1: EXTRAIR FRAMES ------------------
-def extract_frames(video_path=VIDEO_PATH):
+# ------------------ FASE 1: LEITURA DO VÍDEO (STREAMING) ------------------
+def probe_video(video_path=VIDEO_PATH):
     """
-    1) Transforma o vídeo em frames:
-       - Salva arquivos na pasta FRAMES_DIR
+    1) Lê apenas os metadados do vídeo (sem decodificar/salvar frames):
        - Lê FPS; se não vier válido do contêiner, usa 30.0 como fallback.
-       - Retorna meta: {"fps": float, "frame_count": int, "frames_ext": str}
+       - Usa a contagem de frames informada pelo contêiner; se vier vazia, conta com grab().
+       - Testa o seek em 3 pontos do vídeo (seek_is_exact): seek_exact=False em vídeo de taxa variável.
+       - Retorna meta: {"fps": float, "frame_count": int, "width": int, "height": int, "video_path": str,
+         "seek_exact": bool}
     """
-    reset_frames_dir()  # garante pasta limpa
-
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         # nao achou o arquivbo
@@ -167,1022 +478,1986 @@ def extract_frames(video_path=VIDEO_PATH):
     except Exception:
         fps = 30.0
 
-    frame_count_reported = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.get(cv2.CAP_PROP_FRAME_COUNT) else 0
-    print(f"[EXTRACT] FPS={fps:.3f} | frames informados={frame_count_reported} ")
-
-    # Loop de leitura frame a frame do video
-    i = 0
-    while True:
-        ret, frame = cap.read()   # ret=False quando acaba o vídeo ou ocorre falha de leitura
-        if not ret:
-            break
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.get(cv2.CAP_PROP_FRAME_COUNT) else 0
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
 
-        out_path = frame_path(i)
-        if FRAMES_EXT == '.jpg':
-            cv2.imwrite(out_path, frame, [cv2.IMWRITE_JPEG_QUALITY, FRAMES_JPEG_QUALITY])
-        else:
-            cv2.imwrite(out_path, frame)
+    # contêiner sem contagem: percorre o vídeo só com grab() (sem converter os frames)
+    if frame_count <= 0:
+        while cap.grab():
+            frame_count += 1
 
-        i += 1
-        if (i % 300) == 0: #extrair frames em batches
-            print(f"[EXTRACT] {i} frames extraídos...")
+    # seek por frame confiável (taxa constante)? Confere em 3 pontos do vídeo; se não, os chunks chegam
+    # no seu início avançando desde o frame 0
+    seek_exact = all(seek_is_exact(cap, frame_count * k // 4)[0] for k in (1, 2, 3) if frame_count * k // 4 > 0)
 
     cap.release()
-    print(f"[EXTRACT] Concluído. {i} frames salvos em: {FRAMES_DIR}")
+    logger.info(f"[PROBE] FPS={fps:.3f} | frames={frame_count} | {width}x{height}"
+                f"{'' if seek_exact else ' | taxa variável (seek por grab)'}")
 
-    return {"fps": fps, "frame_count": i, "frames_ext": FRAMES_EXT}
+    return {"fps": fps, "frame_count": frame_count, "width": width, "height": height, "video_path": video_path,
+            "seek_exact": seek_exact}
 
+def seek_is_exact(cap, target):
+    """
+    Seek (CAP_PROP_POS_FRAMES) para 'target' e confere se dá para confiar nele: a posição reportada
+    bate e o último frame decodificado (target - 1) está no tempo (target - 1) / fps (em taxa constante
+    o desvio é zero; tolerância de 0.1 frame para o arredondamento do timebase). Em vídeo de taxa
+    variável (comum em celular) o backend converte frame <-> tempo pela taxa média, e o seek a partir
+    de um keyframe depois da irregularidade cai frames antes ou depois do pedido, reportando a posição certa.
+    Retorna (exato, posição reportada).
+    """
+    ok = cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+    pos = int(round(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    on_grid = not fps or abs(cap.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000.0 - (target - 1)) <= 0.1
+    return bool(ok) and pos == target and on_grid, pos
 
-# ------------------ LÓGICA DE ÂNGULO DAS COSTAS ------------------
-def calculate_back_posture(a, b, c):
+def seek_video(cap, target, seek_exact=True):
     """
-    Calcula o ângulo entre
-    a: ombro direito
-    b: quadril direito
-    c: joelho direito
-    - Usa atan2 para obter ângulo orientado e normaliza o resultado para [0, 180].
+    Posiciona o VideoCapture para que o próximo read() devolva o frame 'target'.
+    - O backend (FFmpeg) volta ao keyframe anterior ao ponto pedido e decodifica até o frame
+      pedido, então em vídeo de taxa constante o seek direto já é exato (conferido em mp4v, XVID,
+      MJPG, VP8 e H.264/HEVC com B-frames, GOP aberto, .mov e mp4 fragmentado).
+    - Alvo depois do fim real do vídeo (contêiner com contagem superestimada): a posição fica no
+      fim e não há frame para ler; retorna False sem decodificar nada.
+    - Se o seek não é confiável (seek_is_exact: taxa de frames variável, contêiner sem índice),
+      volta para o início e avança só com grab(), que é sempre exato.
+    - seek_exact=False (probe_video já viu que o vídeo tem taxa variável): nem tenta o seek, avança
+      com grab() desde a posição atual, que deve ser o início (VideoCapture recém-aberto).
+    Retorna False se o vídeo acabar antes de 'target'.
     """
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
+    if target <= 0:
+        return True
+    if not seek_exact:
+        return all(cap.grab() for _ in range(target))
+
+    exact, pos = seek_is_exact(cap, target)
+    if exact:
+        return True
+    if pos < target and not cap.grab():
+        return False  # parou no fim do vídeo: não existe o frame 'target'
+
+    logger.debug(f"[SEEK] seek impreciso para o frame {target}; avançando desde o início")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    pos = 0
+    while pos < target:
+        if not cap.grab():
+            return False
+        pos += 1
+    return True
+
+def iter_video_frames(video_path, start=0, end=None, frames_dir=None, step=1, seek_exact=True):
+    """
+    Gera (indice, frame BGR) direto do cv2.VideoCapture, sem arquivos intermediários.
+    - start/end: intervalo [start, end) de frames; end=None lê até o fim do vídeo.
+    - step > 1: só os frames com indice % step == 0 são lidos; os demais só avançam o vídeo
+      (grab, sem converter a imagem) e saem como (indice, None).
+    - Chega em 'start' com seek por keyframe (seek_video), sem decodificar o vídeo desde o início;
+      com seek_exact=False (vídeo de taxa variável, ver probe_video) avança com grab() desde o frame 0.
+    - frames_dir (debug, SAVE_RAW_FRAMES=True): cada frame lido também é salvo nessa pasta.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"[ERRO] Não foi possível abrir: {video_path}")
+
+    try:
+        if not seek_video(cap, start, seek_exact):
+            return
+        i = start
+
+        while end is None or i < end:
+            if i % step:
+                if not cap.grab():
+                    break
+                yield i, None
+                i += 1
+                continue
+
+            ret, frame = cap.read()   # ret=False quando acaba o vídeo ou ocorre falha de leitura
+            if not ret:
+                break
 
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(np.degrees(radians))
-    if angle > 180.0:
-        angle = 360 - angle
-    return float(angle)
+            if frames_dir:
+                out_path = frame_path(frames_dir, i)
+                if FRAMES_EXT == '.jpg':
+                    cv2.imwrite(out_path, frame, [cv2.IMWRITE_JPEG_QUALITY, FRAMES_JPEG_QUALITY])
+                else:
+                    cv2.imwrite(out_path, frame)
 
+            yield i, frame
+            i += 1
+    finally:
+        cap.release()
 
-# ------------------ FASE 2: PROCESSAR (SEQUENCIAL/VIDEOS CURTOS) ------------------ 
-def process_frames_sequential(meta):
+def read_video_frame(video_path, idx, seek_exact=True):
     """
-    2) Analisa frames em ordem (single-process), ou seja, roda o video em tempo real, bom até 20 segundos
-    3) Salva frames em subpastas conforme a análise (postura ruim, overstride, baixa visibilidade).
+    Lê um único frame (BGR) do vídeo, ou None se ele não existir (seek_exact: ver iter_video_frames).
     """
-    ensure_dirs()  
+    for _, frame in iter_video_frames(video_path, idx, idx + 1, seek_exact=seek_exact):
+        return frame
+    return None
 
-    fps = meta['fps']
-    window_size = max(1, int(round(fps * WINDOW_SECONDS)))        # janela em num de frames
-    cooldown_frames = max(1, int(round(fps * COOLDOWN_SECONDS)))  # cooldown em num de frames
-    TOL = 1e-3                         # variavel de tolerancia pra evitar problemas com casas decimais
-    detection_cooldown = 0             # contador de cooldown (0 = pronto para detectar)
-    rightHeel_history = []             # valores historicos de y do calcanhar
-    
-    # Lists to store frame-level data
-    frame_data = {
-        'posture_angles': [],      # Store all angles for each frame
-        'overstride_frames': [],   # Store overstride detection for each frame
-        'success_frames': {
-            'posture': [],
-            'overstride': []
-        }
-    }
+def read_video_frames(video_path, indices, seek_exact=True):
+    """
+    Lê alguns frames (BGR) do vídeo com um único VideoCapture, em ordem: seek_video até cada um
+    (com seek_exact=False só avança com grab(), sem voltar ao início a cada frame).
+    Retorna {indice: frame}; frames que não existem ficam de fora.
+    """
+    frames = {}
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"[ERRO] Não foi possível abrir: {video_path}")
 
-    # instancia do mediapipe
-    with mp_pose.Pose(
+    try:
+        pos = 0  # próximo frame que o read() devolve
+        for idx in sorted(set(indices)):
+            if idx != pos:
+                if seek_exact:
+                    ok = seek_video(cap, idx)
+                else:
+                    ok = all(cap.grab() for _ in range(idx - pos))
+                if not ok:
+                    break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames[idx] = frame
+            pos = idx + 1
+    finally:
+        cap.release()
+    return frames
+
+
+# ------------------ MEDIAPIPE ------------------
+# Índices (lado direito) dos landmarks usados na análise
+SHOULDER_IDX = mp_pose.PoseLandmark.RIGHT_SHOULDER.value
+HIP_IDX      = mp_pose.PoseLandmark.RIGHT_HIP.value
+KNEE_IDX     = mp_pose.PoseLandmark.RIGHT_KNEE.value
+HEEL_IDX     = mp_pose.PoseLandmark.RIGHT_HEEL.value
+FOOT_IDX     = mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value
+NUM_LANDMARKS = len(mp_pose.PoseLandmark)   # 33 pontos do BlazePose
+
+def create_pose():
+    """
+    Instancia o Pose do MediaPipe em modo vídeo (tracking entre frames) com as configurações globais.
+    """
+    return mp_pose.Pose(
         static_image_mode=False,
         model_complexity=MODEL_COMPLEXITY,
         smooth_landmarks=True,
         enable_segmentation=False,
         min_detection_confidence=MIN_DET_CONF,
         min_tracking_confidence=MIN_TRK_CONF
-    ) as pose:
+    )
 
-        i = 0
-        while True:
-            img_path = frame_path(i)
-            if not os.path.exists(img_path):
-                break  # fim dos frames
+def landmarks_to_array(pose_landmarks):
+    """
+    Converte os landmarks de um frame em um array (33, 4) float32 com [x, y, z, visibility].
+    Sem detecção, devolve tudo NaN (o frame conta como baixa visibilidade na análise).
+    """
+    arr = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    if pose_landmarks:
+        arr[:] = [(p.x, p.y, p.z, p.visibility) for p in pose_landmarks.landmark]
+    return arr
 
-            image = cv2.imread(img_path)
-            if image is None:
-                i += 1
-                continue  # frame corrompido/impossível de ler
-
-            #filtro para o mediapipe
-            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            rgb.flags.writeable = False
-            results = pose.process(rgb)
-            rgb.flags.writeable = True
-            image = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-
-            h, w, _ = image.shape
-
-            back_angle = None
-            lowest_heel_y = None
-            right_heel_y = None
-            visibility_issue = False
-
-            if results.pose_landmarks:
-                lm = results.pose_landmarks.landmark
-
-                # posicoes dos pontos no frame
-                shoulder_idx = mp_pose.PoseLandmark.RIGHT_SHOULDER.value
-                hip_idx      = mp_pose.PoseLandmark.RIGHT_HIP.value
-                knee_idx     = mp_pose.PoseLandmark.RIGHT_KNEE.value
-                heel_idx     = mp_pose.PoseLandmark.RIGHT_HEEL.value
-                foot_idx     = mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value
-
-                sh_lm = lm[shoulder_idx]; hip_lm = lm[hip_idx]; knee_lm = lm[knee_idx]
-                heel_lm = lm[heel_idx];    fidx_lm = lm[foot_idx]
-
-                # --------- Ângulo das costas (só salva quando ruim) ---------
-                if is_visible(sh_lm) and is_visible(hip_lm) and is_visible(knee_lm):
-                    shoulder = [sh_lm.x, sh_lm.y]
-                    hip      = [hip_lm.x, hip_lm.y]
-                    knee     = [knee_lm.x, knee_lm.y]
-                    angle = calculate_back_posture(shoulder, hip, knee)
-                    back_angle = angle
-                    
-                    # Store angle for this frame
-                    frame_data['posture_angles'].append({
-                        'frame_number': i,
-                        'angle': round(angle, 2)
-                    })
-
-                    if angle <= BACK_ANGLE_BAD_THRESH:
-                        # desenha os landmarks em vermelho e salva na pasta 'postura_incorreta'
-                        mp_drawing.draw_landmarks(
-                            image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
-                            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
-                        )
-                        print(f"[POSTURA] frame={i} angle={angle:.1f}° (ruim)")
-                        save_img(annotated_path('postura_incorreta', i), image)
-                    else:
-                        # Store as a success frame
-                        if len(frame_data['success_frames']['posture']) == 0:
-                            # Save first success frame
-                            success_dir = os.path.join(OUT_DIR, 'success_frames')
-                            os.makedirs(success_dir, exist_ok=True)
-                            save_img(os.path.join(success_dir, f'posture_success_{i:06d}.jpg'), image)
-                            frame_data['success_frames']['posture'].append(i)
-                else:
-                    # se algum dos três (ombro/quadril/joelho) está com vis < MIN_VIS, não confiamos no angulo
-                    visibility_issue = True
-
-                # --------- ponto mais baixo do calcanhar ---------
-                if is_visible(heel_lm) and is_visible(fidx_lm) and is_visible(knee_lm):
-                    right_heel_y = float(heel_lm.y)  # altura do pe
-                    rightHeel_history.append(right_heel_y) # guardo a altura
-                    if len(rightHeel_history) > window_size: # so guarda se ja tiver passado a janela de tempo
-                        rightHeel_history.pop(0)  # mantemos apenas a janela
-
-                    if len(rightHeel_history) == window_size:
-                        # maior y na janela => calcanhar mais baixo 
-                        lowest_heel_y = float(np.max(rightHeel_history))
-
-                        # Dispara no pico e quando cooldown chegou a zero
-                        if detection_cooldown == 0 and right_heel_y >= lowest_heel_y - TOL:
-                            # converte pontos para pixels
-                            heel_px = to_pixel(heel_lm, w, h)
-                            fidx_px = to_pixel(fidx_lm, w, h)
-                            knee_px = to_pixel(knee_lm,  w, h)
-
-                            # Ponto de contato com o solo: 2/8 do pé (calcanhar)
-                            contact_px = heel_px + (fidx_px - heel_px) * CONTACT_RATIO
-
-                            # -------------- CALCULO DO OVERSTRIDE -----------------------
-                            vertical = np.array([0.0, -1.0])  # y para cima é negativo em coordenadas de imagem
-                            knee_vec = knee_px - contact_px
-                            knee_norm = np.linalg.norm(knee_vec)
-                            if knee_norm > 1e-6:
-                                cos_val = float(np.clip(np.dot(vertical, knee_vec) / knee_norm, -1.0, 1.0))
-                                angle_deg = float(np.degrees(np.arccos(cos_val)))
-                            else:
-                                # para nao dividir nada por 0
-                                angle_deg = 0.0
-                            
-                            # Store overstride data for this frame with angle
-                            frame_data['overstride_frames'].append({
-                                'frame_number': i,
-                                'overstride': angle_deg > 8.0,
-                                'angle': round(angle_deg, 2)
-                            })
-                            
-                            # Don't save frames during processing - will save only best/worst in collection phase
-                            if angle_deg > 8.0:
-                                print(f"[HEEL] frame={i} lowest_y={lowest_heel_y:.4f} angle={angle_deg:.2f}° (ratio=2/8) - ERROR")
-                            else:
-                                print(f"[HEEL] frame={i} lowest_y={lowest_heel_y:.4f} angle={angle_deg:.2f}° (ratio=2/8) - SUCCESS")
-
-                            # inicia cooldown para não duplicar detecções do mesmo pico
-                            detection_cooldown = cooldown_frames
-                        
-
-                # decrementa cooldown ao fim do frame
-                if detection_cooldown > 0:
-                    detection_cooldown -= 1
-            else:
-                # nenhum landmark detectado neste frame
-                visibility_issue = True
-
-            # Salva frames de baixa visibilidade caso configurado
-            if visibility_issue and SAVE_LOW_VIS_FRAMES:
-                cv2.putText(image, "VISIBILIDADE DIREITA INSUFICIENTE", (10, h-20),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2, cv2.LINE_AA)
-                save_img(annotated_path('baixa_visibilidade', i), image)
-
-            # salvar os frames do video
-            if SAVE_ALL_FRAMES:
-                save_img(annotated_path('all', i), image)
-
-            # debug log do frame
-            print(f"[FRAME {i:06d}] back_angle={(f'{back_angle:.2f}°' if back_angle is not None else 'None')} "
-                  f"| heel_y={(f'{right_heel_y:.4f}' if right_heel_y is not None else 'None')} "
-                  f"| lowest_y={(f'{lowest_heel_y:.4f}' if lowest_heel_y is not None else 'None')}")
-            i += 1
-    
-    # Save frame-level data to JSON file
-    frame_data_path = os.path.join(OUT_DIR, 'frame_data.json')
-    with open(frame_data_path, 'w') as f:
-        json.dump(frame_data, f, indent=2)
-    print(f"[DATA] Frame-level data saved to: {frame_data_path}")
+def person_box(row, width, height):
+    """
+    Caixa justa (x0, y0, x1, y1), em pixels (float) do frame original, dos landmarks (33, 4)
+    com visibility > MIN_VIS; None sem detecção.
+    """
+    with np.errstate(invalid='ignore'):
+        visible = row[:, 3] > MIN_VIS
+    if not visible.any():
+        return None
+    xs = np.clip(row[visible, 0], 0.0, 1.0) * width
+    ys = np.clip(row[visible, 1], 0.0, 1.0) * height
+    return xs.min(), ys.min(), xs.max(), ys.max()
+
+def person_roi(row, width, height, padding=ROI_PADDING):
+    """
+    Caixa da pessoa (x0, y0, x1, y1), em pixels do frame original, a partir dos landmarks (33, 4)
+    do frame anterior com visibility > MIN_VIS: quadrada, centrada na pessoa, com o maior lado dela
+    mais 'padding' de margem de cada lado (assim a passada, que alarga a caixa, cabe sem refazer o recorte).
+    Retorna None sem detecção ou se a caixa for menor que ROI_MIN_SIZE (usa o frame inteiro).
+    """
+    box = person_box(row, width, height)
+    if box is None:
+        return None
+    bx0, by0, bx1, by1 = box
+    half = (0.5 + padding) * max(bx1 - bx0, by1 - by0)
+    cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+    x0 = max(0, int(cx - half))
+    y0 = max(0, int(cy - half))
+    x1 = min(width, int(np.ceil(cx + half)))
+    y1 = min(height, int(np.ceil(cy + half)))
+    if x1 - x0 < ROI_MIN_SIZE or y1 - y0 < ROI_MIN_SIZE:
+        return None
+    return x0, y0, x1, y1
+
+def track_roi(roi, row, width, height):
+    """
+    Recorte do próximo frame a partir do atual ('roi', None = frame inteiro) e dos landmarks do frame.
+    O Pose em modo vídeo suaviza e rastreia os landmarks nas coordenadas da imagem que recebe; se o
+    recorte mudasse a cada frame, ele misturaria coordenadas de recortes diferentes. Por isso o
+    recorte fica parado enquanto a pessoa cabe nele com folga (histerese) e só é refeito
+    (person_roi) quando ela chega a menos de ROI_EDGE_MARGIN de uma borda que não é a do frame
+    ou ocupa menos de ROI_REFIT_RATIO do recorte. Quando ele muda, quem chama zera o Pose
+    (reset_pose_on_new_region).
+    """
+    box = person_box(row, width, height)
+    if box is None:
+        return None
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        bx0, by0, bx1, by1 = box
+        mx, my = ROI_EDGE_MARGIN * (x1 - x0), ROI_EDGE_MARGIN * (y1 - y0)
+        inside = ((x0 == 0 or bx0 >= x0 + mx) and (y0 == 0 or by0 >= y0 + my)
+                  and (x1 == width or bx1 <= x1 - mx) and (y1 == height or by1 <= y1 - my))
+        fits = max((bx1 - bx0) / (x1 - x0), (by1 - by0) / (y1 - y0)) >= ROI_REFIT_RATIO
+        if inside and fits:
+            return roi
+    return person_roi(row, width, height)
+
+def roi_region(roi, width, height):
+    """
+    Região (x0, y0, largura, altura) que o Pose recebe para o recorte 'roi' (None = frame inteiro).
+    """
+    x0, y0, x1, y1 = roi if roi is not None else (0, 0, width, height)
+    return x0, y0, x1 - x0, y1 - y0
+
+def prepare_pose_input(image, roi=None, max_side=POSE_INPUT_MAX_SIDE):
+    """
+    Monta a entrada do Pose a partir do frame BGR original:
+    recorta na caixa 'roi' (se houver), reduz para no máximo 'max_side' px e converte para RGB.
+    O recorte/redução vêm antes da conversão de cor, que assim roda sobre menos pixels.
+    Retorna (rgb, (x0, y0, largura, altura)) da região usada, para mapear os landmarks de volta.
+    """
+    h, w = image.shape[:2]
+    x0, y0, crop_w, crop_h = roi_region(roi, w, h)
+    crop = image[y0:y0 + crop_h, x0:x0 + crop_w]
 
-    print(f"[OK] Análises salvas em: {os.path.abspath(OUT_DIR)}")
+    scale = max_side / max(crop_w, crop_h) if max_side else 1.0
+    if scale < 1.0:
+        size = (max(1, int(round(crop_w * scale))), max(1, int(round(crop_h * scale))))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
 
+    rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+    rgb.flags.writeable = False
+    return rgb, (x0, y0, crop_w, crop_h)
 
-# ------------------ FASE 2: PROCESSAR (MULTIPROCESS=TRUE/VIDEOS LONGOS) ------------------
-def split_indices(frame_count, chunk_len, window_size):
+def map_landmarks_to_frame(row, region, width, height):
+    """
+    Converte landmarks (33, 4) normalizados na região recortada para coordenadas normalizadas
+    do frame original (x, y e z, que o MediaPipe escala pela largura da imagem).
+    A redução de resolução não muda coordenadas normalizadas, então só o recorte importa.
+    """
+    x0, y0, crop_w, crop_h = region
+    if (x0, y0, crop_w, crop_h) == (0, 0, width, height):
+        return row
+    out = row.copy()
+    out[:, 0] = (row[:, 0] * crop_w + x0) / width
+    out[:, 1] = (row[:, 1] * crop_h + y0) / height
+    out[:, 2] = row[:, 2] * crop_w / width
+    return out
+
+def array_to_landmarks(arr):
+    """
+    Operação inversa de landmarks_to_array: monta o NormalizedLandmarkList usado pelo mp_drawing.
     """
-    Divide os frames em partes de tamanho = chunk_len.
-    Para cada parte, adiciona um prefixo de OVERLAP com (window_size - 1) frames,
-    que serve para "aquecer" o histórico local de calcanhar dentro do worker,
-    evitando perder o primeiro pico do chunk.
+    proto = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, v in arr:
+        proto.landmark.add(x=float(x), y=float(y), z=float(z), visibility=float(v))
+    return proto
 
+def draw_frame_annotation(image, pose_landmarks, subdir):
     """
-    parts = []
-    start = 0
-    while start < frame_count:
-        end = min(start + chunk_len, frame_count)
-        overlap_start = max(0, start - (window_size - 1))
-        parts.append((overlap_start, end, start))
-        start = end
-    return parts
+    Desenha no frame (BGR, in-place) a anotação de cada pasta de saída:
+      - postura_incorreta: landmarks em vermelho;
+      - baixa_visibilidade: aviso de visibilidade insuficiente;
+      - demais pastas: frame sem desenho.
+    """
+    h = image.shape[0]
+    if subdir == 'postura_incorreta' and pose_landmarks:
+        mp_drawing.draw_landmarks(
+            image, pose_landmarks, mp_pose.POSE_CONNECTIONS,
+            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
+            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
+        )
+    elif subdir == 'baixa_visibilidade':
+        cv2.putText(image, "VISIBILIDADE DIREITA INSUFICIENTE", (10, h-20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2, cv2.LINE_AA)
+    return image
+
+def draw_overstride_annotation(image, row):
+    """
+    Desenha no frame (BGR, in-place) a anotação do overstride a partir dos landmarks do frame:
+    ponto de contato (vermelho), vertical (azul), contato -> joelho (amarelo) e o ângulo.
+    Só desenha com calcanhar, ponta do pé e joelho visíveis.
+    """
+    h, w = image.shape[:2]
+    lm = row[None]
+    if not visibility_mask(lm, [HEEL_IDX, FOOT_IDX, KNEE_IDX])[0]:
+        return image
+    contact_px = batch_contact_points(lm, w, h)
+    knee_px = batch_to_pixel(lm, KNEE_IDX, w, h)[0]
+    angle = batch_knee_vertical_angles(lm, w, h, contact_px)[0]
+
+    cpt = (int(contact_px[0, 0]), int(contact_px[0, 1]))
+    cv2.circle(image, cpt, 8, (0, 0, 255), -1)
+    top_point = (cpt[0], max(0, cpt[1] - int(h * 0.85)))
+    cv2.line(image, cpt, top_point, (255, 0, 0), 2)
+    knee_pt = (int(knee_px[0]), int(knee_px[1]))
+    cv2.line(image, cpt, knee_pt, (0, 255, 255), 2)
+    cv2.putText(image, f"{angle:.0f} deg", (cpt[0], max(0, cpt[1] - 10)),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,255), 2, cv2.LINE_AA)
+    return image
+
+def render_frame_jpeg(video_path, landmarks, subdir, idx, image=None, seek_exact=True):
+    """
+    Desenha a anotação de 'subdir' no frame 'idx' a partir dos landmarks guardados e devolve o
+    JPEG codificado (bytes), ou None se o frame não pôde ser lido.
+    - image: o frame já em memória (ex.: lido por read_video_frames); None = lê só esse frame do vídeo
+      (seek_exact: ver iter_video_frames).
+    - 'min_heel' desenha o overstride (draw_overstride_annotation).
+    """
+    if image is None:
+        image = read_video_frame(video_path, idx, seek_exact)
+    if image is None:
+        return None
+
+    row = landmarks[idx] if landmarks is not None and 0 <= idx < len(landmarks) else None
+    detected = row is not None and not np.isnan(row[0, 0])
+    if subdir == 'min_heel':
+        if detected:
+            draw_overstride_annotation(image, row)
+    else:
+        draw_frame_annotation(image, array_to_landmarks(row) if detected else None, subdir)
+
+    t0 = time.perf_counter()
+    ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    timings = {}
+    observe_stage(timings, 'image_encode', time.perf_counter() - t0)
+    record_stage_timings(timings)
+    return buf.tobytes() if ok else None
 
-def worker_chunk(args):
+def annotated_frame_path(meta, subdir, idx, filename=None):
     """
-    Processa um único chunk em um processo separado.
-    - Reconstrói o objeto Pose para este processo.
-    - Processa [ini_with_overlap .. end_idx), gerando saída apenas para i >= effective_start
-      (antes disso é warm-up para encher a janela de histórico).
-    - Mantém seu próprio histórico de calcanhar e cooldown.
+    Caminho da imagem anotada de um frame em OUT_DIR/<job_id>/<subdir>/ (filename: nome fixo no lugar de frame_<idx>).
     """
-    ini_with_overlap, end_idx, effective_start, meta = args
+    out_dir = meta['out_dir']
+    return os.path.join(out_dir, subdir, filename) if filename else annotated_path(out_dir, subdir, idx)
 
-    fps = meta['fps']
-    window_size = max(1, int(round(fps * WINDOW_SECONDS)))
-    cooldown_frames = max(1, int(round(fps * COOLDOWN_SECONDS)))
-    TOL = 1e-3
-    detection_cooldown = 0
-    rightHeel_history = []
+def render_annotated_frame(meta, landmarks, subdir, idx, filename=None, image=None):
+    """
+    Garante que a imagem anotada de um frame exista em OUT_DIR/<job_id>/<subdir>/.
+    Se ela não foi salva durante a inferência (o padrão: só os frames referenciados na resposta
+    viram arquivo), renderiza a partir dos landmarks guardados e do frame 'image' (já lido, é
+    desenhado por cima) ou, sem ele, do frame lido do vídeo.
+    Retorna o caminho do arquivo, ou None se o frame não pôde ser lido.
+    """
+    path = annotated_frame_path(meta, subdir, idx, filename)
+    if os.path.exists(path):
+        return path
 
-    local_logs = []  # strings de log para retornar ao processo pai (apenas informativo)
-    
-    # Local frame data for this chunk
-    local_frame_data = {
-        'posture_angles': [],
-        'overstride_frames': [],
-        'success_frames': {
-            'posture': [],
-            'overstride': []
-        }
-    }
+    jpeg = render_frame_jpeg(meta['video_path'], landmarks, subdir, idx, image, meta.get('seek_exact', True))
+    if jpeg is None:
+        return None
 
-    with mp_pose.Pose(
-        static_image_mode=False,
-        model_complexity=MODEL_COMPLEXITY,
-        smooth_landmarks=True,
-        enable_segmentation=False,
-        min_detection_confidence=MIN_DET_CONF,
-        min_tracking_confidence=MIN_TRK_CONF
-    ) as pose:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(jpeg)
+    return path
 
-        for i in range(ini_with_overlap, end_idx):
-            path = frame_path(i)
-            if not os.path.exists(path):
-                continue
+# Cache LRU dos JPEGs renderizados sob demanda (chave: job, frame, anotação), limitado a RENDER_CACHE_MAX_BYTES.
+RENDER_CACHE = OrderedDict()
+RENDER_CACHE_BYTES = 0
+RENDER_CACHE_LOCK = threading.Lock()
 
-            image = cv2.imread(path)
-            if image is None:
-                continue
+def render_cache_get(key):
+    """
+    JPEG em cache para 'key' (e marca como usado recentemente), ou None.
+    """
+    with RENDER_CACHE_LOCK:
+        jpeg = RENDER_CACHE.get(key)
+        if jpeg is not None:
+            RENDER_CACHE.move_to_end(key)
+        return jpeg
+
+def render_cache_put(key, jpeg):
+    """
+    Guarda o JPEG no cache, removendo os menos usados até caber em RENDER_CACHE_MAX_BYTES.
+    """
+    global RENDER_CACHE_BYTES
+    if len(jpeg) > RENDER_CACHE_MAX_BYTES:
+        return
+    with RENDER_CACHE_LOCK:
+        old = RENDER_CACHE.pop(key, None)
+        if old is not None:
+            RENDER_CACHE_BYTES -= len(old)
+        RENDER_CACHE[key] = jpeg
+        RENDER_CACHE_BYTES += len(jpeg)
+        while RENDER_CACHE_BYTES > RENDER_CACHE_MAX_BYTES:
+            _, evicted = RENDER_CACHE.popitem(last=False)
+            RENDER_CACHE_BYTES -= len(evicted)
+
+def render_cache_drop_job(job_id):
+    """
+    Remove do cache todas as imagens de um job (job expirado).
+    """
+    global RENDER_CACHE_BYTES
+    with RENDER_CACHE_LOCK:
+        for key in [k for k in RENDER_CACHE if k[0] == job_id]:
+            RENDER_CACHE_BYTES -= len(RENDER_CACHE.pop(key))
 
-            # instancia MediaPipe 
-            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            rgb.flags.writeable = False
-            results = pose.process(rgb)
-            rgb.flags.writeable = True
-            image = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-            h, w, _ = image.shape
-
-            back_angle = None
-            lowest_heel_y = None
-            right_heel_y = None
-            visibility_issue = False
-
-            if results.pose_landmarks:
-                lm = results.pose_landmarks.landmark
-
-                shoulder_idx = mp_pose.PoseLandmark.RIGHT_SHOULDER.value
-                hip_idx      = mp_pose.PoseLandmark.RIGHT_HIP.value
-                knee_idx     = mp_pose.PoseLandmark.RIGHT_KNEE.value
-                heel_idx     = mp_pose.PoseLandmark.RIGHT_HEEL.value
-                foot_idx     = mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value
-
-                sh_lm = lm[shoulder_idx]; hip_lm = lm[hip_idx]; knee_lm = lm[knee_idx]
-                heel_lm = lm[heel_idx];    fidx_lm = lm[foot_idx]
-
-                # --------- Ângulo das costas ---------
-                if is_visible(sh_lm) and is_visible(hip_lm) and is_visible(knee_lm):
-                    shoulder = [sh_lm.x, sh_lm.y]
-                    hip      = [hip_lm.x, hip_lm.y]
-                    knee     = [knee_lm.x, knee_lm.y]
-                    angle = calculate_back_posture(shoulder, hip, knee)
-                    back_angle = angle
-                    
-                    # Store angle for this frame
-                    if i >= effective_start:
-                        local_frame_data['posture_angles'].append({
-                            'frame_number': i,
-                            'angle': round(angle, 2)
-                        })
-
-                    if angle <= BACK_ANGLE_BAD_THRESH and i >= effective_start:
-                        mp_drawing.draw_landmarks(
-                            image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
-                            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
-                        )
-                        local_logs.append(f"[POSTURA] frame={i} angle={round(angle,1)}° (ruim)")
-                        save_img(annotated_path('postura_incorreta', i), image)
-                    elif i >= effective_start and len(local_frame_data['success_frames']['posture']) == 0:
-                        # Store as a success frame
-                        success_dir = os.path.join(OUT_DIR, 'success_frames')
-                        os.makedirs(success_dir, exist_ok=True)
-                        save_img(os.path.join(success_dir, f'posture_success_{i:06d}.jpg'), image)
-                        local_frame_data['success_frames']['posture'].append(i)
-                else:
-                    visibility_issue = True
-
-                # --------- Janela local do calcanhar (no chunk) ---------
-                if is_visible(heel_lm) and is_visible(fidx_lm) and is_visible(knee_lm):
-                    right_heel_y = float(heel_lm.y)
-                    rightHeel_history.append(right_heel_y)
-                    if len(rightHeel_history) > window_size:
-                        rightHeel_history.pop(0)
-
-                    if len(rightHeel_history) == window_size:
-                        lowest_heel_y = float(np.max(rightHeel_history))
-                        if detection_cooldown == 0 and right_heel_y >= lowest_heel_y - TOL:
-                            heel_px = to_pixel(heel_lm, w, h)
-                            fidx_px = to_pixel(fidx_lm, w, h)
-                            knee_px = to_pixel(knee_lm, w, h)
-
-                            # ponto de contato 2/8 entre heel e foot_index
-                            contact_px = heel_px + (fidx_px - heel_px) * CONTACT_RATIO
-
-                            vertical = np.array([0.0, -1.0])
-                            knee_vec = knee_px - contact_px
-                            knee_norm = np.linalg.norm(knee_vec)
-                            if knee_norm > 1e-6:
-                                cos_val = float(np.clip(np.dot(vertical, knee_vec) / knee_norm, -1.0, 1.0))
-                                angle_deg = float(np.degrees(np.arccos(cos_val)))
-                            else:
-                                angle_deg = 0.0
-                            
-                            # Store overstride data for this frame with angle
-                            if i >= effective_start:
-                                local_frame_data['overstride_frames'].append({
-                                    'frame_number': i,
-                                    'overstride': angle_deg > 8.0,
-                                    'angle': round(angle_deg, 2)
-                                })
-
-                            # Don't save frames during processing - will save only best/worst in collection phase
-                            if i >= effective_start:
-                                if angle_deg > 8.0:
-                                    local_logs.append(f"[HEEL] frame={i} lowest_y={lowest_heel_y:.4f} angle={angle_deg:.2f}° (ratio=2/8) - ERROR")
-                                else:
-                                    local_logs.append(f"[HEEL] frame={i} lowest_y={lowest_heel_y:.4f} angle={angle_deg:.2f}° (ratio=2/8) - SUCCESS")
-
-                            detection_cooldown = cooldown_frames
-                        else:
-                            # Not a peak overstride frame
-                            if i >= effective_start:
-                                local_frame_data['overstride_frames'].append({
-                                    'frame_number': i,
-                                    'overstride': False,
-                                    'angle': None
-                                })
-
-                if detection_cooldown > 0:
-                    detection_cooldown -= 1
-            else:
-                visibility_issue = True
 
-            # baixa visibilidade (opcional)
-            if visibility_issue and i >= effective_start and SAVE_LOW_VIS_FRAMES:
-                cv2.putText(image, "VISIBILIDADE DIREITA INSUFICIENTE", (10, h-20),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2, cv2.LINE_AA)
-                save_img(annotated_path('baixa_visibilidade', i), image)
+# ------------------ LÓGICA DE ÂNGULO DAS COSTAS ------------------
+def frame_back_angle(row):
+    """
+    Ângulo das costas de um frame a partir do array (33, 4) de landmarks.
+    Retorna None se ombro/quadril/joelho não atingem MIN_VIS (ou se não houve detecção).
+    """
+    angle = batch_back_angles(row[np.newaxis])[0]
+    return None if np.isnan(angle) else float(angle)
 
-            # opcional: salvar todos os frames
-            if SAVE_ALL_FRAMES and i >= effective_start:
-                save_img(annotated_path('all', i), image)
 
-            # logs do chunk
-            if i >= effective_start:
-                local_logs.append(
-                    f"[FRAME {i:06d}] back_angle={(f'{back_angle:.2f}°' if back_angle is not None else 'None')} "
-                    f"| heel_y={(f'{right_heel_y:.4f}' if right_heel_y is not None else 'None')} "
-                    f"| lowest_y={(f'{lowest_heel_y:.4f}' if lowest_heel_y is not None else 'None')}"
-                )
+# ------------------ MÉTRICAS EM LOTE (VETORIZADAS) ------------------
+# Ângulo das costas, conversão para pixels e overstride calculados sobre o array (n, 33, 4)
+# inteiro de uma vez: o loop por frame fica só com a coleta dos landmarks e a máquina de estados do calcanhar.
+# Frames sem detecção (NaN) saem com visibilidade False e ângulo NaN.
+def visibility_mask(landmarks, indices, thr=MIN_VIS):
+    """
+    (n,) bool: True nos frames em que todos os landmarks 'indices' têm visibility > thr.
+    """
+    with np.errstate(invalid='ignore'):
+        return np.all(landmarks[:, indices, 3] > thr, axis=1)
+
+def batch_back_angles(landmarks):
+    """
+    (n,) float64: ângulo ombro-quadril-joelho de cada frame, normalizado para [0, 180]
+    (NaN quando ombro/quadril/joelho não atingem MIN_VIS).
+    """
+    a = landmarks[:, SHOULDER_IDX, :2].astype(float)
+    b = landmarks[:, HIP_IDX, :2].astype(float)
+    c = landmarks[:, KNEE_IDX, :2].astype(float)
+
+    radians = np.arctan2(c[:, 1] - b[:, 1], c[:, 0] - b[:, 0]) - np.arctan2(a[:, 1] - b[:, 1], a[:, 0] - b[:, 0])
+    angles = np.abs(np.degrees(radians))
+    angles = np.where(angles > 180.0, 360.0 - angles, angles)
+    angles[~visibility_mask(landmarks, [SHOULDER_IDX, HIP_IDX, KNEE_IDX])] = np.nan
+    return angles
+
+def batch_to_pixel(landmarks, idx, w, h):
+    """
+    (n, 2) float64: landmark 'idx' de cada frame em pixels (coordenadas normalizadas com clip em [0, 1], NaN -> 0).
+    """
+    pts = np.clip(landmarks[:, idx, :2].astype(float), 0.0, 1.0)
+    pts = np.where(np.isfinite(pts), pts, 0.0)
+    return pts * np.array([w, h], dtype=float)
+
+def batch_contact_points(landmarks, w, h):
+    """
+    (n, 2) float64: ponto de contato com o solo em pixels, a CONTACT_RATIO do calcanhar em direção à ponta do pé.
+    """
+    heel_px = batch_to_pixel(landmarks, HEEL_IDX, w, h)
+    fidx_px = batch_to_pixel(landmarks, FOOT_IDX, w, h)
+    return heel_px + (fidx_px - heel_px) * CONTACT_RATIO
 
-    # devolve as linhas de log e os dados do frame para o processo pai
+def batch_knee_vertical_angles(landmarks, w, h, contact_px=None):
+    """
+    (n,) float64: ângulo (graus) entre a vertical e o vetor contato -> joelho de cada frame.
+    0 quando joelho e contato coincidem (para nao dividir nada por 0).
+    """
+    if contact_px is None:
+        contact_px = batch_contact_points(landmarks, w, h)
+    knee_vec = batch_to_pixel(landmarks, KNEE_IDX, w, h) - contact_px
+    knee_norm = np.linalg.norm(knee_vec, axis=1)
+    valid = knee_norm > 1e-6
+
+    # vertical = (0, -1): y para cima é negativo em coordenadas de imagem
+    cos_val = np.zeros(len(knee_vec))
+    cos_val[valid] = np.clip(-knee_vec[valid, 1] / knee_norm[valid], -1.0, 1.0)
+    return np.where(valid, np.degrees(np.arccos(cos_val)), 0.0)
+
+def compute_batch_metrics(landmarks, w, h):
+    """
+    Calcula, para todos os frames de uma vez:
+      - detected: houve detecção do Pose;
+      - back_angle: ângulo das costas (NaN sem visibilidade);
+      - heel_visible: calcanhar, ponta do pé e joelho com visibility > MIN_VIS;
+      - contact_px: ponto de contato com o solo (pixels);
+      - knee_angle: ângulo joelho x vertical a partir do contato.
+    """
+    contact_px = batch_contact_points(landmarks, w, h)
     return {
-        'logs': "\n".join(local_logs),
-        'frame_data': local_frame_data
+        'detected': ~np.isnan(landmarks[:, 0, 0]),
+        'back_angle': batch_back_angles(landmarks),
+        'heel_visible': visibility_mask(landmarks, [HEEL_IDX, FOOT_IDX, KNEE_IDX]),
+        'contact_px': contact_px,
+        'knee_angle': batch_knee_vertical_angles(landmarks, w, h, contact_px),
     }
 
-def process_frames_multiproc(meta):
+
+# ------------------ FASE 2: INFERÊNCIA (SEQUENCIAL/VIDEOS CURTOS) ------------------ 
+def reset_pose_on_new_region(pose, roi, region, width, height):
     """
-    2) (alternativa) Orquestra o processamento em múltiplos processos (chunks):
-       - Divide o vídeo com overlap para aquecer a janela de cada worker (split_indices).
-       - Lança worker_chunk em paralelo (Pool.imap_unordered).
-    3) Cada worker salva suas imagens diretamente nas pastas de saída.
+    Zera o tracking e a suavização do Pose (reset) quando o próximo frame vai para uma região
+    diferente da usada agora ('region'): eles estão nas coordenadas normalizadas da imagem anterior.
+    Retorna True se zerou.
     """
-    ensure_dirs()  # garante que as pastas existem
+    if roi_region(roi, width, height) == region:
+        return False
+    pose.reset()
+    return True
 
-    frame_count = meta['frame_count']
-    fps = meta['fps']
-    window_size = max(1, int(round(fps * WINDOW_SECONDS)))
+def infer_pose_frame(pose, image, roi=None, timings=None):
+    """
+    Roda o Pose em um frame BGR. O MediaPipe recebe RGB (recortado em 'roi' e reduzido, ver
+    prepare_pose_input); se a pessoa saiu do recorte, tenta de novo com o frame inteiro.
+    Com 'timings', mede as etapas 'color_conversion' (recorte/redução/RGB) e 'pose_inference'.
+    Retorna (results do MediaPipe, landmarks (33, 4) nas coordenadas do frame, região usada).
+    """
+    h, w = image.shape[:2]
+    t0 = time.perf_counter()
+    rgb, region = prepare_pose_input(image, roi)
+    t1 = time.perf_counter()
+    results = pose.process(rgb)
+    t2 = time.perf_counter()
+    convert_s, infer_s = t1 - t0, t2 - t1
+    if roi is not None and not results.pose_landmarks:
+        rgb, region = prepare_pose_input(image)
+        t3 = time.perf_counter()
+        results = pose.process(rgb)
+        convert_s += t3 - t2
+        infer_s += time.perf_counter() - t3
+    row = map_landmarks_to_frame(landmarks_to_array(results.pose_landmarks), region, w, h)
+    if timings is not None:
+        observe_stage(timings, 'color_conversion', convert_s)
+        observe_stage(timings, 'pose_inference', infer_s)
+    return results, row, region
+
+def infer_frames_range(pose, meta, start, end, effective_start, progress_cb=None, step=1):
+    """
+    Decodifica [start, end) do vídeo e roda o Pose em cada frame (com step > 1, só nos frames
+    com indice % step == 0; os demais são apenas contados).
+    - A entrada do Pose é reduzida para POSE_INPUT_MAX_SIDE e, com ROI_CROP_ENABLED, recortada na
+      caixa da pessoa (track_roi: fixa até a pessoa chegar perto da borda); os landmarks voltam para
+      as coordenadas do frame original.
+    - Para i >= effective_start guarda os landmarks e salva as anotações que dependem só do
+      próprio frame: postura incorreta, baixa visibilidade e (opcional) todos os frames.
+    - Frames antes de effective_start só aquecem o tracking do Pose (overlap do chunk).
+    - As imagens são gravadas em background (save_img_async) e esperadas no fim do trecho.
+    - Nenhum pixel sai do trecho: as imagens da resposta são lidas de novo do vídeo depois da
+      análise (render_result_images), só os poucos frames escolhidos.
+    Retorna {'start', 'indices' (frames inferidos), 'landmarks' (n, 33, 4), 'frames_decoded',
+    'frames_read' (inclui o overlap), 'elapsed' (s), 'counters' (Counter),
+    'timings' (histogramas por etapa, ver observe_stage)}.
+    """
+    t0 = time.perf_counter()
+    out_dir = meta['out_dir']
+    w, h = meta['width'], meta['height']
+    rows = []
+    indices = []
+    frames_decoded = 0  # frames lidos a partir de effective_start (inferidos ou pulados)
+    frames_read = 0     # todos os frames lidos, incluindo o overlap
+    counters = Counter()  # contadores do trecho (vão para o processo pai no lugar de texto de log)
+    pending_writes = []   # imagens enviadas ao writer em background
+    roi = None       # caixa da pessoa no frame anterior (None = frame inteiro)
+    timings = {}     # histogramas por etapa (decode, color_conversion, pose_inference, metrics, image_encode)
+
+    t_decode = time.perf_counter()
+    for i, image in iter_video_frames(meta['video_path'], start, end, meta.get('frames_dir'), step,
+                                      meta.get('seek_exact', True)):
+        frames_read += 1
+        if image is None:
+            # frame pulado (step > 1)
+            if i >= effective_start:
+                frames_decoded += 1
+            t_decode = time.perf_counter()
+            continue
+        observe_stage(timings, 'decode', time.perf_counter() - t_decode)
+
+        results, row, region = infer_pose_frame(pose, image, roi, timings)
+        # chamadas reais do Pose, com o overlap/aquecimento e a segunda tentativa no frame inteiro
+        counters['pose_calls'] += 2 if roi is not None and region != roi_region(roi, w, h) else 1
+        if ROI_CROP_ENABLED:
+            roi = track_roi(roi, row, w, h)
+            if reset_pose_on_new_region(pose, roi, region, w, h):
+                counters['pose_resets'] += 1
+
+        if i < effective_start:
+            t_decode = time.perf_counter()
+            continue
+
+        t_metrics = time.perf_counter()
+        back_angle = frame_back_angle(row)
+        observe_stage(timings, 'metrics', time.perf_counter() - t_metrics)
+
+        rows.append(row)
+        indices.append(i)
+        frames_decoded += 1
+        counters['frames_inferred'] += 1
+        if not results.pose_landmarks:
+            counters['no_detection'] += 1
+
+        # --------- Ângulo das costas (só salva quando ruim e SAVE_POSTURE_FRAMES) ---------
+        if back_angle is not None and back_angle <= BACK_ANGLE_BAD_THRESH:
+            counters['posture_bad'] += 1
+            if SAVE_POSTURE_FRAMES or SAVE_ALL_FRAMES:
+                # desenha os landmarks em vermelho
+                # (com recorte, os landmarks do MediaPipe estão nas coordenadas do recorte: usa os mapeados)
+                pose_landmarks = results.pose_landmarks if region == (0, 0, w, h) else array_to_landmarks(row)
+                draw_frame_annotation(image, pose_landmarks, 'postura_incorreta')
+            if SAVE_POSTURE_FRAMES:
+                save_img_async(annotated_path(out_dir, 'postura_incorreta', i), image, pending_writes)
+                counters['images_written'] += 1
+            if TRACE_FRAMES:
+                logger.debug(f"[POSTURA] frame={i} angle={back_angle:.1f}° (ruim)")
+
+        # sem detecção ou ombro/quadril/joelho com vis < MIN_VIS: não confiamos no angulo
+        if back_angle is None and SAVE_LOW_VIS_FRAMES:
+            draw_frame_annotation(image, None, 'baixa_visibilidade')
+            save_img_async(annotated_path(out_dir, 'baixa_visibilidade', i), image, pending_writes)
+            counters['images_written'] += 1
+        if back_angle is None:
+            counters['low_visibility'] += 1
+
+        # opcional: salvar todos os frames
+        if SAVE_ALL_FRAMES:
+            save_img_async(annotated_path(out_dir, 'all', i), image, pending_writes)
+            counters['images_written'] += 1
+
+        if progress_cb and len(rows) % PROGRESS_EVERY_FRAMES == 0:
+            progress_cb(frames_decoded, meta['frame_count'])
+        t_decode = time.perf_counter()
+
+    # as imagens do trecho estão no disco antes de devolver o resultado (e antes da coleta dos resultados)
+    flush_image_writes(pending_writes, timings)
+
+    counters['frames_read'] = frames_read
+    counters['frames_skipped'] = frames_decoded - len(rows)
+    landmarks = np.stack(rows) if rows else np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32)
+    return {
+        'start': effective_start,
+        'indices': np.array(indices, dtype=np.int64),
+        'landmarks': landmarks,
+        'frames_decoded': frames_decoded,
+        'frames_read': frames_read,
+        'elapsed': time.perf_counter() - t0,
+        'counters': counters,
+        'timings': timings
+    }
 
-    # cria os chunks com overlap
-    parts = split_indices(frame_count, CHUNK_SIZE_FRAMES, window_size)
-    print(f"[PROC] Multiprocess ativo: {NUM_PROCS} processos | {len(parts)} chunks "
-          f"(chunk={CHUNK_SIZE_FRAMES}, overlap={window_size-1})")
+def log_inference_counters(counters):
+    """
+    Resumo da inferência (uma linha, INFO) a partir dos contadores somados dos trechos/workers.
+    """
+    logger.info(f"[INFER] frames lidos={counters['frames_read']} | inferidos={counters['frames_inferred']} "
+                f"| chamadas do Pose={counters['pose_calls']} "
+                f"| sem detecção={counters['no_detection']} | postura ruim={counters['posture_bad']} "
+                f"| baixa visibilidade={counters['low_visibility']} | imagens salvas={counters['images_written']}")
 
-    # empacota os argumentos para cada worker
-    args_list = [(a, b, c, meta) for (a, b, c) in parts]
-    
-    # Aggregate frame data from all workers
-    aggregated_frame_data = {
-        'posture_angles': [],
-        'overstride_frames': [],
-        'success_frames': {
-            'posture': [],
-            'overstride': []
+def frame_counters(landmarks, inferred):
+    """
+    Contadores por frame da inferência (inferidos, pulados, sem detecção, postura ruim, baixa visibilidade)
+    recalculados do array final de landmarks, com as mesmas regras de infer_frames_range.
+    """
+    rows = landmarks[inferred]
+    back_angles = batch_back_angles(rows)
+    with np.errstate(invalid='ignore'):
+        return {
+            'frames_inferred': len(rows),
+            'frames_skipped': len(landmarks) - len(rows),
+            'no_detection': int(np.isnan(rows[:, :, 0]).all(axis=1).sum()),
+            'posture_bad': int((back_angles <= BACK_ANGLE_BAD_THRESH).sum()),
+            'low_visibility': int(np.isnan(back_angles).sum()),
         }
-    }
 
-    # se for 1 chunk so
-    if NUM_PROCS == 1:
-        for args in args_list:
-            result = worker_chunk(args)
-            if result['logs']:
-                print(result['logs'])
-            # Aggregate data
-            aggregated_frame_data['posture_angles'].extend(result['frame_data']['posture_angles'])
-            aggregated_frame_data['overstride_frames'].extend(result['frame_data']['overstride_frames'])
-            aggregated_frame_data['success_frames']['posture'].extend(result['frame_data']['success_frames']['posture'])
-            aggregated_frame_data['success_frames']['overstride'].extend(result['frame_data']['success_frames']['overstride'])
-    else:
-        # paraleliza o processo com varios workers
-        with Pool(processes=NUM_PROCS) as pool:
-            for idx, result in enumerate(pool.imap_unordered(worker_chunk, args_list)):
-                print(f"[PROC] chunk {idx+1}/{len(parts)} pronto")
-                if result['logs']:
-                    print(result['logs'])
-                # Aggregate data
-                aggregated_frame_data['posture_angles'].extend(result['frame_data']['posture_angles'])
-                aggregated_frame_data['overstride_frames'].extend(result['frame_data']['overstride_frames'])
-                aggregated_frame_data['success_frames']['posture'].extend(result['frame_data']['success_frames']['posture'])
-                aggregated_frame_data['success_frames']['overstride'].extend(result['frame_data']['success_frames']['overstride'])
-    
-    # Sort frame data by frame number
-    aggregated_frame_data['posture_angles'].sort(key=lambda x: x['frame_number'])
-    aggregated_frame_data['overstride_frames'].sort(key=lambda x: x['frame_number'])
-    
-    # Save aggregated frame-level data to JSON file
-    frame_data_path = os.path.join(OUT_DIR, 'frame_data.json')
-    with open(frame_data_path, 'w') as f:
-        json.dump(aggregated_frame_data, f, indent=2)
-    print(f"[DATA] Frame-level data saved to: {frame_data_path}")
+def process_frames_sequential(meta, progress_cb=None):
+    """
+    2) Roda o Pose nos frames em ordem (single-process), bom até 20 segundos.
+       Salva as anotações por frame (postura ruim, baixa visibilidade) e retorna o array
+       de landmarks (n_frames, 33, 4); a análise temporal fica em analyze_landmarks.
+    - progress_cb(frames_feitos, frames_total), se informado, é chamado a cada PROGRESS_EVERY_FRAMES frames.
+    """
+    ensure_dirs(meta['out_dir'])
 
-    print(f"[OK] Análises salvas em: {os.path.abspath(OUT_DIR)}")
+    # instancia do mediapipe
+    with create_pose() as pose:
+        result = infer_frames_range(pose, meta, 0, None, 0, progress_cb)
 
+    meta['counters'] = result['counters']
+    record_stage_timings(result['timings'], meta)
+    log_inference_counters(meta['counters'])
 
-# ------------------ FASTAPI INTEGRATION ------------------
-app = FastAPI(title="MovUp Video Analysis API", version="1.0.0")
+    # contagem real de frames decodificados (o contêiner pode informar um valor aproximado)
+    meta['frame_count'] = result['frames_decoded']
+    return result['landmarks']
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Mount static files for serving worst frame images
-app.mount("/out", StaticFiles(directory=OUT_DIR), name="out")
+# ------------------ FASE 2: INFERÊNCIA (MULTIPROCESS=TRUE/VIDEOS LONGOS) ------------------
+# Pool persistente: criado uma vez (startup da API) e reaproveitado por todas as análises.
+# Cada processo carrega o Pose uma única vez em init_pose_worker e é reciclado após WORKER_MAX_TASKS chunks.
+WORKER_POOL = None
+WORKER_POOL_LOCK = threading.Lock()
+_WORKER_POSE = None  # instância do Pose dentro de cada processo do pool
+# uso do pool (para /metrics): chunks aguardando/rodando, chunks concluídos e segundos de trabalho somados
+POOL_STATS = {'chunks_pending': 0, 'chunks_done': 0, 'busy_seconds': 0.0}
+POOL_STATS_LOCK = threading.Lock()
 
-def analyze_video_file(video_path: str) -> Dict[str, Any]:
+def init_pose_worker():
     """
-    Analyzes a video file and returns structured results.
-    This function integrates the existing analysis logic with API response format.
+    Initializer dos processos do pool: carrega o modelo do MediaPipe uma única vez por processo.
     """
-    try:
-        # Reset output directories
-        reset_out_dir()
-        
-        # Extract frames from video
-        meta = extract_frames(video_path)
-        
-        # Process frames based on configuration
-        if MULTIPROCESS:
-            process_frames_multiproc(meta)
-        else:
-            process_frames_sequential(meta)
-        
-        # Collect analysis results
-        analysis_results = collect_analysis_results(meta, video_path)
-        
-        return analysis_results
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Video analysis failed: {str(e)}")
+    global _WORKER_POSE
+    _WORKER_POSE = create_pose()
 
-def calculate_frame_severity(frame_num: int, error_type: str, total_frames: int) -> float:
+def get_worker_pose():
     """
-    Calculates a severity score for a frame based on various factors.
-    This is a simplified implementation - you can enhance it based on your specific needs.
+    Retorna o Pose deste processo (criado sob demanda se o initializer não rodou).
     """
-    # Base severity calculation
-    base_severity = 0.5
-    
-    # Factor 1: Position in video (later frames might be more indicative of fatigue)
-    position_factor = frame_num / total_frames if total_frames > 0 else 0
-    
-    # Factor 2: Error type specific weights
-    error_weights = {
-        'posture': 0.8,      # Posture issues are generally more serious
-        'overstride': 0.6,   # Overstride is moderate concern
-        'visibility': 0.3    # Visibility issues are less critical
-    }
-    
-    weight = error_weights.get(error_type, 0.5)
-    
-    # Calculate final severity score
-    severity = base_severity + (position_factor * 0.3) + (weight * 0.2)
-    
-    # Ensure severity is between 0 and 1
-    return min(1.0, max(0.0, severity))
+    global _WORKER_POSE
+    if _WORKER_POSE is None:
+        _WORKER_POSE = create_pose()
+    return _WORKER_POSE
 
-def extract_worst_frames(video_path: str, meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+def ping_pose_worker(_=None):
     """
-    Extracts and saves the worst frame for each error type from the video.
-    Returns a list of worst frame information.
+    Tarefa vazia para o pool: garante o Pose carregado neste processo e retorna o pid.
     """
-    worst_frames = []
-    
-    try:
-        # Create output directory for worst frames
-        worst_frames_dir = os.path.join(OUT_DIR, 'worst_frames')
-        os.makedirs(worst_frames_dir, exist_ok=True)
-        
-        # Open video to extract frames
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            print(f"[WORST_FRAMES] Warning: Could not open video {video_path}")
-            return worst_frames
-        
-        fps = meta['fps']
-        
-        # Define error types and their corresponding directories
-        error_types = {
-            'posture': {
-                'dir': os.path.join(OUT_DIR, 'postura_incorreta'),
-                'description': 'Most severe posture error detected'
-            },
-            'overstride': {
-                'dir': os.path.join(OUT_DIR, 'min_heel'),
-                'description': 'Most severe overstride error detected'
-            },
-            'visibility': {
-                'dir': os.path.join(OUT_DIR, 'baixa_visibilidade'),
-                'description': 'Most severe visibility issue detected'
-            }
-        }
-        
-        for error_type, config in error_types.items():
-            error_dir = config['dir']
-            
-            if not os.path.exists(error_dir):
-                continue
-                
-            # Get all frame files for this error type
-            frame_files = [f for f in os.listdir(error_dir) if f.endswith('.jpg')]
-            
-            if not frame_files:
-                continue
-            
-            # Extract frame numbers and find the worst one
-            frame_numbers = []
-            for file in frame_files:
-                try:
-                    frame_num = int(file.split('_')[1].split('.')[0])
-                    frame_numbers.append(frame_num)
-                except (IndexError, ValueError):
-                    continue
-            
-            if not frame_numbers:
-                continue
-            
-            # Find the frame with the highest severity score
-            worst_frame_num = None
-            max_severity = 0
-            
-            for frame_num in frame_numbers:
-                severity = calculate_frame_severity(frame_num, error_type, meta['frame_count'])
-                if severity > max_severity:
-                    max_severity = severity
-                    worst_frame_num = frame_num
-            
-            # Fallback to highest frame number if no severity calculation
-            if worst_frame_num is None:
-                worst_frame_num = max(frame_numbers)
-                max_severity = 0.7  # Default severity
-            
-            severity_score = max_severity
-            
-            # Extract the frame from video
-            cap.set(cv2.CAP_PROP_POS_FRAMES, worst_frame_num)
-            ret, frame = cap.read()
-            
-            if ret:
-                # Save the worst frame
-                filename = f"{error_type}_worst_frame_{worst_frame_num:06d}.jpg"
-                filepath = os.path.join(worst_frames_dir, filename)
-                
-                # Save with high quality
-                cv2.imwrite(filepath, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                
-                worst_frames.append({
-                    "error_type": error_type,
-                    "frame_number": worst_frame_num,
-                    "severity_score": severity_score,
-                    "image_path": f"out/worst_frames/{filename}",
-                    "description": config['description']
-                })
-                
-                print(f"[WORST_FRAMES] Saved {error_type} worst frame: {filename}")
-            else:
-                print(f"[WORST_FRAMES] Warning: Could not extract frame {worst_frame_num} for {error_type}")
-        
-        cap.release()
-        
-    except Exception as e:
-        print(f"[WORST_FRAMES] Error extracting worst frames: {str(e)}")
-    
-    return worst_frames
+    get_worker_pose()
+    return os.getpid()
 
-def collect_analysis_results(meta: Dict[str, Any], video_path: str = None) -> Dict[str, Any]:
+def start_worker_pool():
     """
-    Collects analysis results from the processed frames and formats them for API response.
+    Cria o pool persistente de workers (se ainda não existir) e o retorna.
     """
-    fps = meta['fps']
-    frame_count = meta['frame_count']
-    total_duration_seconds = frame_count / fps if fps > 0 else 0
-    
-    # Initialize counters and worst frame info
-    posture_issues_count = 0
-    overstride_issues_count = 0
-    visibility_issues_count = 0
-    
-    posture_worst_frame = 0
-    overstride_worst_frame = 0
-    visibility_worst_frame = 0
-    
-    posture_image_path = ""
-    overstride_image_path = ""
-    visibility_image_path = ""
-    
-    posture_success_image_path = ""
-    overstride_success_image_path = ""
-    
-    # Load frame-level data from JSON file
-    frame_data = {
-        'posture_angles': [],
-        'overstride_frames': [],
-        'success_frames': {
-            'posture': [],
-            'overstride': []
-        }
-    }
-    frame_data_path = os.path.join(OUT_DIR, 'frame_data.json')
-    if os.path.exists(frame_data_path):
-        try:
-            with open(frame_data_path, 'r') as f:
-                frame_data = json.load(f)
-        except Exception as e:
-            print(f"[WARN] Could not load frame data: {e}")
-    
-    # Collect posture issues
-    posture_dir = os.path.join(OUT_DIR, 'postura_incorreta')
-    if os.path.exists(posture_dir):
-        posture_files = [f for f in os.listdir(posture_dir) if f.endswith('.jpg')]
-        posture_issues_count = len(posture_files)
+    global WORKER_POOL
+    with WORKER_POOL_LOCK:
+        if WORKER_POOL is None:
+            WORKER_POOL = Pool(processes=NUM_PROCS, initializer=init_pose_worker,
+                               maxtasksperchild=WORKER_MAX_TASKS)
+            atexit.register(stop_worker_pool)
+            logger.info(f"[POOL] {NUM_PROCS} workers iniciados (recicla a cada {WORKER_MAX_TASKS} chunks)")
+        return WORKER_POOL
+
+def get_worker_pool():
+    """
+    Pool em uso; sobe um novo na primeira chamada (ex.: uso fora da API).
+    """
+    return WORKER_POOL if WORKER_POOL is not None else start_worker_pool()
+
+def stop_worker_pool():
+    """
+    Encerra o pool persistente (shutdown da API).
+    """
+    global WORKER_POOL
+    with WORKER_POOL_LOCK:
+        if WORKER_POOL is not None:
+            WORKER_POOL.close()
+            WORKER_POOL.join()
+            WORKER_POOL = None
+
+# custo medido (s por frame lido) da inferência nos workers, média móvel entre análises
+FRAME_COST_EMA = None
+FRAME_COST_ALPHA = 0.3
+
+def plan_chunks(frame_count, overlap, workers, frame_cost=None, even=False):
+    """
+    Planeja os chunks do multiprocess a partir do tamanho do vídeo, dos workers e do custo por frame:
+    - tamanho mínimo: o suficiente para o overlap (aquecimento do tracking do Pose) não passar de
+      CHUNK_MAX_OVERLAP_RATIO do chunk, e não menos que CHUNK_MIN_FRAMES;
+    - vídeo curto demais para dar esse mínimo a todos os workers: divide em partes iguais, em
+      min(workers, ceil(frame_count / CHUNK_MIN_FRAMES)) chunks, já que core parado custa mais que overlap;
+      even=True faz essa divisão em qualquer vídeo (um chunk por worker);
+    - tamanho máximo: ~CHUNK_TARGET_SECONDS de inferência (se frame_cost, em s/frame, for conhecido)
+      e não mais que 1/workers do vídeo, para nenhum worker ficar parado;
+    - tamanhos decrescentes (guided scheduling): cada chunk pega uma fração do que resta, dividida por
+      workers * CHUNKS_PER_WORKER. Os chunks grandes saem primeiro e os pequenos do fim equilibram a cauda.
+    Retorna (parts, stats): parts = [(ini_with_overlap, end, effective_start)] em ordem de despacho
+    (maiores primeiro) e stats com número de chunks, tamanhos e overhead de overlap.
+    frame_count desconhecido (0): um único chunk, que schedule_chunks deixa aberto até o fim do vídeo.
+    """
+    workers = max(1, workers)
+    min_len = max(CHUNK_MIN_FRAMES, int(np.ceil(overlap / CHUNK_MAX_OVERLAP_RATIO)))
+    max_len = max(min_len, int(np.ceil(frame_count / workers)))
+    if frame_cost:
+        max_len = max(min_len, min(max_len, int(CHUNK_TARGET_SECONDS / frame_cost)))
+
+    if frame_count <= 0:
+        bounds = [0, 0]
+    elif even or frame_count < workers * min_len:
+        # vídeo curto (ou even): partes iguais, uma por worker até o limite de CHUNK_MIN_FRAMES por chunk
+        n_chunks = min(workers, int(np.ceil(frame_count / CHUNK_MIN_FRAMES)))
+        bounds = [frame_count * k // n_chunks for k in range(n_chunks + 1)]
+    else:
+        bounds = [0]
+        while bounds[-1] < frame_count:
+            remaining = frame_count - bounds[-1]
+            length = int(np.ceil(remaining / (workers * CHUNKS_PER_WORKER)))
+            length = min(max(length, min_len), max_len, remaining)
+            if remaining - length < min_len // 2:
+                length = remaining  # evita um último chunk minúsculo
+            bounds.append(bounds[-1] + length)
+    parts = [(max(0, start - overlap), end, start) for start, end in zip(bounds, bounds[1:])]
+
+    overlap_frames = sum(c - a for a, _, c in parts)
+    stats = {
+        'chunks': len(parts),
+        'min_len': min((b - c for _, b, c in parts), default=0),
+        'max_len': max((b - c for _, b, c in parts), default=0),
+        'overlap_frames': overlap_frames,
+        'overlap_ratio': overlap_frames / frame_count if frame_count > 0 else 0.0,
+    }
+    parts.sort(key=lambda p: p[1] - p[0], reverse=True)
+    return parts, stats
+
+def update_frame_cost(seconds, frames):
+    """
+    Atualiza FRAME_COST_EMA com o custo medido de um lote de chunks (tempo somado dos workers / frames lidos).
+    """
+    global FRAME_COST_EMA
+    if frames <= 0 or seconds <= 0:
+        return
+    cost = seconds / frames
+    FRAME_COST_EMA = cost if FRAME_COST_EMA is None else (1 - FRAME_COST_ALPHA) * FRAME_COST_EMA + FRAME_COST_ALPHA * cost
+
+def schedule_chunks(meta, step=1):
+    """
+    Chunks do vídeo inteiro para o multiprocess (plan_chunks com o custo medido até agora),
+    com o último chunk aberto (end=None) para não perder frames além da contagem informada.
+    Loga o plano e o overhead de overlap; o plano também fica em meta['schedule'].
+    """
+    window_size = max(1, int(round(meta['fps'] * WINDOW_SECONDS)))
+    overlap = window_size - 1
+    frame_cost = FRAME_COST_EMA / step if FRAME_COST_EMA else None
+    # sem seek exato (taxa variável) cada chunk chega no seu início avançando desde o frame 0:
+    # um chunk por worker, em vez de muitos chunks que decodificariam o começo do vídeo várias vezes
+    parts, stats = plan_chunks(meta['frame_count'], overlap, NUM_PROCS, frame_cost,
+                               even=not meta.get('seek_exact', True))
+
+    last = max(range(len(parts)), key=lambda k: parts[k][1], default=None)
+    if last is not None:
+        a, _, c = parts[last]
+        parts[last] = (a, None, c)
+
+    meta['schedule'] = stats
+    logger.info(f"[PROC] {NUM_PROCS} processos | {stats['chunks']} chunks de {stats['min_len']}-{stats['max_len']} frames "
+                f"(overlap={overlap}, overhead={100 * stats['overlap_ratio']:.1f}%"
+                f"{f', custo={1000 * frame_cost:.1f} ms/frame' if frame_cost else ''})")
+    return parts
+
+def worker_chunk(args, pose=None):
+    """
+    Processa um único chunk em um processo separado.
+    - Usa o Pose pré-carregado do worker (init_pose_worker), ou o 'pose' recebido, zerando o tracking.
+    - Abre o vídeo e decodifica apenas o seu intervalo (seek por keyframe em iter_video_frames).
+    - Processa [ini_with_overlap .. end_idx), devolvendo landmarks apenas para i >= effective_start
+      (antes disso é warm-up do tracking).
+    - args pode trazer um 5º item 'step' (inferência só em 1 a cada step frames).
+    - Com meta['profile'] (e rodando no pool), amostra a pilha durante o chunk e mede a serialização
+      do resultado (etapa 'result_pickle'); as pilhas voltam em 'profile_stacks'.
+    """
+    ini_with_overlap, end_idx, effective_start, meta = args[:4]
+    step = args[4] if len(args) > 4 else 1
+    # no próprio processo (pose recebido) quem amostra é a thread do job, ver analyze_video_file
+    sampler = StackSampler().start() if meta.get('profile') and pose is None else None
+
+    # Pose já carregado neste processo; reset() limpa o tracking do chunk anterior
+    if pose is None:
+        pose = get_worker_pose()
+    pose.reset()
+
+    # devolve os landmarks e as linhas de log para o processo pai
+    result = infer_frames_range(pose, meta, ini_with_overlap, end_idx, effective_start, step=step)
+    if sampler is not None:
+        t0 = time.perf_counter()
+        result['counters']['result_pickle_bytes'] += len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        observe_stage(result['timings'], 'result_pickle', time.perf_counter() - t0)
+        result['profile_stacks'] = sampler.stop()
+    return result
+
+def process_frames_multiproc(meta, progress_cb=None):
+    """
+    2) (alternativa) Orquestra a inferência em múltiplos processos (chunks):
+       - Divide o vídeo em chunks balanceados, com overlap para aquecer o tracking de cada worker
+         (schedule_chunks / plan_chunks): maiores primeiro, tamanho pelo custo medido por frame.
+       - Lança os chunks em paralelo (run_inference_parts); cada worker decodifica o seu
+         próprio intervalo do vídeo, então decode e inferência escalam juntos com NUM_PROCS.
+       - O último chunk lê até o fim do vídeo, caso o contêiner tenha informado menos frames.
+       - progress_cb(frames_feitos, frames_total), se informado, é chamado a cada chunk concluído.
+       Cada worker salva suas imagens diretamente nas pastas de saída; os landmarks dos chunks
+       são juntados em um único array (n_frames, 33, 4) indexado pelo número do frame.
+    """
+    out_dir = meta['out_dir']
+    ensure_dirs(out_dir)  # garante que as pastas existem
+
+    # cria os chunks com overlap (o último fica aberto)
+    parts = schedule_chunks(meta)
+    landmarks, _ = run_inference_parts(meta, parts, progress_cb)
+    log_inference_counters(meta['counters'])
+
+    # contagem real de frames decodificados pelos workers
+    meta['frame_count'] = len(landmarks)
+
+    logger.info(f"[OK] Análises salvas em: {os.path.abspath(out_dir)}")
+    return landmarks
+
+def run_inference_parts(meta, parts, progress_cb=None, step=1, total=None):
+    """
+    Roda worker_chunk em cada parte (ini_with_overlap, end, effective_start), no pool
+    persistente (ou no próprio processo com NUM_PROCS == 1), e junta os landmarks por frame.
+    - step: inferência só em 1 a cada step frames (frames pulados ficam NaN).
+    - total: tamanho do array de saída; None = até o último frame realmente decodificado pelas partes.
+    Retorna (landmarks (total, 33, 4), inferred (total,) bool com os frames inferidos).
+    """
+    frame_count = meta['frame_count']
+    # empacota os argumentos para cada worker
+    args_list = [(a, b, c, meta, step) for (a, b, c) in parts]
+    frames_decoded = 0
+    chunks = []
+    counters = meta.setdefault('counters', Counter())
+
+    def on_chunk_done(result):
+        nonlocal frames_decoded
+        chunks.append(result)
+        frames_decoded += result['frames_decoded']
+        counters.update(result['counters'])
+        record_stage_timings(result['timings'], meta)
+        if 'profile_stacks' in result:
+            meta.setdefault('profile_stacks', Counter()).update(result['profile_stacks'])
+        with POOL_STATS_LOCK:
+            POOL_STATS['chunks_pending'] -= 1
+            POOL_STATS['chunks_done'] += 1
+            POOL_STATS['busy_seconds'] += result['elapsed']
+        if progress_cb:
+            progress_cb(frames_decoded, frame_count)
+
+    with POOL_STATS_LOCK:
+        POOL_STATS['chunks_pending'] += len(args_list)
+    try:
+        # se for 1 processo so: roda no próprio processo, com um Pose só para esta análise
+        if NUM_PROCS == 1:
+            with create_pose() as pose:
+                for args in args_list:
+                    on_chunk_done(worker_chunk(args, pose))
+        else:
+            # paraleliza o processo com o pool persistente de workers
+            pool = get_worker_pool()
+            for idx, result in enumerate(pool.imap_unordered(worker_chunk, args_list)):
+                logger.debug(f"[PROC] chunk {idx+1}/{len(parts)} pronto")
+                on_chunk_done(result)
+    finally:
+        # chunks que não voltaram (erro no meio da análise) deixam de contar como pendentes
+        with POOL_STATS_LOCK:
+            POOL_STATS['chunks_pending'] -= len(args_list) - len(chunks)
+
+    # custo medido por frame (só na taxa cheia, que é a base do plano de chunks)
+    if step == 1:
+        update_frame_cost(sum(c['elapsed'] for c in chunks), sum(c['frames_read'] for c in chunks))
+
+    # junta os landmarks na ordem dos frames (frames que falharam na leitura ficam NaN)
+    if total is None:
+        # só os chunks que leram algo: com contagem superestimada pelo contêiner, os chunks que
+        # começam depois do fim real voltam vazios e não podem esticar o vídeo
+        total = max((c['start'] + c['frames_decoded'] for c in chunks if c['frames_decoded'] > 0), default=0)
+    landmarks = np.full((total, NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    inferred = np.zeros(total, dtype=bool)
+    for c in chunks:
+        landmarks[c['indices']] = c['landmarks']
+        inferred[c['indices']] = True
+    return landmarks, inferred
+
+
+# ------------------ FASE 2: INFERÊNCIA ADAPTATIVA (TAXA DE FRAMES REDUZIDA) ------------------
+def interpolate_landmarks(landmarks, inferred):
+    """
+    Preenche os frames não inferidos interpolando linearmente entre os frames inferidos vizinhos.
+    Se um dos vizinhos não teve detecção, o frame fica NaN; depois do último frame inferido,
+    repete o último valor.
+    """
+    idx = np.flatnonzero(inferred)
+    if len(idx) == 0:
+        return landmarks
+    out = landmarks.copy()
+    missing = np.flatnonzero(~inferred)
+    pos = np.searchsorted(idx, missing) - 1
+    left = idx[np.clip(pos, 0, None)]
+    right = idx[np.clip(pos + 1, None, len(idx) - 1)]
+    span = np.maximum(right - left, 1)
+    t = ((missing - left) / span).astype(np.float32)[:, None, None]
+    out[missing] = landmarks[left] * (1 - t) + landmarks[right] * t
+    return out
+
+def adaptive_refine_regions(landmarks, inferred, meta, step):
+    """
+    Trechos [início, fim) que precisam de inferência em taxa cheia, a partir do primeiro passo
+    (landmarks interpolados):
+      - vizinhança de ADAPTIVE_REFINE_SECONDS ao redor de cada contato do calcanhar detectado e de
+        cada ponto mais baixo local do calcanhar nas amostras (candidatos: definem o máximo da janela);
+      - intervalos entre amostras consecutivas em que a postura cruza BACK_ANGLE_BAD_THRESH ou a
+        visibilidade (ângulo válido / calcanhar visível) muda.
+    Trechos sobrepostos, ou separados por até ADAPTIVE_WARMUP_FRAMES frames, são unidos: inferir o
+    intervalo entre eles custa menos que o aquecimento de mais um trecho.
+    """
+    n = len(landmarks)
+    radius = max(step, int(round(meta['fps'] * ADAPTIVE_REFINE_SECONDS)))
+    metrics = compute_batch_metrics(landmarks, meta['width'], meta['height'])
+    regions = []
+
+    # contatos do calcanhar (mesma regra da análise, sobre os dados interpolados)
+    heel_y = landmarks[:, HEEL_IDX, 1].astype(float)
+    events = create_heel_detector(meta['fps']).detect(heel_y, metrics['heel_visible'], metrics['detected'])
+    for i in np.flatnonzero(events['strike']):
+        regions.append((i - radius, i + radius + 1))
+
+    # pontos mais baixos locais do calcanhar (maior y) entre as amostras do primeiro passo
+    idx = np.flatnonzero(inferred)
+    sample_y = np.where(metrics['heel_visible'][idx], heel_y[idx], -np.inf)
+    if len(idx) >= 3:
+        peak = (sample_y[1:-1] >= sample_y[:-2]) & (sample_y[1:-1] >= sample_y[2:]) & np.isfinite(sample_y[1:-1])
+        for i in idx[1:-1][peak]:
+            regions.append((i - radius, i + radius + 1))
+
+    # mudanças de classificação entre amostras consecutivas do primeiro passo
+    back_angle = metrics['back_angle'][idx]
+    with np.errstate(invalid='ignore'):
+        state = np.stack([
+            np.isnan(back_angle),
+            back_angle <= BACK_ANGLE_BAD_THRESH,
+            metrics['heel_visible'][idx],
+        ], axis=1)
+    changed = np.flatnonzero(np.any(state[1:] != state[:-1], axis=1))
+    for k in changed:
+        regions.append((idx[k] - radius, idx[k + 1] + radius + 1))
+
+    merged = []
+    for a, b in sorted((max(0, a), min(n, b)) for a, b in regions):
+        if merged and a <= merged[-1][1] + ADAPTIVE_WARMUP_FRAMES:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return [(a, b) for a, b in merged]
+
+def process_frames_adaptive(meta, progress_cb=None):
+    """
+    2) (alternativa) Inferência com taxa de frames adaptativa:
+       - com step < ADAPTIVE_MIN_STEP (ex.: vídeo de 30 fps) roda direto em taxa cheia (process_frames_multiproc);
+       - passo 1: Pose em 1 a cada step frames (≈ ADAPTIVE_BASE_FPS) no vídeo inteiro, em chunks;
+       - passo 2: Pose em taxa cheia só nos trechos de adaptive_refine_regions (contatos do
+         calcanhar e cruzamentos dos thresholds), com ADAPTIVE_WARMUP_FRAMES de aquecimento;
+         se os trechos somam ADAPTIVE_MAX_REFINE_RATIO do vídeo ou mais, o passo 2 roda em taxa
+         cheia no vídeo inteiro e o resultado é o do modo completo;
+       - os frames que continuam sem inferência são interpolados (interpolate_landmarks).
+    Retorna o array (n_frames, 33, 4), como process_frames_sequential/multiproc.
+    """
+    out_dir = meta['out_dir']
+    ensure_dirs(out_dir)
+
+    fps = meta['fps']
+    step = max(1, int(round(fps / ADAPTIVE_BASE_FPS)))
+    if step < ADAPTIVE_MIN_STEP:
+        # o passo 1 economizaria pouco e o passo 2 levaria o total acima da taxa cheia
+        logger.info(f"[ADAPTIVE] {fps:g} fps: passo {step} < ADAPTIVE_MIN_STEP, inferência em taxa cheia")
+        return process_frames_multiproc(meta, progress_cb)
+
+    # passo 1: taxa reduzida no vídeo inteiro (mesmos chunks do multiprocess)
+    parts = schedule_chunks(meta, step)
+    landmarks, inferred = run_inference_parts(meta, parts, progress_cb, step=step)
+    meta['frame_count'] = total = len(landmarks)
+    base_frames = int(inferred.sum())
+    if step == 1:
+        return landmarks
+
+    # passo 2: taxa cheia ao redor dos eventos
+    regions = adaptive_refine_regions(interpolate_landmarks(landmarks, inferred), inferred, meta, step)
+    refine_parts = [(max(0, a - ADAPTIVE_WARMUP_FRAMES), b, a) for a, b in regions]
+    refine_calls = sum(b - a for a, b, _ in refine_parts)  # chamadas do Pose no passo 2, com o aquecimento
+    if refine_calls >= ADAPTIVE_MAX_REFINE_RATIO * total:
+        # os trechos cobrem quase o vídeo todo: pelo mesmo custo, a taxa cheia no vídeo inteiro dá o
+        # resultado do modo completo, sem interpolação nem recomeço do tracking a cada trecho
+        landmarks, inferred = run_inference_parts(meta, schedule_chunks(meta), total=total)
+        meta['counters'] = Counter({**meta['counters'], **frame_counters(landmarks, inferred)})
+        log_inference_counters(meta['counters'])
+        logger.info(f"[ADAPTIVE] passo 1: {base_frames} frames (1 a cada {step}) | {len(regions)} trechos "
+                    f"somariam {refine_calls}/{total} frames: passo 2 em taxa cheia no vídeo inteiro")
+        return landmarks
+    if refine_parts:
+        refined, refined_mask = run_inference_parts(meta, refine_parts, total=total)
+        landmarks[refined_mask] = refined[refined_mask]
+        inferred |= refined_mask
+        # frames do passo 1 refinados no passo 2 contam uma vez só: os contadores por frame saem do
+        # resultado final; leitura, imagens e serialização somam o trabalho dos dois passos
+        meta['counters'] = Counter({**meta['counters'], **frame_counters(landmarks, inferred)})
+
+    n_inferred = int(inferred.sum())
+    log_inference_counters(meta['counters'])
+    logger.info(f"[ADAPTIVE] passo 1: {base_frames} frames (1 a cada {step}) | passo 2: "
+                f"{n_inferred - base_frames} frames em {len(regions)} trechos | inferidos {n_inferred}/{total} "
+                f"({100.0 * n_inferred / max(total, 1):.0f}%)")
+    logger.info(f"[OK] Análises salvas em: {os.path.abspath(out_dir)}")
+    return interpolate_landmarks(landmarks, inferred)
+
+
+# ------------------ DETECÇÃO DO CONTATO DO CALCANHAR ------------------
+class HeelStrikeDetector:
+    """
+    Detecta o contato do calcanhar com o solo: o frame em que o y do calcanhar é o maior
+    (ponto mais baixo na imagem) entre as últimas window_size amostras visíveis, com cooldown
+    para não disparar duas vezes no mesmo pico.
+    - push(): modo incremental (um frame por vez, ex.: tempo real). O máximo da janela vem de um
+      deque monotônico, então cada frame custa O(1) amortizado.
+    - detect(): modo offline, para o array inteiro de um vídeo, com a mesma regra vetorizada.
+    - get_state() / from_state(): estado serializável (JSON), para continuar a detecção em outro
+      processo ou em um próximo pedaço do vídeo.
+    Frames sem detecção do Pose não contam para nada; frames detectados sem o calcanhar visível
+    só avançam o cooldown.
+    """
+
+    def __init__(self, window_size, cooldown_frames, tol=HEEL_TOL):
+        self.window_size = int(window_size)
+        self.cooldown_frames = int(cooldown_frames)
+        self.tol = float(tol)
+        self.samples_seen = 0     # amostras visíveis do calcanhar já recebidas
+        self.cooldown = 0         # contador de cooldown (0 = pronto para detectar)
+        self.window = deque()     # (seq, y) com y decrescente: o primeiro é o máximo da janela
+
+    def push(self, frame_idx, heel_y, detected=True):
+        """
+        Processa um frame. heel_y=None (ou NaN) quando o calcanhar não está visível.
+        Retorna None enquanto a janela não está cheia (ou sem calcanhar), senão
+        {'frame', 'heel_y', 'lowest_y', 'strike'}.
+        """
+        if not detected:
+            return None
+
+        event = None
+        if heel_y is not None and not np.isnan(heel_y):
+            heel_y = float(heel_y)
+            seq = self.samples_seen
+            self.samples_seen += 1
+
+            # mantém o deque decrescente e só com as amostras da janela
+            while self.window and self.window[-1][1] <= heel_y:
+                self.window.pop()
+            self.window.append((seq, heel_y))
+            if self.window[0][0] <= seq - self.window_size:
+                self.window.popleft()
+
+            if self.samples_seen >= self.window_size:
+                # maior y na janela => calcanhar mais baixo
+                lowest_y = self.window[0][1]
+                strike = self.cooldown == 0 and heel_y >= lowest_y - self.tol
+                if strike:
+                    self.cooldown = self.cooldown_frames
+                event = {'frame': frame_idx, 'heel_y': heel_y, 'lowest_y': lowest_y, 'strike': strike}
+
+        # decrementa cooldown ao fim do frame
+        if self.cooldown > 0:
+            self.cooldown -= 1
+        return event
+
+    def detect(self, heel_y, heel_visible, detected=None):
+        """
+        Modo offline: processa todos os frames de uma vez, continuando do estado atual
+        (e deixando o detector no estado final, como se push() tivesse sido chamado frame a frame).
+        - heel_y (n,): y normalizado do calcanhar; heel_visible (n,) bool; detected (n,) bool (padrão: todos).
+        Retorna {'tracked' (n,) bool, 'lowest_y' (n,) float64 (NaN fora da janela), 'strike' (n,) bool}.
+        """
+        n = len(heel_y)
+        heel_y = np.asarray(heel_y, dtype=float)
+        detected = np.ones(n, dtype=bool) if detected is None else np.asarray(detected, dtype=bool)
+        valid = np.asarray(heel_visible, dtype=bool) & detected
+        w = self.window_size
+
+        # amostras anteriores da janela: as que saíram do deque são dominadas por outras, então -inf
+        # não muda o máximo de nenhuma janela
+        prefix = np.full(w - 1, -np.inf)
+        for seq, y in self.window:
+            pos = seq - (self.samples_seen - (w - 1))
+            if pos >= 0:
+                prefix[pos] = y
+
+        ys = heel_y[valid]
+        if len(ys):
+            lowest_valid = np.lib.stride_tricks.sliding_window_view(np.concatenate([prefix, ys]), w).max(axis=1)
+        else:
+            lowest_valid = np.empty(0)
+        tracked_valid = self.samples_seen + np.arange(1, len(ys) + 1) >= w
+        candidate_valid = tracked_valid & (ys >= lowest_valid - self.tol)
+
+        tracked = np.zeros(n, dtype=bool)
+        tracked[valid] = tracked_valid
+        lowest_y = np.full(n, np.nan)
+        lowest_y[tracked] = lowest_valid[tracked_valid]
+        candidate = np.zeros(n, dtype=bool)
+        candidate[valid] = candidate_valid
+
+        # cooldown conta frames detectados: um candidato só dispara se já passaram
+        # cooldown_frames frames detectados desde o último contato (só os candidatos entram no loop)
+        detected_count = np.cumsum(detected)
+        strike = np.zeros(n, dtype=bool)
+        last_count = None
+        for i in np.flatnonzero(candidate):
+            if last_count is None:
+                allowed = detected_count[i] - 1 >= self.cooldown
+            else:
+                allowed = detected_count[i] - last_count >= self.cooldown_frames
+            if allowed:
+                strike[i] = True
+                last_count = detected_count[i]
+
+        # estado final
+        total_detected = int(detected_count[-1]) if n else 0
+        if last_count is None:
+            self.cooldown = max(0, self.cooldown - total_detected)
+        else:
+            self.cooldown = max(0, self.cooldown_frames - 1 - (total_detected - int(last_count)))
+        for seq, y in zip(range(self.samples_seen, self.samples_seen + len(ys)), ys):
+            while self.window and self.window[-1][1] <= y:
+                self.window.pop()
+            self.window.append((seq, float(y)))
+        self.samples_seen += len(ys)
+        while self.window and self.window[0][0] <= self.samples_seen - 1 - w:
+            self.window.popleft()
+
+        return {'tracked': tracked, 'lowest_y': lowest_y, 'strike': strike}
+
+    def get_state(self):
+        """
+        Estado serializável (só tipos do JSON).
+        """
+        return {
+            'window_size': self.window_size,
+            'cooldown_frames': self.cooldown_frames,
+            'tol': self.tol,
+            'samples_seen': int(self.samples_seen),
+            'cooldown': int(self.cooldown),
+            'window': [[int(seq), float(y)] for seq, y in self.window],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Recria o detector a partir de get_state().
+        """
+        detector = cls(state['window_size'], state['cooldown_frames'], state['tol'])
+        detector.samples_seen = state['samples_seen']
+        detector.cooldown = state['cooldown']
+        detector.window = deque((int(seq), float(y)) for seq, y in state['window'])
+        return detector
+
+def create_heel_detector(fps):
+    """
+    Detector de contato do calcanhar com a janela WINDOW_SECONDS e o cooldown COOLDOWN_SECONDS do vídeo.
+    """
+    window_size = max(1, int(round(fps * WINDOW_SECONDS)))        # janela em num de frames
+    cooldown_frames = max(1, int(round(fps * COOLDOWN_SECONDS)))  # cooldown em num de frames
+    return HeelStrikeDetector(window_size, cooldown_frames)
+
+
+# ------------------ ANÁLISE EM TEMPO REAL (FRAME A FRAME) ------------------
+# Mesmo Pose com tracking do modo sequencial e mesma janela do calcanhar (HeelStrikeDetector.push),
+# mas um frame por vez, para a câmera ao vivo (WebSocket /ws/live).
+def new_live_session(fps):
+    """
+    Estado de uma sessão ao vivo: Pose (tracking entre frames), detector do calcanhar e ROI.
+    """
+    return {'pose': create_pose(), 'heel': create_heel_detector(fps), 'roi': None}
+
+def analyze_live_frame(session, image, frame_idx):
+    """
+    Analisa um frame (BGR) da sessão: ângulo das costas, contato do calcanhar e, no contato,
+    o ângulo do overstride. Retorna um dict pronto para JSON (None onde não há medida).
+    """
+    h, w = image.shape[:2]
+    results, row, region = infer_pose_frame(session['pose'], image, session['roi'])
+    if ROI_CROP_ENABLED:
+        session['roi'] = track_roi(session['roi'], row, w, h)
+        reset_pose_on_new_region(session['pose'], session['roi'], region, w, h)
+    detected = bool(results.pose_landmarks)
+
+    metrics = compute_batch_metrics(row[None], w, h)
+    back_angle = float(metrics['back_angle'][0])
+    heel_visible = bool(metrics['heel_visible'][0])
+    event = session['heel'].push(frame_idx, row[HEEL_IDX, 1] if heel_visible else None, detected)
+    strike = bool(event and event['strike'])
+    overstride_angle = float(metrics['knee_angle'][0]) if strike else None
+
+    return {
+        'frame': frame_idx,
+        'detected': detected,
+        'back_angle': None if np.isnan(back_angle) else round(back_angle, 2),
+        'posture_ok': None if np.isnan(back_angle) else bool(back_angle > BACK_ANGLE_BAD_THRESH),
+        'heel_y': round(float(row[HEEL_IDX, 1]), 4) if heel_visible else None,
+        'heel_strike': strike,
+        'overstride_angle': round(overstride_angle, 2) if strike else None,
+        'overstride': bool(overstride_angle > 8.0) if strike else None,
+    }
+
+
+# ------------------ FASE 3: ANÁLISE DOS LANDMARKS ------------------
+# Os dados por frame ficam em colunas (arrays NumPy tipados, uma posição por frame do vídeo),
+# mantidas em memória entre a análise e a coleta dos resultados. O JSON só é montado na resposta da API.
+def new_frame_store(landmarks):
+    """
+    Cria o armazenamento colunar de um vídeo com n frames:
+      - landmarks (n, 33, 4) float32: [x, y, z, visibility] por landmark (NaN = sem detecção);
+      - frame_index (n,) int32: número do frame;
+      - back_angle (n,) float64: ângulo das costas (NaN quando ombro/quadril/joelho não estão visíveis);
+      - visibility_issue (n,) bool: frame sem landmarks confiáveis para a postura;
+      - heel_tracked (n,) bool: calcanhar visível com a janela de histórico cheia;
+      - overstride_angle (n,) float64: ângulo joelho x vertical nos contatos detectados (NaN nos demais).
+    """
+    n = len(landmarks)
+    return {
+        'landmarks': landmarks,
+        'frame_index': np.arange(n, dtype=np.int32),
+        'back_angle': np.full(n, np.nan),
+        'visibility_issue': np.zeros(n, dtype=bool),
+        'heel_tracked': np.zeros(n, dtype=bool),
+        'overstride_angle': np.full(n, np.nan),
+    }
+
+def save_frame_store(path, store):
+    """
+    Salva as colunas do armazenamento em um .npz (debug / análise offline).
+    """
+    with open(path, 'wb') as f:
+        np.savez(f, **store)
+
+def load_frame_store(path, mmap_mode=None):
+    """
+    Lê um armazenamento salvo com save_frame_store (.npz) ou só os landmarks de um .npy
+    (ex.: entrada do cache). Com mmap_mode='r', o .npy é mapeado em memória em vez de lido.
+    """
+    if path.endswith('.npy'):
+        return {'landmarks': np.load(path, mmap_mode=mmap_mode)}
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def frame_store_to_json(store):
+    """
+    Converte as colunas para o formato da resposta da API:
+      - angles: [{'frame_number', 'angle'}] dos frames com ângulo das costas;
+      - frames: [{'frame_number', 'overstride', 'angle'}] dos frames com o calcanhar rastreado
+        (angle=None quando o frame não é um contato detectado).
+    """
+    back_angle = store['back_angle']
+    frame_index = store['frame_index']
+    angles = [
+        {'frame_number': int(i), 'angle': round(float(a), 2)}
+        for i, a in zip(frame_index[~np.isnan(back_angle)], back_angle[~np.isnan(back_angle)])
+    ]
+
+    frames = []
+    overstride_angle = store['overstride_angle']
+    for i in frame_index[store['heel_tracked']]:
+        a = overstride_angle[i]
+        if np.isnan(a):
+            frames.append({'frame_number': int(i), 'overstride': False, 'angle': None})
+        else:
+            frames.append({'frame_number': int(i), 'overstride': bool(a > 8.0), 'angle': round(float(a), 2)})
+    return angles, frames
+
+def analyze_landmarks(landmarks, meta):
+    """
+    3) A partir dos landmarks de todos os frames:
+       - calcula em lote (compute_batch_metrics) o ângulo das costas, a visibilidade e o
+         ângulo joelho x vertical de cada frame;
+       - acha os contatos do calcanhar com o solo (HeelStrikeDetector, modo offline), onde o
+         ângulo do joelho vira o overstride do passo.
+    Não usa pixels, então roda igual para landmarks recém-inferidos ou vindos do cache.
+    Retorna o armazenamento colunar (new_frame_store); com SAVE_FRAME_DATA salva também um .npz.
+    """
+    out_dir = meta['out_dir']
+    store = new_frame_store(landmarks)
+    metrics = compute_batch_metrics(landmarks, meta['width'], meta['height'])
+
+    # --------- Ângulo das costas / visibilidade ---------
+    # sem detecção, ou algum dos três (ombro/quadril/joelho) com vis < MIN_VIS: não confiamos no angulo
+    back_angles = metrics['back_angle']
+    store['back_angle'] = back_angles
+    store['visibility_issue'] = np.isnan(back_angles)
+
+    # --------- ponto mais baixo do calcanhar ---------
+    heel_y = landmarks[:, HEEL_IDX, 1].astype(float)
+    heel_visible = metrics['heel_visible']
+    events = create_heel_detector(meta['fps']).detect(heel_y, heel_visible, metrics['detected'])
+    strike = events['strike']
+    store['heel_tracked'] = events['tracked']
+
+    # -------------- OVERSTRIDE (ângulo do joelho nos contatos) -----------------------
+    store['overstride_angle'][strike] = metrics['knee_angle'][strike]
+
+    lowest_y = events['lowest_y']
+    strikes = np.flatnonzero(strike)
+    if logger.isEnabledFor(logging.DEBUG):
+        for i in strikes:
+            angle_deg = store['overstride_angle'][i]
+            status = 'ERROR' if angle_deg > 8.0 else 'SUCCESS'
+            logger.debug(f"[HEEL] frame={i} lowest_y={lowest_y[i]:.4f} angle={angle_deg:.2f}° (ratio=2/8) - {status}")
+    logger.info(f"[HEEL] {len(strikes)} contatos do calcanhar | "
+                f"{int(np.sum(store['overstride_angle'][strikes] > 8.0))} com overstride")
+
+    # debug log dos frames (amostrado; todos com TRACE_FRAMES)
+    for i in range(len(landmarks)):
+        if not should_log_frame(i):
+            continue
+        logger.debug(f"[FRAME {i:06d}] back_angle={(f'{back_angles[i]:.2f}°' if not np.isnan(back_angles[i]) else 'None')} "
+                     f"| heel_y={(f'{heel_y[i]:.4f}' if heel_visible[i] else 'None')} "
+                     f"| lowest_y={(f'{lowest_y[i]:.4f}' if not np.isnan(lowest_y[i]) else 'None')}")
+
+    # debug: colunas por frame em disco
+    if SAVE_FRAME_DATA:
+        frame_data_path = os.path.join(out_dir, 'frame_data.npz')
+        save_frame_store(frame_data_path, store)
+        logger.info(f"[DATA] Frame-level data saved to: {frame_data_path}")
+
+    return store
+
+
+# ------------------ CACHE DE LANDMARKS ------------------
+# Os landmarks brutos de cada vídeo ficam salvos em LANDMARK_CACHE_DIR (.npy, lido com memory-map), com
+# chave = hash do conteúdo do upload + configurações do modelo. Reanalisar o mesmo vídeo (ex.: com outros
+# thresholds de análise) pula decode e inferência. O diretório é limitado a LANDMARK_CACHE_MAX_BYTES (LRU por mtime).
+def file_sha256(path, block_size=1 << 20):
+    """
+    Hash SHA-256 do conteúdo de um arquivo, lido em blocos.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def landmark_cache_key(video_hash):
+    """
+    Chave do cache: hash do vídeo + tudo que muda a saída do modelo (complexidade, confianças,
+    resolução de entrada, recorte na pessoa e taxa adaptativa).
+    Parâmetros da análise (thresholds, janelas, CONTACT_RATIO) ficam de fora de propósito.
+    """
+    return (f"{video_hash}_v{LANDMARK_CACHE_VERSION}_mc{MODEL_COMPLEXITY}"
+            f"_det{MIN_DET_CONF:g}_trk{MIN_TRK_CONF:g}"
+            f"_in{POSE_INPUT_MAX_SIDE or 0}_roi{f'h{ROI_EDGE_MARGIN:g}' if ROI_CROP_ENABLED else 0}"
+            f"{f'_ad{ADAPTIVE_BASE_FPS:g}' if ADAPTIVE_FPS_ENABLED else ''}")
+
+def landmark_cache_path(key):
+    return os.path.join(LANDMARK_CACHE_DIR, f"{key}.npy")
+
+def load_cached_landmarks(key):
+    """
+    Lê os landmarks do cache (ou None se não houver) e marca a entrada como usada recentemente.
+    O array é mapeado em memória (somente leitura), sem copiar o arquivo inteiro para a RAM.
+    """
+    path = landmark_cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        landmarks = load_frame_store(path, mmap_mode='r')['landmarks']
+        os.utime(path)
+        logger.info(f"[CACHE] landmarks reaproveitados: {path}")
+        return landmarks
+    except Exception as e:
+        logger.warning(f"[CACHE] entrada inválida removida ({path}): {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+def save_cached_landmarks(key, landmarks):
+    """
+    Salva os landmarks no cache (escrita atômica) e aplica o limite de tamanho do diretório.
+    """
+    os.makedirs(LANDMARK_CACHE_DIR, exist_ok=True)
+    path = landmark_cache_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(landmarks, dtype=np.float32))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"[CACHE] não foi possível salvar {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    evict_landmark_cache()
+
+def evict_landmark_cache():
+    """
+    Remove as entradas usadas há mais tempo até o cache caber em LANDMARK_CACHE_MAX_BYTES.
+    """
+    entries = []
+    for name in os.listdir(LANDMARK_CACHE_DIR):
+        if not name.endswith('.npy'):
+            continue
+        path = os.path.join(LANDMARK_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= LANDMARK_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            logger.info(f"[CACHE] removido (limite de tamanho): {path}")
+        except OSError:
+            pass
+
+
+# ------------------ FASTAPI INTEGRATION ------------------
+app = FastAPI(title="MovUp Video Analysis API", version="1.0.0")
+
+def upload_limit(path: str) -> int:
+    """
+    Largest request body accepted on a path: UPLOAD_MAX_BYTES per video (BATCH_MAX_FILES videos on
+    /batches/), plus room for the multipart boundaries and part headers around each file.
+    """
+    max_files = BATCH_MAX_FILES if path.startswith('/batches') else 1
+    return max_files * (UPLOAD_MAX_BYTES + 64 * 1024)
+
+class UploadLimitMiddleware:
+    """
+    Caps POST bodies at upload_limit(path) on the raw ASGI stream, before FastAPI parses (and spools)
+    the multipart form: a declared Content-Length above the limit is rejected without reading the body,
+    and bodies without it (chunked) are cut off with 413 as soon as the bytes received pass the limit.
+    Runs inside CORSMiddleware, so the frontend can read the 413 instead of seeing a network error.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            await self.app(scope, receive, send)
+            return
+        limit = upload_limit(scope['path'])
+        content_length = dict(scope['headers']).get(b'content-length', b'')
+        if content_length.isdigit() and int(content_length) > limit:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    exceeded = True
+                    raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return  # the app's error response for the aborted body is replaced by the 413 below
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self.reject(scope, receive, send)
+
+    @staticmethod
+    async def reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": f"Upload too large (max {UPLOAD_MAX_BYTES} bytes per video)"})
+        await response(scope, receive, send)
+
+app.add_middleware(UploadLimitMiddleware)
+
+# upload routes that go through admission control (reject_when_queue_full)
+ADMISSION_ROUTES = ('/analisar-video/', '/jobs/')
+
+@app.middleware("http")
+async def reject_when_queue_full(request: Request, call_next):
+    """
+    Turns analysis uploads away with 503 + Retry-After while the wait queue is full, before the
+    request body is read (a client hitting a full queue doesn't upload the video first).
+    """
+    if request.method == 'POST' and request.url.path in ADMISSION_ROUTES:
+        try:
+            check_admission()
+        except HTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers=e.headers)
+    return await call_next(request)
+
+# HTTP request counters for /metrics: (method, route template, status code) -> count
+HTTP_REQUESTS = Counter()
+HTTP_FAILURES = Counter()  # (method, route template) -> 5xx responses and unhandled errors
+HTTP_STATS_LOCK = threading.Lock()
+
+def route_template(scope) -> str:
+    """
+    Route template of a request. Requests answered before routing (the early 413/503 of the upload
+    middlewares) get the template their path would have matched; paths matching no route are 'unmatched'.
+    """
+    route = scope.get('route')
+    if route is None:
+        route = next((r for r in app.router.routes if r.matches(scope)[0] == Match.FULL), None)
+    return getattr(route, 'path', 'unmatched')
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    """
+    Counts every HTTP request by route template (not the raw path, so job ids don't explode the labels).
+    """
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        key = (request.method, route_template(request.scope))
+        with HTTP_STATS_LOCK:
+            HTTP_REQUESTS[key + (status,)] += 1
+            if status >= 500:
+                HTTP_FAILURES[key] += 1
+
+# Configure CORS. Registered last so it is the outermost middleware: the early 413/503 answered by
+# the middlewares above also carry the CORS headers, and the browser lets the frontend read Retry-After.
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Retry-After"],
+)
+
+# Readiness: set once the Pose models are loaded (in every pool worker, or once in-process)
+POSE_READY = threading.Event()
+POSE_LOAD_ERROR: Optional[str] = None
+STARTED_TS = time.time()
+
+def load_pose_models() -> None:
+    """
+    Loads the Pose models the analyses will use and flags the API as ready (POSE_READY).
+    With the worker pool, pings the workers until every one of them answered (each loads its model
+    in init_pose_worker before taking tasks); otherwise creates one Pose to make sure the model loads.
+    """
+    global POSE_LOAD_ERROR
+    t0 = time.perf_counter()
+    try:
+        if MULTIPROCESS and NUM_PROCS > 1:
+            pool = start_worker_pool()
+            pids = set()
+            for _ in range(10):
+                pids.update(pool.map(ping_pose_worker, range(NUM_PROCS), chunksize=1))
+                if len(pids) >= NUM_PROCS:
+                    break
+        else:
+            with create_pose():
+                pass
+    except Exception as e:
+        POSE_LOAD_ERROR = str(e)
+        logger.error(f"[READY] falha ao carregar o Pose: {e}")
+        return
+    POSE_READY.set()
+    logger.info(f"[READY] modelos do Pose carregados em {time.perf_counter() - t0:.1f}s")
+
+@app.on_event("startup")
+def warm_up_worker_pool():
+    """
+    Starts the persistent worker pool (with preloaded Pose models) once, when the API boots.
+    The models load in the background; /ready answers 503 until they are in place.
+    """
+    threading.Thread(target=load_pose_models, name="pose-warmup", daemon=True).start()
+
+PURGE_STOP = threading.Event()
+
+def purge_expired_loop():
+    """
+    Every PURGE_INTERVAL_SECONDS drops expired jobs (with their videos), batches and workspaces,
+    so an idle API doesn't keep them until the next upload.
+    """
+    while not PURGE_STOP.wait(PURGE_INTERVAL_SECONDS):
+        try:
+            purge_finished_jobs()
+            purge_finished_batches()
+            cleanup_old_workspaces()
+        except Exception as e:
+            logger.warning(f"[PURGE] limpeza periódica falhou: {e!r}")
+
+@app.on_event("startup")
+def start_purge_loop():
+    """
+    Starts the periodic cleanup thread (purge_expired_loop).
+    """
+    PURGE_STOP.clear()
+    threading.Thread(target=purge_expired_loop, name="purge", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown_worker_pool():
+    """
+    Closes the persistent worker pool, the background job and batch executors, the image writer
+    and the periodic cleanup.
+    """
+    PURGE_STOP.set()
+    JOB_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    BATCH_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    stop_worker_pool()
+    stop_image_writer()
+
+# Mount static files for serving worst frame images (each job lives under /out/<job_id>)
+os.makedirs(OUT_DIR, exist_ok=True)
+app.mount("/out", StaticFiles(directory=OUT_DIR), name="out")
+
+def analyze_video_file(video_path: str, job_id: Optional[str] = None, progress_cb=None,
+                       video_hash: Optional[str] = None, stage_cb=None, profile: bool = False) -> Dict[str, Any]:
+    """
+    Analyzes a video file and returns structured results.
+    This function integrates the existing analysis logic with API response format.
+    Every call gets its own workspace (OUT_DIR/<job_id>), so concurrent analyses don't collide.
+    progress_cb(frames_done, frames_total) is forwarded to the processing stage.
+    Pose landmarks are cached by video content + model settings; on a cache hit, decoding and
+    inference are skipped and only the landmark analysis runs again. video_hash (sha256 hex) skips
+    hashing the file again when the caller already has it (e.g. computed during the upload).
+    stage_cb(stage), if given, is called when the analysis enters each stage: 'inference' (decode +
+    pose inference) or 'cache' (landmarks reused), then 'analysis' and 'collection'.
+    profile=True attaches a "profile" section to the result: wall time per stage, the per-stage
+    timing breakdown (summed across the pool workers) and a sampled stack profile of the job thread
+    and the workers (see StackSampler).
+    The landmarks are also stored in the workspace (LANDMARKS_FILENAME) for on-demand frame rendering.
+    """
+    sampler = StackSampler().start() if profile else None
+    wall = {}
+    try:
+        # Create an isolated output workspace for this job
+        workspace = create_job_workspace(job_id)
         
-        # Find worst frame: frame with the smallest angle (worst posture)
-        # Get all frames with errors and their angles
-        posture_angles_list = frame_data.get('posture_angles', [])
+        # Read video metadata (frames are decoded on the fly during processing)
+        meta = probe_video(video_path)
+        meta.update(workspace)
+        meta['profile'] = profile
+        if progress_cb:
+            progress_cb(0, meta['frame_count'])
         
-        # Filter only frames with errors (angle <= BACK_ANGLE_BAD_THRESH)
-        error_frames = [
-            item for item in posture_angles_list 
-            if item.get('angle', 999) <= BACK_ANGLE_BAD_THRESH
-        ]
+        # Reuse cached landmarks for this exact video + model settings, if any
+        t0 = time.perf_counter()
+        cache_key = landmark_cache_key(video_hash or file_sha256(video_path)) if LANDMARK_CACHE_ENABLED else None
+        landmarks = load_cached_landmarks(cache_key) if cache_key else None
+        wall['hash'] = time.perf_counter() - t0
         
-        if error_frames:
-            # Find the frame with the minimum angle (worst posture)
-            worst_frame_data = min(error_frames, key=lambda x: x.get('angle', 999))
-            posture_worst_frame = worst_frame_data['frame_number']
-            worst_angle = worst_frame_data['angle']
-            posture_image_path = f"out/postura_incorreta/frame_{posture_worst_frame:06d}.jpg"
-            print(f"[POSTURE] Worst frame selected: frame_{posture_worst_frame:06d} with angle {worst_angle}°")
-        elif posture_files:
-            # Fallback: if no angle data available, use highest frame number
-            frame_numbers = []
-            for file in posture_files:
-                try:
-                    frame_num = int(file.split('_')[1].split('.')[0])
-                    frame_numbers.append(frame_num)
-                except (IndexError, ValueError):
-                    continue
-             
-            if frame_numbers:
-                posture_worst_frame = max(frame_numbers)
-                posture_image_path = f"out/postura_incorreta/frame_{posture_worst_frame:06d}.jpg"
-    
-    # Collect overstride issues
-    overstride_dir = os.path.join(OUT_DIR, 'min_heel')
-    
-    # Get all overstride frames with angles from frame_data
-    overstride_frames_list = frame_data.get('overstride_frames', [])
-    
-    # Filter frames with error (angle > 8) and success (angle <= 8 or None)
-    error_frames = [
-        item for item in overstride_frames_list 
-        if item.get('overstride', False) and item.get('angle') is not None and item.get('angle', 0) > 8.0
-    ]
-    success_frames = [
-        item for item in overstride_frames_list 
-        if not item.get('overstride', True) or (item.get('angle') is not None and item.get('angle', 0) <= 8.0)
-    ]
+        if stage_cb:
+            stage_cb('inference' if landmarks is None else 'cache')
+        t0 = time.perf_counter()
+        if landmarks is None:
+            # Run pose inference based on configuration
+            if ADAPTIVE_FPS_ENABLED:
+                landmarks = process_frames_adaptive(meta, progress_cb)
+            elif MULTIPROCESS:
+                landmarks = process_frames_multiproc(meta, progress_cb)
+            else:
+                landmarks = process_frames_sequential(meta, progress_cb)
+            if cache_key:
+                save_cached_landmarks(cache_key, landmarks)
+        else:
+            meta['frame_count'] = len(landmarks)
+            if progress_cb:
+                progress_cb(len(landmarks), len(landmarks))
+        
+        # Keep the landmarks with the job so any frame can be rendered on demand later
+        np.save(os.path.join(meta['out_dir'], LANDMARKS_FILENAME), landmarks)
+        wall['inference'] = time.perf_counter() - t0
+        
+        # Temporal analysis over the landmarks (posture angles, heel strikes, overstride)
+        if stage_cb:
+            stage_cb('analysis')
+        timings = {}
+        t0 = time.perf_counter()
+        store = analyze_landmarks(landmarks, meta)
+        wall['analysis'] = time.perf_counter() - t0
+        observe_stage(timings, 'analysis', wall['analysis'])
+        
+        # Collect analysis results (in memory, straight from the per-frame columns)
+        if stage_cb:
+            stage_cb('collection')
+        t0 = time.perf_counter()
+        analysis_results = collect_analysis_results(meta, video_path, store)
+        wall['collection'] = time.perf_counter() - t0
+        observe_stage(timings, 'collection', wall['collection'])
+        record_stage_timings(timings, meta)
+        
+        if sampler is not None:
+            stacks = sampler.stop()
+            sampler = None
+            stacks.update(meta.get('profile_stacks', {}))
+            analysis_results['profile'] = {
+                "wall_seconds": {stage: round(seconds, 4) for stage, seconds in wall.items()},
+                "stages": summarize_stage_timings(meta.get('stage_timings', {})),
+                "result_pickle_bytes": meta.get('counters', {}).get('result_pickle_bytes', 0),
+                "pose_calls": meta.get('counters', {}).get('pose_calls', 0),
+                "sampling": summarize_profile(stacks)
+            }
+        return analysis_results
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Video analysis failed: {str(e)}")
+    finally:
+        if sampler is not None:
+            sampler.stop()
+
+def summarize_analysis(store: Dict[str, np.ndarray], frame_count: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Pure summary step: issue counts and the selected frames of each category, computed in memory
+    from the per-frame columns (analyze_landmarks). No filesystem access, so the counts don't depend
+    on which images were saved.
+    Frame numbers are None when the category has no such frame.
+    """
+    frame_index = store['frame_index']
+    back_angle = store['back_angle']
+    overstride_angle = store['overstride_angle']
     
-    # Count only frames with angle > 8
-    overstride_issues_count = len(error_frames)
+    # Posture: errors are angle <= BACK_ANGLE_BAD_THRESH; NaN = no angle for the frame
+    with np.errstate(invalid='ignore'):
+        posture_error_mask = back_angle <= BACK_ANGLE_BAD_THRESH
+        posture_ok_mask = back_angle > BACK_ANGLE_BAD_THRESH
+    posture = {'issues': int(posture_error_mask.sum()), 'worst_frame': None, 'worst_angle': None, 'success_frame': None}
+    if posture['issues']:
+        # Frame with the minimum angle (worst posture)
+        posture['worst_frame'] = int(frame_index[posture_error_mask][np.argmin(back_angle[posture_error_mask])])
+        posture['worst_angle'] = round(float(back_angle[posture['worst_frame']]), 2)
+    if posture_ok_mask.any():
+        # First frame with good posture
+        posture['success_frame'] = int(frame_index[posture_ok_mask][0])
     
-    # Clear existing error frames directory and save only the worst frame
-    if os.path.exists(overstride_dir):
-        # Remove all existing files
-        for file in os.listdir(overstride_dir):
-            try:
-                os.remove(os.path.join(overstride_dir, file))
-            except:
-                pass
+    # Overstride: detected contacts with error (angle > 8) and success (angle <= 8); NaN = not a contact frame
+    with np.errstate(invalid='ignore'):
+        overstride_error_mask = overstride_angle > 8.0
+        overstride_ok_mask = overstride_angle <= 8.0
+    overstride = {'issues': int(overstride_error_mask.sum()), 'worst_frame': None, 'worst_angle': None,
+                  'success_frame': None, 'success_angle': None}
+    if overstride['issues']:
+        # Contact with the highest angle (worst overstride)
+        overstride['worst_frame'] = int(frame_index[overstride_error_mask][np.argmax(overstride_angle[overstride_error_mask])])
+        overstride['worst_angle'] = round(float(overstride_angle[overstride['worst_frame']]), 2)
+    if overstride_ok_mask.any():
+        # Contact with the lowest angle (best overstride)
+        overstride['success_frame'] = int(frame_index[overstride_ok_mask][np.argmin(overstride_angle[overstride_ok_mask])])
+        overstride['success_angle'] = round(float(overstride_angle[overstride['success_frame']]), 2)
     
-    # Find worst frame: frame with the highest angle (worst overstride) and save it
-    overstride_worst_frame = 0
-    overstride_image_path = ""
-    worst_angle = 0.0
-    if error_frames:
-        worst_frame_data = max(error_frames, key=lambda x: x.get('angle', 0))
-        overstride_worst_frame = worst_frame_data['frame_number']
-        worst_angle = worst_frame_data['angle']
-        
-        # Extract and save the worst frame with annotations
-        if video_path and os.path.exists(video_path):
-            cap = cv2.VideoCapture(video_path)
-            if cap.isOpened():
-                cap.set(cv2.CAP_PROP_POS_FRAMES, overstride_worst_frame)
-                ret, frame = cap.read()
-                if ret:
-                    # Process with MediaPipe to get landmarks for drawing
-                    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    rgb.flags.writeable = False
-                    with mp_pose.Pose(
-                        static_image_mode=True,
-                        model_complexity=MODEL_COMPLEXITY,
-                        min_detection_confidence=MIN_DET_CONF,
-                        min_tracking_confidence=MIN_TRK_CONF
-                    ) as pose:
-                        results = pose.process(rgb)
-                        rgb.flags.writeable = True
-                        frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-                        
-                        if results.pose_landmarks:
-                            h, w, _ = frame.shape
-                            lm = results.pose_landmarks.landmark
-                            heel_idx = mp_pose.PoseLandmark.RIGHT_HEEL.value
-                            foot_idx = mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value
-                            knee_idx = mp_pose.PoseLandmark.RIGHT_KNEE.value
-                            
-                            heel_lm = lm[heel_idx]
-                            fidx_lm = lm[foot_idx]
-                            knee_lm = lm[knee_idx]
-                            
-                            if is_visible(heel_lm) and is_visible(fidx_lm) and is_visible(knee_lm):
-                                heel_px = to_pixel(heel_lm, w, h)
-                                fidx_px = to_pixel(fidx_lm, w, h)
-                                knee_px = to_pixel(knee_lm, w, h)
-                                contact_px = heel_px + (fidx_px - heel_px) * CONTACT_RATIO
-                                
-                                # Draw annotations
-                                cpt = (int(contact_px[0]), int(contact_px[1]))
-                                cv2.circle(frame, cpt, 8, (0, 0, 255), -1)
-                                top_point = (cpt[0], max(0, cpt[1] - int(h * 0.85)))
-                                cv2.line(frame, cpt, top_point, (255, 0, 0), 2)
-                                knee_pt = (int(knee_px[0]), int(knee_px[1]))
-                                cv2.line(frame, cpt, knee_pt, (0, 255, 255), 2)
-                                cv2.putText(frame, f"{worst_angle:.0f} deg",
-                                            (cpt[0], max(0, cpt[1] - 10)),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,255), 2, cv2.LINE_AA)
-                    
-                    os.makedirs(overstride_dir, exist_ok=True)
-                    save_img(annotated_path('min_heel', overstride_worst_frame), frame)
-                    overstride_image_path = f"out/min_heel/frame_{overstride_worst_frame:06d}.jpg"
-                    print(f"[OVERSTRIDE] Worst error frame saved: frame_{overstride_worst_frame:06d} with angle {worst_angle}°")
-                cap.release()
-        else:
-            # Fallback: use frames directory if video not available
-            if overstride_worst_frame > 0:
-                frame_path_check = frame_path(overstride_worst_frame)
-                if os.path.exists(frame_path_check):
-                    frame = cv2.imread(frame_path_check)
-                    if frame is not None:
-                        # Process with MediaPipe to get landmarks for drawing
-                        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        rgb.flags.writeable = False
-                        with mp_pose.Pose(
-                            static_image_mode=True,
-                            model_complexity=MODEL_COMPLEXITY,
-                            min_detection_confidence=MIN_DET_CONF,
-                            min_tracking_confidence=MIN_TRK_CONF
-                        ) as pose:
-                            results = pose.process(rgb)
-                            rgb.flags.writeable = True
-                            frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-                            
-                            if results.pose_landmarks:
-                                h, w, _ = frame.shape
-                                lm = results.pose_landmarks.landmark
-                                heel_idx = mp_pose.PoseLandmark.RIGHT_HEEL.value
-                                foot_idx = mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value
-                                knee_idx = mp_pose.PoseLandmark.RIGHT_KNEE.value
-                                
-                                heel_lm = lm[heel_idx]
-                                fidx_lm = lm[foot_idx]
-                                knee_lm = lm[knee_idx]
-                                
-                                if is_visible(heel_lm) and is_visible(fidx_lm) and is_visible(knee_lm):
-                                    heel_px = to_pixel(heel_lm, w, h)
-                                    fidx_px = to_pixel(fidx_lm, w, h)
-                                    knee_px = to_pixel(knee_lm, w, h)
-                                    contact_px = heel_px + (fidx_px - heel_px) * CONTACT_RATIO
-                                    
-                                    # Draw annotations
-                                    cpt = (int(contact_px[0]), int(contact_px[1]))
-                                    cv2.circle(frame, cpt, 8, (0, 0, 255), -1)
-                                    top_point = (cpt[0], max(0, cpt[1] - int(h * 0.85)))
-                                    cv2.line(frame, cpt, top_point, (255, 0, 0), 2)
-                                    knee_pt = (int(knee_px[0]), int(knee_px[1]))
-                                    cv2.line(frame, cpt, knee_pt, (0, 255, 255), 2)
-                                    cv2.putText(frame, f"{worst_angle:.0f} deg",
-                                                (cpt[0], max(0, cpt[1] - 10)),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,255), 2, cv2.LINE_AA)
-                        
-                        os.makedirs(overstride_dir, exist_ok=True)
-                        save_img(annotated_path('min_heel', overstride_worst_frame), frame)
-                        overstride_image_path = f"out/min_heel/frame_{overstride_worst_frame:06d}.jpg"
-                        print(f"[OVERSTRIDE] Worst error frame saved: frame_{overstride_worst_frame:06d} with angle {worst_angle}°")
+    # Visibility: the last frame without a trustworthy angle
+    visibility_frames = frame_index[store['visibility_issue']]
+    visibility = {'issues': len(visibility_frames),
+                  'worst_frame': int(visibility_frames.max()) if len(visibility_frames) else None}
     
-    # Find best success frame: frame with the lowest angle (best overstride) and save it
-    overstride_success_image_path = ""
-    success_frames_dir = os.path.join(OUT_DIR, 'success_frames')
+    # Frames with success (frames without errors)
+    for category in (posture, overstride, visibility):
+        category['successes'] = frame_count - category['issues']
     
-    # Remove old overstride success frames
-    if os.path.exists(success_frames_dir):
-        old_files = [f for f in os.listdir(success_frames_dir) if f.startswith('overstride_success_')]
-        for old_file in old_files:
-            try:
-                os.remove(os.path.join(success_frames_dir, old_file))
-            except:
-                pass
+    return {'posture': posture, 'overstride': overstride, 'visibility': visibility}
+
+# Images referenced by the response: (category, summary frame field, output subdir, file name prefix or None)
+RESULT_IMAGES = [
+    ('posture', 'worst_frame', 'postura_incorreta', None),
+    ('posture', 'success_frame', 'success_frames', 'posture_success'),
+    ('overstride', 'worst_frame', 'min_heel', None),
+    ('overstride', 'success_frame', 'success_frames', 'overstride_success'),
+    ('visibility', 'worst_frame', 'baixa_visibilidade', None),
+]
+
+def render_result_images(meta: Dict[str, Any], landmarks: np.ndarray, summary: Dict[str, Dict[str, Any]]) -> Dict[tuple, str]:
+    """
+    Writes the images referenced by the summary into the job workspace (render_annotated_frame:
+    frame from the video + stored landmarks) and returns their URLs, keyed by (category, frame field).
+    The few frames missing on disk are read in one pass (read_video_frames). Frames that could not
+    be rendered are left out.
+    """
+    url_prefix = meta['url_prefix']
+    wanted = []
+    for category, field, subdir, prefix in RESULT_IMAGES:
+        idx = summary[category][field]
+        if idx is not None:
+            filename = f"{prefix}_{idx:06d}.jpg" if prefix else None
+            wanted.append((category, field, subdir, idx, filename))
+    missing = [idx for _, _, subdir, idx, filename in wanted
+               if not os.path.exists(annotated_frame_path(meta, subdir, idx, filename))]
+    frames = read_video_frames(meta['video_path'], missing, meta.get('seek_exact', True)) if missing else {}
+
+    images = {}
+    for category, field, subdir, idx, filename in wanted:
+        image = frames[idx].copy() if idx in frames else None  # o mesmo frame pode ir para duas imagens
+        path = render_annotated_frame(meta, landmarks, subdir, idx, filename, image)
+        if path:
+            images[(category, field)] = f"{url_prefix}/{subdir}/{os.path.basename(path)}"
     
-    if success_frames:
-        # Filter only frames with valid angles (not None)
-        valid_success_frames = [item for item in success_frames if item.get('angle') is not None]
-        if valid_success_frames:
-            best_frame_data = min(valid_success_frames, key=lambda x: x.get('angle', 999))
-            overstride_success_frame_num = best_frame_data['frame_number']
-            best_angle = best_frame_data['angle']
-            
-            # Extract frame from video to save as success
-            if video_path and os.path.exists(video_path):
-                cap = cv2.VideoCapture(video_path)
-                if cap.isOpened():
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, overstride_success_frame_num)
-                    ret, frame = cap.read()
-                    if ret:
-                        os.makedirs(success_frames_dir, exist_ok=True)
-                        filename = f'overstride_success_{overstride_success_frame_num:06d}.jpg'
-                        save_img(os.path.join(success_frames_dir, filename), frame)
-                        overstride_success_image_path = f"out/success_frames/{filename}"
-                        print(f"[OVERSTRIDE] Best success frame saved: frame_{overstride_success_frame_num:06d} with angle {best_angle}°")
-                    cap.release()
-            else:
-                # Fallback: use frames directory if video not available
-                frame_path_check = frame_path(overstride_success_frame_num)
-                if os.path.exists(frame_path_check):
-                    image = cv2.imread(frame_path_check)
-                    if image is not None:
-                        os.makedirs(success_frames_dir, exist_ok=True)
-                        filename = f'overstride_success_{overstride_success_frame_num:06d}.jpg'
-                        save_img(os.path.join(success_frames_dir, filename), image)
-                        overstride_success_image_path = f"out/success_frames/{filename}"
-                        print(f"[OVERSTRIDE] Best success frame saved: frame_{overstride_success_frame_num:06d} with angle {best_angle}°")
+    posture, overstride = summary['posture'], summary['overstride']
+    if posture['worst_frame'] is not None:
+        logger.info(f"[POSTURE] Worst frame selected: frame_{posture['worst_frame']:06d} with angle {posture['worst_angle']}°")
+    if ('overstride', 'worst_frame') in images:
+        logger.info(f"[OVERSTRIDE] Worst error frame saved: frame_{overstride['worst_frame']:06d} with angle {overstride['worst_angle']}°")
+    if ('overstride', 'success_frame') in images:
+        logger.info(f"[OVERSTRIDE] Best success frame saved: frame_{overstride['success_frame']:06d} with angle {overstride['success_angle']}°")
+    return images
+
+def collect_analysis_results(meta: Dict[str, Any], video_path: str = None, store: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+    """
+    Collects analysis results from the per-frame columns (analyze_landmarks) and formats them for API response.
+    Counts and selected frames come from summarize_analysis (in memory); the only filesystem step is
+    render_result_images, which reads the few referenced frames back from the video and draws the
+    stored landmarks on them.
+    """
+    fps = meta['fps']
+    frame_count = meta['frame_count']
+    total_duration_seconds = frame_count / fps if fps > 0 else 0
     
-    # Collect visibility issues
-    visibility_dir = os.path.join(OUT_DIR, 'baixa_visibilidade')
-    if os.path.exists(visibility_dir):
-        visibility_files = [f for f in os.listdir(visibility_dir) if f.endswith('.jpg')]
-        visibility_issues_count = len(visibility_files)
-        
-        # Find worst frame
-        if visibility_files:
-            frame_numbers = []
-            for file in visibility_files:
-                try:
-                    frame_num = int(file.split('_')[1].split('.')[0])
-                    frame_numbers.append(frame_num)
-                except (IndexError, ValueError):
-                    continue
-            
-            if frame_numbers:
-                visibility_worst_frame = max(frame_numbers)
-                visibility_image_path = f"out/baixa_visibilidade/frame_{visibility_worst_frame:06d}.jpg"
+    # Per-frame columns (empty store if nothing was analyzed)
+    if store is None:
+        store = new_frame_store(np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32))
     
-    # Calculate frames with success (frames without errors)
-    posture_success_frames = frame_count - posture_issues_count
-    overstride_success_frames = frame_count - overstride_issues_count
-    visibility_success_frames = frame_count - visibility_issues_count
+    summary = summarize_analysis(store, frame_count)
+    images = render_result_images(meta, store['landmarks'], summary)
+    posture, overstride, visibility = summary['posture'], summary['overstride'], summary['visibility']
     
-    # Get success frame image paths
-    success_frames_dir = os.path.join(OUT_DIR, 'success_frames')
-    if os.path.exists(success_frames_dir):
-        # Find posture success image
-        posture_success_files = [f for f in os.listdir(success_frames_dir) if f.startswith('posture_success_')]
-        if posture_success_files:
-            posture_success_image_path = f"out/success_frames/{posture_success_files[0]}"
-        
-        # Find overstride success image (if not already set above)
-        if not overstride_success_image_path:
-            overstride_success_files = [f for f in os.listdir(success_frames_dir) if f.startswith('overstride_success_')]
-            if overstride_success_files:
-                overstride_success_image_path = f"out/success_frames/{overstride_success_files[0]}"
+    # Per-frame series for the charts (JSON only at the API boundary)
+    posture_angles_json, overstride_frames_json = frame_store_to_json(store)
     
     # Build result structure in the requested format
     result = {
         "status": "success",
+        "job_id": meta.get('job_id'),
         "analysis": [
             {
                 "posture": {
-                    "Número de frames com erro": posture_issues_count,
-                    "Número de frames com sucesso": posture_success_frames,
-                    "worst_frame_number": posture_worst_frame,
-                    "image_path": posture_image_path,
-                    "success_image_path": posture_success_image_path,
-                    "angles": frame_data.get('posture_angles', [])
+                    "Número de frames com erro": posture['issues'],
+                    "Número de frames com sucesso": posture['successes'],
+                    "worst_frame_number": posture['worst_frame'] or 0,
+                    "image_path": images.get(('posture', 'worst_frame'), ""),
+                    "success_image_path": images.get(('posture', 'success_frame'), ""),
+                    "angles": posture_angles_json
                 }
             },
             {
                 "overstride": {
-                    "Número de frames com erro": overstride_issues_count,
-                    "Número de frames com sucesso": overstride_success_frames,
-                    "worst_frame_number": overstride_worst_frame,
-                    "image_path": overstride_image_path,
-                    "success_image_path": overstride_success_image_path,
-                    "frames": frame_data.get('overstride_frames', [])
+                    "Número de frames com erro": overstride['issues'],
+                    "Número de frames com sucesso": overstride['successes'],
+                    "worst_frame_number": overstride['worst_frame'] or 0,
+                    "image_path": images.get(('overstride', 'worst_frame'), ""),
+                    "success_image_path": images.get(('overstride', 'success_frame'), ""),
+                    "frames": overstride_frames_json
                 }
             },
             {
                 "baixa_visibilidade": {
-                    "Número de frames com erro": visibility_issues_count,
-                    "Número de frames com sucesso": visibility_success_frames,
-                    "worst_frame_number": visibility_worst_frame,
-                    "image_path": visibility_image_path
+                    "Número de frames com erro": visibility['issues'],
+                    "Número de frames com sucesso": visibility['successes'],
+                    "worst_frame_number": visibility['worst_frame'] or 0,
+                    "image_path": images.get(('visibility', 'worst_frame'), "")
                 }
             }
         ],
@@ -1190,51 +2465,898 @@ def collect_analysis_results(meta: Dict[str, Any], video_path: str = None) -> Di
             "total_frames": frame_count,
             "fps": fps,
             "total_duration_seconds": total_duration_seconds,
-            "posture_issues_count": posture_issues_count,
-            "overstride_issues_count": overstride_issues_count,
-            "visibility_issues_count": visibility_issues_count
+            "posture_issues_count": posture['issues'],
+            "overstride_issues_count": overstride['issues'],
+            "visibility_issues_count": visibility['issues']
         }
     }
     
-    print(result)
+    logger.debug(result)
         
     return result
 
-@app.post("/analisar-video/")
-async def analyze_video(file: UploadFile = File(...)):
+# ------------------ BACKGROUND JOBS ------------------
+# Registry of analysis jobs (in memory, per server process). The CPU-bound analysis runs on
+# JOB_EXECUTOR threads, so the event loop keeps accepting uploads and answering status polls.
+JOBS: Dict[str, Dict[str, Any]] = {}
+JOBS_LOCK = threading.Lock()
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="analysis")
+# Analysis slots shared by upload jobs and the videos of API batches (run_batch_video), so together
+# they never run more than MAX_CONCURRENT_JOBS analyses at once.
+ANALYSIS_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_JOBS)
+
+# Admission control: at most MAX_CONCURRENT_JOBS analyses run (JOB_EXECUTOR) and MAX_QUEUED_JOBS wait;
+# beyond that uploads are turned away right away. Wait/run times are moving averages (updated under JOBS_LOCK).
+QUEUE_STATS = {'admitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'wait_ema': None, 'run_ema': None}
+QUEUE_STATS_ALPHA = 0.3
+# Videos of API batches waiting for / holding an analysis slot (under JOBS_LOCK)
+BATCH_VIDEOS = {'queued': 0, 'running': 0}
+
+def update_queue_ema(key: str, seconds: float) -> None:
     """
-    API endpoint to receive uploaded video and return analysis results.
+    Folds one measured duration into QUEUE_STATS[key] (caller holds JOBS_LOCK).
+    """
+    old = QUEUE_STATS[key]
+    QUEUE_STATS[key] = seconds if old is None else (1 - QUEUE_STATS_ALPHA) * old + QUEUE_STATS_ALPHA * seconds
+
+def count_jobs(status: str) -> int:
+    """
+    Number of registered jobs with this status (caller holds JOBS_LOCK).
+    """
+    return sum(1 for job in JOBS.values() if job['status'] == status)
+
+def retry_after_seconds() -> int:
+    """
+    Estimated wait until a queue slot frees up: one analysis finishing, with MAX_CONCURRENT_JOBS
+    running at the average duration (caller holds JOBS_LOCK).
+    """
+    run_ema = QUEUE_STATS['run_ema']
+    if run_ema is None:
+        return RETRY_AFTER_DEFAULT_SECONDS
+    return max(1, int(np.ceil(run_ema / MAX_CONCURRENT_JOBS)))
+
+def queue_full_error(queued: int) -> HTTPException:
+    """
+    503 with a Retry-After hint for a rejected upload (caller holds JOBS_LOCK).
+    """
+    QUEUE_STATS['rejected'] += 1
+    retry_after = retry_after_seconds()
+    logger.warning(f"[QUEUE] upload rejeitado: {queued} análises na fila (máx {MAX_QUEUED_JOBS}), retry em {retry_after}s")
+    return HTTPException(status_code=503, detail="Analysis queue is full, retry later",
+                         headers={"Retry-After": str(retry_after)})
+
+def check_admission() -> None:
+    """
+    Fails fast (503 + Retry-After) when the wait queue is full. Called by reject_when_queue_full
+    before the upload body is read; submit_analysis_job checks again atomically when the job is registered.
+    """
+    with JOBS_LOCK:
+        queued = count_jobs('queued')
+        if queued >= MAX_QUEUED_JOBS:
+            raise queue_full_error(queued)
+
+def queue_stats() -> Dict[str, Any]:
+    """
+    Current queue depth and admission counters, with the average wait and run times (seconds).
+    Batch videos share the analysis slots and are counted apart (batch_running, batch_queued).
+    """
+    with JOBS_LOCK:
+        return {
+            "running": count_jobs('running'),
+            "queued": count_jobs('queued'),
+            "batch_running": BATCH_VIDEOS['running'],
+            "batch_queued": BATCH_VIDEOS['queued'],
+            "max_concurrent": MAX_CONCURRENT_JOBS,
+            "max_queued": MAX_QUEUED_JOBS,
+            "admitted_total": QUEUE_STATS['admitted'],
+            "rejected_total": QUEUE_STATS['rejected'],
+            "avg_wait_seconds": round(QUEUE_STATS['wait_ema'], 3) if QUEUE_STATS['wait_ema'] is not None else None,
+            "avg_run_seconds": round(QUEUE_STATS['run_ema'], 3) if QUEUE_STATS['run_ema'] is not None else None,
+        }
+
+def update_job(job_id: str, **fields) -> None:
+    """
+    Updates fields of a registered job (thread-safe).
+    """
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns a snapshot of a job, or None if it doesn't exist.
+    """
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        return dict(job) if job is not None else None
+
+def purge_finished_jobs() -> None:
+    """
+    Drops finished jobs older than JOB_RETENTION_SECONDS, with their source video and rendered
+    frames (their workspaces are removed by cleanup_old_workspaces with the same retention).
+    """
+    limit = time.time() - JOB_RETENTION_SECONDS
+    with JOBS_LOCK:
+        expired = [JOBS.pop(k) for k, job in list(JOBS.items())
+                   if job['status'] in ('done', 'error') and job['created_ts'] < limit]
+    for job in expired:
+        remove_job_video(job)
+        render_cache_drop_job(job['job_id'])
+
+def enforce_job_video_budget() -> None:
+    """
+    Keeps the videos held by finished jobs within JOB_VIDEO_MAX_BYTES, deleting the least recently
+    used ones first (video_used_ts: when the job finished or last rendered a frame). Their jobs keep
+    the result; /jobs/{job_id}/frames answers 410 for frames not already in the render cache.
+    """
+    with JOBS_LOCK:
+        kept = sorted((job for job in JOBS.values() if job['status'] == 'done' and job.get('video_path')),
+                      key=lambda job: job.get('video_used_ts', 0))
+        total = sum(job.get('video_bytes', 0) for job in kept)
+        evicted = []
+        for job in kept:
+            if total <= JOB_VIDEO_MAX_BYTES:
+                break
+            total -= job.get('video_bytes', 0)
+            evicted.append(job['video_path'])
+            job['video_path'] = None
+    for video_path in evicted:
+        logger.info(f"[JOBS] vídeo removido para caber em JOB_VIDEO_MAX_BYTES: {video_path}")
+        remove_job_video({'video_path': video_path})
+
+def remove_job_video(job: Dict[str, Any]) -> None:
+    """
+    Deletes the uploaded video kept for a job.
+    """
+    if job.get('video_path'):
+        try:
+            os.unlink(job['video_path'])
+        except OSError:
+            pass
+
+def job_status_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public view of a job (everything except the result itself).
+    """
+    total = job.get('frames_total') or 0
+    done = job.get('frames_done') or 0
+    
+    # Inference throughput (frames/s since the inference stage started) and the ETA it implies
+    fps = None
+    eta = None
+    if job.get('inference_started_ts') and done > 0:
+        elapsed = (job.get('inference_finished_ts') or time.time()) - job['inference_started_ts']
+        if elapsed > 0:
+            fps = round(done / elapsed, 2)
+            if job['status'] == 'running' and job.get('stage') == 'inference' and total > done:
+                eta = round((total - done) / (done / elapsed), 1)
+    
+    return {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "stage": job.get('stage'),
+        "stages": job.get('stages', []),
+        "frames_done": done,
+        "frames_total": total,
+        "progress": round(min(1.0, done / total), 4) if total > 0 else 0.0,
+        "fps": fps,
+        "eta_seconds": eta,
+        "created_at": job['created_at'],
+        "started_at": job.get('started_at'),
+        "finished_at": job.get('finished_at'),
+        "queue_wait_seconds": job.get('queue_wait_seconds'),
+        "profile": job.get('profile', False),
+        "error": job.get('error'),
+        "status_url": f"/jobs/{job['job_id']}",
+        "result_url": f"/jobs/{job['job_id']}/result",
+        "events_url": f"/jobs/{job['job_id']}/events",
+    }
+
+def set_job_stage(job_id: str, stage: str) -> None:
+    """
+    Moves a job to a new pipeline stage, recording when it started (stage history for the
+    progress stream; inference start/end for the throughput and ETA).
+    """
+    now = time.time()
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is None:
+            return
+        if job.get('stage') == 'inference':
+            job['inference_finished_ts'] = now
+        if stage == 'inference':
+            job['inference_started_ts'] = now
+        job['stage'] = stage
+        job.setdefault('stages', []).append({"stage": stage, "at": datetime.fromtimestamp(now).isoformat(timespec='milliseconds')})
+
+def run_analysis_job(job_id: str, video_path: str, video_hash: Optional[str] = None,
+                     profile: bool = False, keep_video: bool = True) -> Dict[str, Any]:
+    """
+    Executes one analysis job on an executor thread, keeping the registry up to date.
+    profile=True attaches the timing breakdown and sampled profile to the result (analyze_video_file).
+    With keep_video, a successful job keeps its uploaded video so frames can be rendered on demand,
+    within JOB_VIDEO_MAX_BYTES (enforce_job_video_budget); otherwise, or on failure, it is removed right away.
+    The job stays queued until it gets one of the ANALYSIS_SLOTS (shared with batch videos).
+    """
+    ANALYSIS_SLOTS.acquire()
+    started_ts = time.time()
+    with JOBS_LOCK:
+        job = JOBS[job_id]
+        wait = started_ts - job['created_ts']
+        job.update(status='running', started_at=datetime.now().isoformat(timespec='seconds'),
+                   queue_wait_seconds=round(wait, 3))
+        update_queue_ema('wait_ema', wait)
+    try:
+        result = analyze_video_file(
+            video_path, job_id,
+            progress_cb=lambda done, total: update_job(job_id, frames_done=done, frames_total=total),
+            video_hash=video_hash,
+            stage_cb=lambda stage: set_job_stage(job_id, stage),
+            profile=profile
+        )
+    except Exception as e:
+        ANALYSIS_SLOTS.release()
+        set_job_stage(job_id, 'error')
+        with JOBS_LOCK:
+            QUEUE_STATS['failed'] += 1
+        update_job(job_id, status='error', error=str(getattr(e, 'detail', e)),
+                   finished_at=datetime.now().isoformat(timespec='seconds'))
+        remove_job_video({'video_path': video_path})
+        raise
+    else:
+        ANALYSIS_SLOTS.release()
+        with JOBS_LOCK:
+            update_queue_ema('run_ema', time.time() - started_ts)
+            QUEUE_STATS['completed'] += 1
+        total = result['summary']['total_frames']
+        if keep_video:
+            try:
+                video_bytes = os.path.getsize(video_path)
+            except OSError:
+                video_bytes = 0
+            update_job(job_id, video_bytes=video_bytes, video_used_ts=time.time())
+        else:
+            remove_job_video({'video_path': video_path})
+            update_job(job_id, video_path=None)
+        set_job_stage(job_id, 'done')
+        update_job(job_id, status='done', result=result, frames_done=total, frames_total=total,
+                   finished_at=datetime.now().isoformat(timespec='seconds'))
+        if keep_video:
+            enforce_job_video_budget()
+        return result
+
+def submit_analysis_job(video_path: str, video_hash: Optional[str] = None, upload_started_ts: Optional[float] = None,
+                        profile: bool = False, keep_video: bool = True):
+    """
+    Registers a new job and schedules it on JOB_EXECUTOR.
+    video_hash: sha256 of the video, when already computed during the upload.
+    upload_started_ts: when the upload began (first entry of the stage history).
+    profile: profile this analysis (see analyze_video_file).
+    keep_video: keep the video after the analysis for /jobs/{job_id}/frames (see run_analysis_job).
+    Raises 503 (Retry-After) when MAX_QUEUED_JOBS jobs are already waiting.
+    Returns (job_id, concurrent.futures.Future).
+    """
+    purge_finished_jobs()
+    job_id = new_job_id()
+    with JOBS_LOCK:
+        queued = count_jobs('queued')
+        if queued >= MAX_QUEUED_JOBS:
+            raise queue_full_error(queued)
+        QUEUE_STATS['admitted'] += 1
+        now = time.time()
+        stages = [{"stage": "queued", "at": datetime.fromtimestamp(now).isoformat(timespec='milliseconds')}]
+        if upload_started_ts is not None:
+            stages.insert(0, {"stage": "upload", "at": datetime.fromtimestamp(upload_started_ts).isoformat(timespec='milliseconds')})
+        JOBS[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": "queued",
+            "stages": stages,
+            "frames_done": 0,
+            "frames_total": 0,
+            "created_ts": now,
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "video_path": video_path,
+            "profile": profile,
+            "result": None,
+        }
+    future = JOB_EXECUTOR.submit(run_analysis_job, job_id, video_path, video_hash, profile, keep_video)
+    return job_id, future
+
+def looks_like_video(head: bytes) -> bool:
+    """
+    Checks the first bytes of an upload against the signatures of the containers OpenCV reads:
+    MP4/MOV/3GP ('ftyp' box), AVI (RIFF), Matroska/WebM (EBML), MPEG-PS and MPEG-TS.
+    """
+    return (
+        head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip')
+        or (head[:4] == b'RIFF' and head[8:12] == b'AVI ')
+        or head[:4] == b'\x1a\x45\xdf\xa3'
+        or head[:4] == b'\x00\x00\x01\xba'
+        or (len(head) > 188 and head[0] == 0x47 and head[188] == 0x47)
+    )
+
+async def save_upload_to_tempfile(file: UploadFile):
+    """
+    Validates the uploaded file and streams it to a temporary .mp4 in UPLOAD_CHUNK_BYTES blocks
+    (the whole video is never held in memory). The content hash used by the landmark cache is
+    computed while the blocks are written, so the analysis doesn't read the file again for it.
+    - 400: content type is not video/*; 415: the first bytes are not a known video container;
+      413: the file is larger than UPLOAD_MAX_BYTES (checked as it is written; the request body as a
+      whole is already capped by UploadLimitMiddleware).
+    Returns (path, sha256 hex digest).
     """
     if not file.content_type or not file.content_type.startswith('video/'):
         raise HTTPException(status_code=400, detail="File must be a video")
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large (max {UPLOAD_MAX_BYTES} bytes)")
     
-    # Create temporary file for the uploaded video
+    digest = hashlib.sha256()
+    written = 0
     with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
         try:
-            # Write uploaded file to temporary location
-            content = await file.read()
-            temp_file.write(content)
-            temp_file.flush()
-            
-            # Analyze the video
-            results = analyze_video_file(temp_file.name)
-            
-            return JSONResponse(content=results)
-            
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if written == 0 and not looks_like_video(chunk):
+                    raise HTTPException(status_code=415, detail="File content is not a supported video container")
+                written += len(chunk)
+                if written > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Upload too large (max {UPLOAD_MAX_BYTES} bytes)")
+                digest.update(chunk)
+                temp_file.write(chunk)
+            if written == 0:
+                raise HTTPException(status_code=400, detail="Empty upload")
+        except BaseException:
+            temp_file.close()
+            os.unlink(temp_file.name)
+            raise
+        return temp_file.name, digest.hexdigest()
+
+@app.post("/analisar-video/")
+async def analyze_video(file: UploadFile = File(...), profile: bool = False):
+    """
+    API endpoint to receive uploaded video and return analysis results.
+    The analysis runs as a background job; this endpoint just awaits it (without blocking the event loop).
+    ?profile=true adds a "profile" section (stage timings and sampled stacks) to the results.
+    Returns 503 with Retry-After when the analysis queue is full (reject_when_queue_full, before the upload).
+    The video is deleted once the analysis finishes (frames on demand need POST /jobs/).
+    """
+    upload_started_ts = time.time()
+    video_path, video_hash = await save_upload_to_tempfile(file)
+    
+    try:
+        _, future = submit_analysis_job(video_path, video_hash, upload_started_ts, profile, keep_video=False)
+        results = await asyncio.wrap_future(future)
+        return JSONResponse(content=results)
+    
+    except HTTPException as e:
+        if e.status_code == 503:
+            remove_job_video({'video_path': video_path})
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(getattr(e, 'detail', e))}")
+
+@app.post("/jobs/", status_code=202)
+async def create_analysis_job(file: UploadFile = File(...), profile: bool = False):
+    """
+    Receives a video and returns a job id right away; the analysis runs in background.
+    Poll /jobs/{job_id} for progress and fetch /jobs/{job_id}/result when it is done.
+    Stream /jobs/{job_id}/events for live stage/progress updates.
+    ?profile=true profiles the analysis; the report comes in the result's "profile" section.
+    Returns 503 with Retry-After when the analysis queue is full (reject_when_queue_full, before the upload).
+    """
+    upload_started_ts = time.time()
+    video_path, video_hash = await save_upload_to_tempfile(file)
+    try:
+        job_id, _ = submit_analysis_job(video_path, video_hash, upload_started_ts, profile)
+    except HTTPException:
+        remove_job_video({'video_path': video_path})
+        raise
+    return job_status_payload(get_job(job_id))
+
+@app.get("/queue")
+async def get_queue_stats():
+    """
+    Admission control state: running/queued analyses, limits, admitted/rejected totals and
+    average queue wait / run time.
+    """
+    return queue_stats()
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """
+    Returns the status and progress (frames done / total) of an analysis job.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status_payload(job)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """
+    Formats one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Server-Sent Events stream of a job's progress. Events:
+    - 'stage': the job entered a new stage (upload, queued, inference or cache, analysis, collection);
+    - 'progress': frames done/total, inference throughput (fps) and ETA, on every chunk completion;
+    - 'done' / 'error': final status, then the stream ends.
+    Every event carries the same payload as GET /jobs/{job_id}.
+    """
+    if get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        last_stage = None
+        last_progress = None
+        last_sent = time.monotonic()
+        while True:
+            job = get_job(job_id)
+            if job is None:
+                yield sse_event('error', {"job_id": job_id, "error": "Job expired"})
+                return
+            payload = job_status_payload(job)
+            if payload['stage'] != last_stage:
+                last_stage = payload['stage']
+                yield sse_event('stage', payload)
+                last_sent = time.monotonic()
+            if job['status'] in ('done', 'error'):
+                yield sse_event(job['status'], payload)
+                return
+            progress = (payload['frames_done'], payload['frames_total'])
+            if progress != last_progress:
+                last_progress = progress
+                yield sse_event('progress', payload)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > SSE_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(SSE_POLL_SECONDS)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs/{job_id}/result")
+async def get_analysis_job_result(job_id: str):
+    """
+    Returns the final analysis JSON of a job (202 with the status while it is still running).
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job['status'] == 'error':
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {job['error']}")
+    if job['status'] != 'done':
+        return JSONResponse(status_code=202, content=job_status_payload(job))
+    return JSONResponse(content=job['result'])
+
+RENDER_OVERLAYS = ('postura_incorreta', 'baixa_visibilidade', 'min_heel', 'none')
+
+@app.get("/jobs/{job_id}/frames/{frame_idx}")
+def get_job_frame(job_id: str, frame_idx: int, overlay: str = 'postura_incorreta'):
+    """
+    Renders any frame of a finished job on demand: reads that frame from the source video and draws
+    the overlay from the stored landmarks. Encoded JPEGs are kept in a size-bounded LRU cache.
+    Answers 410 once the video is gone (job expired, analyzed via /analisar-video/ or evicted by
+    enforce_job_video_budget).
+    overlay: 'postura_incorreta' (landmarks), 'baixa_visibilidade' (warning text), 'min_heel'
+    (overstride contact/knee lines) or 'none'.
+    """
+    if overlay not in RENDER_OVERLAYS:
+        raise HTTPException(status_code=400, detail=f"Invalid overlay (expected one of {', '.join(RENDER_OVERLAYS)})")
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    key = (job_id, frame_idx, overlay)
+    jpeg = render_cache_get(key)
+    if jpeg is None:
+        landmarks_path = os.path.join(OUT_DIR, job_id, LANDMARKS_FILENAME)
+        if not os.path.exists(landmarks_path) or not os.path.exists(job.get('video_path') or ''):
+            raise HTTPException(status_code=410, detail="Job data is no longer available")
+        landmarks = np.load(landmarks_path, mmap_mode='r')
+        if not 0 <= frame_idx < len(landmarks):
+            raise HTTPException(status_code=404, detail="Frame not found")
+        update_job(job_id, video_used_ts=time.time())
+        # vídeo de taxa variável: o frame é lido avançando desde o início (probe uma vez por job)
+        if job.get('seek_exact') is None:
+            job['seek_exact'] = probe_video(job['video_path'])['seek_exact']
+            update_job(job_id, seek_exact=job['seek_exact'])
+        jpeg = render_frame_jpeg(job['video_path'], landmarks, overlay, frame_idx, seek_exact=job['seek_exact'])
+        if jpeg is None:
+            if not os.path.exists(job['video_path']):  # removido enquanto renderizava
+                raise HTTPException(status_code=410, detail="Job data is no longer available")
+            raise HTTPException(status_code=404, detail="Frame could not be read")
+        render_cache_put(key, jpeg)
+
+    return Response(content=jpeg, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=3600"})
+
+# ------------------ BATCH ANALYSIS ------------------
+# Many videos in one run: POST /batches/ (uploads) or `python root.py batch <dir>` (CLI).
+# BATCH_CONCURRENT_VIDEOS videos are analyzed at once, so their chunks interleave in the shared worker
+# pool and the workers stay busy while each video goes through its serial stages (probe, hashing,
+# analysis, collection). Every finished video appends one line to a JSON Lines file; videos whose
+# content hash already has a "done" line there are skipped, so an interrupted batch resumes where it stopped.
+# Uploaded batches take the same ANALYSIS_SLOTS as the upload jobs (run_batch_video).
+BATCHES: Dict[str, Dict[str, Any]] = {}
+BATCHES_LOCK = threading.Lock()
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch")
+
+def read_batch_results(output_path: str) -> set:
+    """
+    Content hashes of the videos with a "done" line in a batch results file (empty if it doesn't exist).
+    A truncated last line (batch interrupted while writing) is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'done' and record.get('sha256'):
+                done.add(record['sha256'])
+    return done
+
+def append_batch_record(output_path: str, record: Dict[str, Any], lock: threading.Lock) -> None:
+    """
+    Appends one JSON line to the results file and syncs it, so a crash loses at most the line being written.
+    """
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with lock:
+        with open(output_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+def run_batch(videos: List[Dict[str, Any]], output_path: str, concurrency: Optional[int] = None,
+              on_record=None, remove_after: bool = False, analyze=None) -> Dict[str, Any]:
+    """
+    Analyzes a list of videos ({'name', 'path', 'sha256' (optional)}) and appends one line per video
+    to output_path: {"video", "sha256", "status": "done"|"error", "result"|"error", "elapsed_seconds",
+    "finished_at"}. Videos already done in output_path (same content hash), or repeated in the list,
+    are skipped. Larger videos start first so the last ones to finish are short.
+    on_record(record) is called for every video (skipped ones with status "skipped", not written).
+    remove_after deletes each video file once it has been handled (uploaded temp files).
+    analyze(path, video_hash=...) runs each analysis (default analyze_video_file; API batches use run_batch_video).
+    Returns the counts: total, analyzed, skipped, failed, elapsed_seconds, output.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    done = read_batch_results(output_path)
+    # a line cut short by an interrupted run must not swallow the next one
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    analyze = analyze or analyze_video_file
+    seen = set()
+    lock = threading.Lock()
+    counts = Counter()
+    t0 = time.perf_counter()
+
+    def handle(video):
+        started = time.perf_counter()
+        record = {"video": video['name'], "sha256": video.get('sha256')}
+        try:
+            if record['sha256'] is None:
+                record['sha256'] = file_sha256(video['path'])
+            with lock:
+                skip = record['sha256'] in done or record['sha256'] in seen
+                seen.add(record['sha256'])
+            if skip:
+                record['status'] = 'skipped'
+            else:
+                record.update(status='done', result=analyze(video['path'], video_hash=record['sha256']))
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-        
+            record.update(status='error', error=str(getattr(e, 'detail', e)))
         finally:
-            # Clean up temporary file
+            if remove_after:
+                remove_job_video({'video_path': video['path']})
+
+        with lock:
+            counts[record['status']] += 1
+        if record['status'] != 'skipped':
+            record.update(elapsed_seconds=round(time.perf_counter() - started, 3),
+                          finished_at=datetime.now().isoformat(timespec='seconds'))
+            append_batch_record(output_path, record, lock)
+            logger.info(f"[BATCH] {video['name']}: {record['status']} em {record['elapsed_seconds']:.1f}s "
+                        f"({counts['done'] + counts['error']} analisados, {counts['skipped']} pulados de {len(videos)})")
+        if on_record:
+            on_record(record)
+
+    def video_size(video):
+        try:
+            return os.path.getsize(video['path'])
+        except OSError:
+            return 0
+
+    ordered = sorted(videos, key=video_size, reverse=True)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency or BATCH_CONCURRENT_VIDEOS),
+                            thread_name_prefix="batch-video") as executor:
+        list(executor.map(handle, ordered))
+
+    return {
+        "total": len(videos),
+        "analyzed": counts['done'],
+        "skipped": counts['skipped'],
+        "failed": counts['error'],
+        "elapsed_seconds": round(time.perf_counter() - t0, 3),
+        "output": output_path,
+    }
+
+def list_video_files(directory: str, recursive: bool = False) -> List[Dict[str, Any]]:
+    """
+    Videos (by VIDEO_EXTENSIONS) in a directory, named by their path relative to it.
+    """
+    videos = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        if not recursive:
+            dirnames.clear()
+        for name in sorted(filenames):
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                path = os.path.join(dirpath, name)
+                videos.append({"name": os.path.relpath(path, directory), "path": path})
+    return videos
+
+def batch_status_payload(batch: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public view of a batch (its counts; the results are served as JSON Lines).
+    """
+    payload = {key: value for key, value in batch.items() if key not in ('output', 'finished_ts')}
+    payload['results_url'] = f"/batches/{batch['batch_id']}/results"
+    return payload
+
+def purge_finished_batches() -> None:
+    """
+    Drops batches finished more than JOB_RETENTION_SECONDS ago, and the results files (BATCH_DIR)
+    of batches not running that were last written before that. Posting such a batch_id again starts over.
+    """
+    limit = time.time() - JOB_RETENTION_SECONDS
+    with BATCHES_LOCK:
+        for batch_id, batch in list(BATCHES.items()):
+            if batch['finished_ts'] is not None and batch['finished_ts'] < limit:
+                del BATCHES[batch_id]
+        active = {batch_id for batch_id, batch in BATCHES.items() if batch['status'] in ('queued', 'running')}
+    if not os.path.isdir(BATCH_DIR):
+        return
+    for name in os.listdir(BATCH_DIR):
+        batch_id, ext = os.path.splitext(name)
+        if ext != '.jsonl' or not JOB_ID_RE.match(batch_id) or batch_id in active:
+            continue
+        path = os.path.join(BATCH_DIR, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.unlink(path)
+        except OSError:
+            pass
+
+def run_batch_video(video_path: str, video_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyzes one video of an API batch in one of the ANALYSIS_SLOTS shared with the upload jobs,
+    counted in BATCH_VIDEOS (queue_stats, movup_jobs) while it waits and while it runs.
+    """
+    with JOBS_LOCK:
+        BATCH_VIDEOS['queued'] += 1
+    ANALYSIS_SLOTS.acquire()
+    started_ts = time.time()
+    with JOBS_LOCK:
+        BATCH_VIDEOS['queued'] -= 1
+        BATCH_VIDEOS['running'] += 1
+    try:
+        result = analyze_video_file(video_path, video_hash=video_hash)
+    finally:
+        ANALYSIS_SLOTS.release()
+        with JOBS_LOCK:
+            BATCH_VIDEOS['running'] -= 1
+    with JOBS_LOCK:
+        update_queue_ema('run_ema', time.time() - started_ts)
+    return result
+
+def run_batch_job(batch_id: str, videos: List[Dict[str, Any]]) -> None:
+    """
+    Runs an uploaded batch on BATCH_EXECUTOR, keeping BATCHES[batch_id] up to date.
+    """
+    def on_record(record):
+        key = {'done': 'analyzed', 'error': 'failed', 'skipped': 'skipped'}[record['status']]
+        with BATCHES_LOCK:
+            BATCHES[batch_id][key] += 1
+
+    with BATCHES_LOCK:
+        BATCHES[batch_id]['status'] = 'running'
+    try:
+        run_batch(videos, BATCHES[batch_id]['output'], on_record=on_record, remove_after=True,
+                  analyze=run_batch_video)
+    except Exception as e:
+        logger.error(f"[BATCH] lote {batch_id} falhou: {e}")
+        with BATCHES_LOCK:
+            BATCHES[batch_id].update(status='error', error=str(e))
+    else:
+        with BATCHES_LOCK:
+            BATCHES[batch_id]['status'] = 'done'
+    finally:
+        with BATCHES_LOCK:
+            BATCHES[batch_id].update(finished_at=datetime.now().isoformat(timespec='seconds'), finished_ts=time.time())
+
+@app.post("/batches/", status_code=202)
+async def create_batch(files: List[UploadFile] = File(...), batch_id: Optional[str] = None):
+    """
+    Receives up to BATCH_MAX_FILES videos and analyzes them in background, sharing the worker pool.
+    Results go to a JSON Lines file (one line per video, see run_batch) served at /batches/{batch_id}/results.
+    Posting again with the same ?batch_id= resumes it: videos already analyzed there are skipped
+    (for JOB_RETENTION_SECONDS after the batch finished, see purge_finished_batches).
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {BATCH_MAX_FILES} per batch)")
+    batch_id = batch_id or new_job_id()
+    if not JOB_ID_RE.match(batch_id):
+        raise HTTPException(status_code=400, detail="Invalid batch_id")
+    purge_finished_batches()
+
+    # Registered as queued before the uploads are read, so a concurrent POST with the same batch_id gets the 409
+    batch = {
+        "batch_id": batch_id,
+        "status": "queued",
+        "total": len(files),
+        "analyzed": 0,
+        "skipped": 0,
+        "failed": 0,
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "finished_at": None,
+        "finished_ts": None,
+        "output": os.path.join(BATCH_DIR, f"{batch_id}.jsonl"),
+    }
+    with BATCHES_LOCK:
+        previous = BATCHES.get(batch_id)
+        if previous is not None and previous['status'] in ('queued', 'running'):
+            raise HTTPException(status_code=409, detail="Batch is still running")
+        BATCHES[batch_id] = batch
+
+    videos = []
+    try:
+        for file in files:
+            path, video_hash = await save_upload_to_tempfile(file)
+            videos.append({"name": file.filename or os.path.basename(path), "path": path, "sha256": video_hash})
+    except BaseException:
+        for video in videos:
+            remove_job_video({'video_path': video['path']})
+        with BATCHES_LOCK:
+            if previous is None:
+                BATCHES.pop(batch_id, None)
+            else:
+                BATCHES[batch_id] = previous
+        raise
+
+    BATCH_EXECUTOR.submit(run_batch_job, batch_id, videos)
+    return batch_status_payload(batch)
+
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """
+    Progress of a batch: analyzed / skipped / failed out of total.
+    """
+    with BATCHES_LOCK:
+        batch = BATCHES.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        return batch_status_payload(dict(batch))
+
+@app.get("/batches/{batch_id}/results")
+async def get_batch_results(batch_id: str):
+    """
+    The batch results as JSON Lines (complete so far; lines are appended as videos finish).
+    """
+    if not JOB_ID_RE.match(batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    output = os.path.join(BATCH_DIR, f"{batch_id}.jsonl")
+    if not os.path.exists(output):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return FileResponse(output, media_type="application/x-ndjson")
+
+LIVE_SESSIONS = 0
+LIVE_SESSIONS_LOCK = threading.Lock()
+
+@app.websocket("/ws/live")
+async def live_analysis(websocket: WebSocket, fps: float = LIVE_DEFAULT_FPS):
+    """
+    Real-time analysis for live treadmill sessions. The client sends encoded frames (JPEG/PNG) as
+    binary messages; for each analyzed frame the server sends back a JSON message with the back
+    angle, heel strike and overstride angle (analyze_live_frame), plus the latency and drop count.
+    Only the newest frame waits for inference: frames arriving while the model is busy replace it
+    and are counted as dropped, so latency stays bounded instead of a backlog building up.
+    ?fps= is the camera rate (heel window and cooldown). At most LIVE_MAX_SESSIONS sessions at once
+    (others are closed with 1013, try again later).
+    """
+    global LIVE_SESSIONS
+    with LIVE_SESSIONS_LOCK:
+        admitted = LIVE_SESSIONS < LIVE_MAX_SESSIONS
+        if admitted:
+            LIVE_SESSIONS += 1
+    if not admitted:
+        # closing before accept() becomes an HTTP 403 on the handshake; accept first so the client gets 1013
+        await websocket.accept()
+        await websocket.close(code=1013)
+        return
+
+    session = None
+    receiver = None
+    try:
+        await websocket.accept()
+        session = await asyncio.to_thread(new_live_session, fps if fps > 0 else LIVE_DEFAULT_FPS)
+        latest = {'frame': None}   # newest frame not analyzed yet: (seq, bytes, received at)
+        stats = {'received': 0, 'dropped': 0, 'closed': False}
+        ready = asyncio.Event()
+
+        async def receive_frames():
             try:
-                os.unlink(temp_file.name)
-            except:
-                pass
+                while True:
+                    message = await websocket.receive()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    data = message.get('bytes')
+                    if data is None:
+                        continue
+                    if len(data) > LIVE_MAX_FRAME_BYTES or latest['frame'] is not None:
+                        stats['dropped'] += 1
+                    if len(data) <= LIVE_MAX_FRAME_BYTES:
+                        latest['frame'] = (stats['received'], data, time.perf_counter())
+                    stats['received'] += 1
+                    ready.set()
+            except (WebSocketDisconnect, RuntimeError, ConnectionError):
+                pass  # connection dropped: the session ends like on a disconnect
+            finally:
+                stats['closed'] = True
+                ready.set()
+
+        def decode_and_analyze(seq, data):
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            return analyze_live_frame(session, image, seq) if image is not None else None
+
+        receiver = asyncio.create_task(receive_frames())
+        while True:
+            await ready.wait()
+            ready.clear()
+            item, latest['frame'] = latest['frame'], None
+            if item is None:
+                if stats['closed']:
+                    break
+                continue
+
+            seq, data, received_at = item
+            result = await asyncio.to_thread(decode_and_analyze, seq, data)
+            if result is None:
+                result = {'frame': seq, 'error': 'Could not decode frame'}
+            result['latency_ms'] = round(1000 * (time.perf_counter() - received_at), 1)
+            result['dropped'] = stats['dropped']
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        # client gone mid-send (RuntimeError/ConnectionError from the server) or a failed analysis
+        logger.warning(f"[LIVE] sessão encerrada por erro: {e!r}")
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        if session is not None:
+            session['pose'].close()
+        with LIVE_SESSIONS_LOCK:
+            LIVE_SESSIONS -= 1
 
 @app.get("/api/worst_frame/{error_type}/{filename}")
-async def get_worst_frame_image(error_type: str, filename: str):
+async def get_worst_frame_image(error_type: str, filename: str, job_id: Optional[str] = None):
     """
-    API endpoint to serve worst frame images.
+    API endpoint to serve worst frame images (from the job workspace when job_id is given).
     """
     try:
         # Validate error type
@@ -1242,8 +3364,12 @@ async def get_worst_frame_image(error_type: str, filename: str):
         if error_type not in valid_types:
             raise HTTPException(status_code=400, detail="Invalid error type")
         
+        if job_id is not None and not JOB_ID_RE.match(job_id):
+            raise HTTPException(status_code=400, detail="Invalid job id")
+        
         # Construct file path
-        file_path = os.path.join(OUT_DIR, 'worst_frames', filename)
+        base_dir = os.path.join(OUT_DIR, job_id) if job_id else OUT_DIR
+        file_path = os.path.join(base_dir, 'worst_frames', os.path.basename(filename))
         
         # Check if file exists
         if not os.path.exists(file_path):
@@ -1257,6 +3383,117 @@ async def get_worst_frame_image(error_type: str, filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to serve image: {str(e)}")
 
+# ------------------ HEALTH AND METRICS ------------------
+def directory_bytes(path: str) -> int:
+    """
+    Total size of the files under path (0 if it doesn't exist).
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass  # removed while walking (job expired)
+    return total
+
+def prometheus_labels(**labels) -> str:
+    """
+    Formats a label set as {a="1",b="2"} (Prometheus text format).
+    """
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def render_metrics() -> str:
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{prometheus_labels(**labels)} {value}")
+
+    with STAGE_METRICS_LOCK:
+        stages = {stage: (list(h['counts']), h['sum']) for stage, h in STAGE_METRICS.items()}
+    samples = []
+    for stage, (counts, total) in sorted(stages.items()):
+        cumulative = 0
+        for le, count in zip(list(STAGE_BUCKETS) + ['+Inf'], counts):
+            cumulative += count
+            samples.append(("_bucket", {"stage": stage, "le": le}, cumulative))
+        samples.append(("_sum", {"stage": stage}, round(total, 6)))
+        samples.append(("_count", {"stage": stage}, cumulative))
+    metric("movup_stage_duration_seconds", "histogram",
+           "Time per unit of work in each analysis stage (per frame for decode, color_conversion, pose_inference "
+           "and metrics; per image for image_encode; per job for analysis and collection).", samples)
+
+    with HTTP_STATS_LOCK:
+        requests = dict(HTTP_REQUESTS)
+        failures = dict(HTTP_FAILURES)
+    metric("movup_http_requests_total", "counter", "HTTP requests by route and status code.",
+           [("", {"method": m, "route": r, "status": st}, n) for (m, r, st), n in sorted(requests.items())])
+    metric("movup_http_request_failures_total", "counter", "HTTP requests answered with 5xx or an unhandled error.",
+           [("", {"method": m, "route": r}, n) for (m, r), n in sorted(failures.items())])
+
+    with JOBS_LOCK:
+        jobs = {"upload": {"running": count_jobs('running'), "queued": count_jobs('queued')},
+                "batch": dict(BATCH_VIDEOS)}
+        admission = dict(QUEUE_STATS)
+    metric("movup_jobs", "gauge", "Analyses currently running or waiting for a slot (uploaded jobs and batch videos).",
+           [("", {"source": source, "state": state}, jobs[source][state])
+            for source in ("upload", "batch") for state in ("running", "queued")])
+    metric("movup_jobs_total", "counter", "Analysis jobs by outcome (admitted, rejected with 503, completed, failed).",
+           [("", {"outcome": k}, admission[k]) for k in ('admitted', 'rejected', 'completed', 'failed')])
+    with LIVE_SESSIONS_LOCK:
+        live = LIVE_SESSIONS
+    metric("movup_live_sessions", "gauge", "Open real-time analysis WebSocket sessions.", [("", {}, live)])
+
+    with POOL_STATS_LOCK:
+        pool = dict(POOL_STATS)
+    metric("movup_pool_workers", "gauge", "Processes in the inference worker pool.",
+           [("", {}, NUM_PROCS if WORKER_POOL is not None else 0)])
+    metric("movup_pool_chunks_pending", "gauge", "Inference chunks submitted and not finished yet.",
+           [("", {}, pool['chunks_pending'])])
+    metric("movup_pool_chunks_total", "counter", "Inference chunks finished.", [("", {}, pool['chunks_done'])])
+    metric("movup_pool_busy_seconds_total", "counter",
+           "Seconds the workers spent on inference chunks (utilization = rate / workers).",
+           [("", {}, round(pool['busy_seconds'], 6))])
+
+    metric("movup_out_dir_bytes", "gauge", "Bytes written under OUT_DIR (job workspaces).",
+           [("", {}, directory_bytes(OUT_DIR))])
+    metric("movup_pose_ready", "gauge", "1 once the Pose models are loaded.", [("", {}, int(POSE_READY.is_set()))])
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, request/job counters, pool usage and disk usage.
+    """
+    text = await asyncio.to_thread(render_metrics)
+    return Response(content=text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/health")
+async def health():
+    """
+    Liveness: the API process is up and serving requests.
+    """
+    return {"status": "ok", "uptime_seconds": round(time.time() - STARTED_TS, 1), "pose_ready": POSE_READY.is_set()}
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 only once the Pose models are loaded, 503 while they are loading (or failed to load).
+    """
+    if not POSE_READY.is_set():
+        status = "error" if POSE_LOAD_ERROR else "loading"
+        return JSONResponse(status_code=503, content={"status": status, "detail": POSE_LOAD_ERROR})
+    return {"status": "ready"}
+
 @app.get("/")
 async def root():
     """
@@ -1267,13 +3504,57 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "analyze": "/analisar-video/",
+            "jobs": "/jobs/",
+            "job_status": "/jobs/{job_id}",
+            "job_result": "/jobs/{job_id}/result",
+            "job_events": "/jobs/{job_id}/events",
+            "job_frame": "/jobs/{job_id}/frames/{frame_idx}?overlay=postura_incorreta",
+            "queue": "/queue",
+            "live": "/ws/live?fps=30",
             "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics",
+            "batches": "/batches/",
+            "batch_status": "/batches/{batch_id}",
+            "batch_results": "/batches/{batch_id}/results",
             "save_report": "/api/save_report",
             "worst_frame": "/api/worst_frame/{error_type}/{filename}"
         }
     }
 
+def run_batch_cli(args) -> int:
+    """
+    `python root.py batch <directory>`: analyzes every video in the directory into a JSON Lines file.
+    Returns the exit code (1 if any video failed).
+    """
+    videos = list_video_files(args.directory, args.recursive)
+    output = args.output or os.path.join(args.directory, 'movup_results.jsonl')
+    logger.info(f"[BATCH] {len(videos)} vídeos em {args.directory} -> {output}")
+    if MULTIPROCESS and NUM_PROCS > 1:
+        start_worker_pool()
+    try:
+        summary = run_batch(videos, output, concurrency=args.concurrency)
+    finally:
+        stop_worker_pool()
+        stop_image_writer()
+    print(json.dumps(summary))
+    return 1 if summary['failed'] else 0
+
 # ------------------ MAIN ------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MovUp video analysis: API server (default) or batch analysis of a directory.")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="analyze every video in a directory into a JSON Lines file")
+    batch_parser.add_argument("directory")
+    batch_parser.add_argument("--output", help="results file (default: <directory>/movup_results.jsonl); "
+                                               "videos already done in it are skipped")
+    batch_parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENT_VIDEOS,
+                              help="videos analyzed at once (their chunks share the worker pool)")
+    batch_parser.add_argument("--recursive", action="store_true", help="include subdirectories")
+    args = parser.parse_args()
+
+    if args.command == "batch":
+        sys.exit(run_batch_cli(args))
+
     # Run the FastAPI server
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=True)
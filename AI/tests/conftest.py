@@ -0,0 +1,104 @@
+"""
+Fixtures dos testes do pipeline (root.py): vídeo sintético curto e backend de pose stub do benchmark,
+com as pastas de saída/cache em um diretório temporário.
+
+Uso (na pasta AI):
+    python -m pytest -q tests
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import root  # noqa: E402
+import benchmark  # noqa: E402
+
+VIDEO_FPS = 30
+VIDEO_SECONDS = 5  # 150 frames
+VIDEO_SIZE = (320, 180)
+FFMPEG = shutil.which("ffmpeg")  # só para os vídeos de celular (phone_videos); sem ele esses testes são pulados
+
+
+@pytest.fixture(scope="session")
+def synthetic_video(tmp_path_factory):
+    """
+    Vídeo sintético do benchmark (corredor de palitos com o número do frame no topo): (path, n_frames).
+    """
+    path = str(tmp_path_factory.mktemp("video") / "runner.mp4")
+    n = benchmark.make_synthetic_video(path, VIDEO_SIZE[0], VIDEO_SIZE[1], VIDEO_FPS, VIDEO_SECONDS)
+    return path, n
+
+
+def ffmpeg_encoders():
+    if FFMPEG is None:
+        return ""
+    return subprocess.run([FFMPEG, "-hide_banner", "-encoders"], capture_output=True, text=True).stdout
+
+
+@pytest.fixture(scope="session")
+def phone_videos(synthetic_video, tmp_path_factory):
+    """
+    O vídeo sintético recodificado como vídeo de celular (keyframe a cada 1 s): H.264 e HEVC com
+    B-frames (taxa constante) e H.264 com taxa variável (meio segundo sem frames, timestamps com jitter).
+    """
+    encoders = ffmpeg_encoders()
+    if "libx264" not in encoders:
+        pytest.skip("ffmpeg com libx264 não disponível")
+    src, n = synthetic_video
+    out_dir = tmp_path_factory.mktemp("phone")
+    variants = {
+        "h264_bframes": ["-c:v", "libx264", "-bf", "3", "-x264-params", "b-pyramid=normal"],
+        "h264_vfr_gap": ["-vf", "setpts='(N+15*gte(N,60))/30/TB'", "-fps_mode", "passthrough",
+                         "-c:v", "libx264", "-bf", "3"],
+        "h264_vfr_jitter": ["-vf", "setpts='(N+0.45*sin(7*N))/30/TB'", "-fps_mode", "passthrough",
+                            "-c:v", "libx264", "-bf", "3", "-video_track_timescale", "90000"],
+    }
+    if "libx265" in encoders:
+        variants["hevc_bframes"] = ["-c:v", "libx265", "-x265-params", "bframes=4:log-level=error",
+                                    "-tag:v", "hvc1"]
+    paths = {}
+    for name, args in variants.items():
+        paths[name] = str(out_dir / f"{name}.mp4")
+        subprocess.run([FFMPEG, "-y", "-loglevel", "error", "-i", src, *args, "-g", "30", "-pix_fmt", "yuv420p",
+                        paths[name]],
+                       check=True)
+    return paths, n
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """
+    Pipeline com o StubPose, saídas em tmp_path e sem cache de landmarks.
+    """
+    monkeypatch.setattr(root.mp_pose, "Pose", benchmark.StubPose)
+    monkeypatch.setattr(benchmark.StubPose, "fps", float(VIDEO_FPS))
+    monkeypatch.setattr(root, "OUT_DIR", str(tmp_path / "out"))
+    monkeypatch.setattr(root, "FRAMES_DIR", str(tmp_path / "frames_raw"))
+    monkeypatch.setattr(root, "LANDMARK_CACHE_ENABLED", False)
+    monkeypatch.setattr(root, "FRAME_COST_EMA", None)
+    return root
+
+
+@pytest.fixture
+def worker_pool(pipeline, monkeypatch):
+    """
+    Pool persistente com 4 workers (criado depois do StubPose, que os workers herdam no fork).
+    """
+    monkeypatch.setattr(root, "NUM_PROCS", 4)
+    root.stop_worker_pool()
+    root.start_worker_pool()
+    yield root
+    root.stop_worker_pool()
+
+
+def new_meta(video_path):
+    """
+    meta de uma análise do vídeo (probe + workspace), como em analyze_video_file.
+    """
+    meta = root.probe_video(video_path)
+    meta.update(root.create_job_workspace())
+    return meta
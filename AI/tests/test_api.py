@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import root
+
+BOUNDARY = "movup-test-boundary"
+
+
+def multipart_video(data, filename="run.mp4", content_type="video/mp4"):
+    """
+    Corpo multipart/form-data com um único campo 'file'.
+    """
+    head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n").encode()
+    return head + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+ORIGIN = "http://localhost:3000"  # frontend em outra origem (FRONT/src/config/apiUrls.js)
+
+
+def asgi_post(path, body, chunk_size=64 * 1024, content_length=True):
+    """
+    POST direto no app ASGI (vindo do frontend, com Origin), entregando o corpo em blocos.
+    Retorna (status, headers, blocos lidos pelo app).
+    """
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()), (b"origin", ORIGIN.encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": headers, "client": ("test", 1), "server": ("test", 80),
+    }
+    consumed = 0
+    sent = []
+
+    async def receive():
+        nonlocal consumed
+        if consumed < len(chunks):
+            consumed += 1
+            return {"type": "http.request", "body": chunks[consumed - 1], "more_body": consumed < len(chunks)}
+        await asyncio.sleep(3600)  # o cliente não manda mais nada
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asyncio.wait_for(root.app(scope, receive, send), 30))
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, consumed
+
+
+def test_full_queue_rejects_before_reading_the_upload(monkeypatch):
+    monkeypatch.setattr(root, "MAX_QUEUED_JOBS", 0)
+    rejected = root.QUEUE_STATS['rejected']
+    counted = {path: root.HTTP_REQUESTS[("POST", path, 503)] for path in ("/analisar-video/", "/jobs/")}
+    body = multipart_video(b"\0\0\0\x18ftypmp42" + b"\0" * (2 * 1024**2))
+
+    for path in ("/analisar-video/", "/jobs/"):
+        status, headers, consumed = asgi_post(path, body)
+        assert status == 503
+        assert int(headers["retry-after"]) >= 1
+        assert consumed == 0
+        # o navegador só entrega a resposta (e o Retry-After) ao frontend com os cabeçalhos de CORS
+        assert headers["access-control-allow-origin"] in ("*", ORIGIN)
+        assert "retry-after" in headers["access-control-expose-headers"].lower()
+
+    assert root.QUEUE_STATS['rejected'] == rejected + 2
+    # rejeitados antes do roteamento, mas contados na rota do upload (não em 'unmatched')
+    assert all(root.HTTP_REQUESTS[("POST", path, 503)] == n + 1 for path, n in counted.items())
+
+
+def test_declared_oversized_upload_is_rejected_unread(monkeypatch):
+    monkeypatch.setattr(root, "UPLOAD_MAX_BYTES", 1024**2)
+    body = multipart_video(b"\0\0\0\x18ftypmp42" + b"\0" * (3 * 1024**2))
+    counted = root.HTTP_REQUESTS[("POST", "/jobs/", 413)]
+    status, headers, consumed = asgi_post("/jobs/", body)
+    assert status == 413
+    assert consumed == 0
+    assert root.HTTP_REQUESTS[("POST", "/jobs/", 413)] == counted + 1
+    assert headers["access-control-allow-origin"] in ("*", ORIGIN)
+
+
+def test_chunked_oversized_upload_is_cut_off(monkeypatch):
+    monkeypatch.setattr(root, "UPLOAD_MAX_BYTES", 1024**2)
+    chunk_size = 64 * 1024
+    body = multipart_video(b"\0\0\0\x18ftypmp42" + b"\0" * (3 * 1024**2))
+    status, headers, consumed = asgi_post("/jobs/", body, chunk_size=chunk_size, content_length=False)
+    assert status == 413
+    assert headers["access-control-allow-origin"] in ("*", ORIGIN)
+    # para logo depois de passar do limite, sem receber o resto do corpo
+    assert consumed * chunk_size <= root.upload_limit("/jobs/") + chunk_size
+
+
+def test_sync_analysis_deletes_the_video_and_jobs_keep_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(root, "JOBS", {})
+    monkeypatch.setattr(root, "analyze_video_file", lambda *a, **k: {"summary": {"total_frames": 3}})
+    videos = {}
+    for keep_video in (False, True):
+        path = tmp_path / f"keep_{keep_video}.mp4"
+        path.write_bytes(b"\0" * 1000)
+        job_id, future = root.submit_analysis_job(str(path), keep_video=keep_video)
+        future.result(timeout=10)
+        videos[keep_video] = (path, root.get_job(job_id))
+
+    path, job = videos[False]
+    assert not path.exists() and job['video_path'] is None
+    with pytest.raises(HTTPException) as gone:
+        root.get_job_frame(job['job_id'], 0)
+    assert gone.value.status_code == 410
+
+    path, job = videos[True]
+    assert path.exists() and job['video_path'] == str(path) and job['video_bytes'] == 1000
+
+
+def test_job_videos_are_evicted_least_recently_used(tmp_path, monkeypatch):
+    now = time.time()
+    jobs = {}
+    for name, used_ago, status in (("velho", 300, "done"), ("usado", 200, "done"), ("novo", 100, "done"),
+                                   ("rodando", 400, "running")):
+        path = tmp_path / f"{name}.mp4"
+        path.write_bytes(b"\0" * 1000)
+        jobs[name] = {"job_id": name, "status": status, "video_path": str(path), "video_bytes": 1000,
+                      "video_used_ts": now - used_ago}
+    jobs["usado"]["video_used_ts"] = now  # acabou de renderizar um frame
+    monkeypatch.setattr(root, "JOBS", jobs)
+    monkeypatch.setattr(root, "JOB_VIDEO_MAX_BYTES", 2000)
+
+    root.enforce_job_video_budget()
+
+    # os jobs terminados ficam com até 2000 bytes; o em andamento não entra na conta
+    assert sorted(p.stem for p in tmp_path.iterdir()) == ["novo", "rodando", "usado"]
+    assert jobs["velho"]["video_path"] is None and jobs["usado"]["video_path"]
+
+
+def test_expired_jobs_are_purged_without_new_uploads(tmp_path, monkeypatch):
+    video = tmp_path / "antigo.mp4"
+    video.write_bytes(b"\0")
+    old = time.time() - root.JOB_RETENTION_SECONDS - 60
+    monkeypatch.setattr(root, "JOBS", {"antigo": {"job_id": "antigo", "status": "done", "created_ts": old,
+                                                  "video_path": str(video)}})
+    monkeypatch.setattr(root, "BATCHES", {})
+    monkeypatch.setattr(root, "BATCH_DIR", str(tmp_path / "batches"))
+    monkeypatch.setattr(root, "OUT_DIR", str(tmp_path / "out"))
+    monkeypatch.setattr(root, "FRAMES_DIR", str(tmp_path / "frames_raw"))
+    monkeypatch.setattr(root, "PURGE_INTERVAL_SECONDS", 0.01)
+
+    root.start_purge_loop()
+    try:
+        deadline = time.time() + 5
+        while root.JOBS and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        root.PURGE_STOP.set()
+    assert root.JOBS == {} and not video.exists()
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import root
+
+
+def test_batch_videos_share_the_analysis_slots(tmp_path, monkeypatch):
+    lock = threading.Lock()
+    active = []
+    stats = []
+
+    def slow_analysis(video_path, video_hash=None):
+        with lock:
+            active.append(video_path)
+        time.sleep(0.1)  # os outros vídeos do lote já pediram um slot
+        with lock:
+            stats.append((len(active), root.queue_stats()))
+        time.sleep(0.1)
+        with lock:
+            active.remove(video_path)
+        return {"video": video_path}
+
+    monkeypatch.setattr(root, "analyze_video_file", slow_analysis)
+    videos = [{"name": f"v{i}.mp4", "path": str(tmp_path / f"v{i}.mp4"), "sha256": f"{i:064x}"} for i in range(4)]
+
+    summary = root.run_batch(videos, str(tmp_path / "out.jsonl"), concurrency=4, analyze=root.run_batch_video)
+
+    assert summary['analyzed'] == 4
+    # nunca mais que MAX_CONCURRENT_JOBS análises ao mesmo tempo, e as demais aparecem na fila
+    assert max(n for n, _ in stats) == root.MAX_CONCURRENT_JOBS
+    assert all(s['batch_running'] == n for n, s in stats)
+    assert max(s['batch_queued'] for _, s in stats) == 4 - root.MAX_CONCURRENT_JOBS
+    assert root.queue_stats()['batch_running'] == root.queue_stats()['batch_queued'] == 0
+    assert 'source="batch",state="running"' in root.render_metrics()
+
+
+def test_concurrent_posts_of_one_batch_id_conflict(tmp_path, monkeypatch):
+    release = asyncio.Event()
+    submitted = []
+
+    async def slow_upload(file):
+        await release.wait()
+        return str(tmp_path / file.filename), "0" * 64
+
+    monkeypatch.setattr(root, "save_upload_to_tempfile", slow_upload)
+    monkeypatch.setattr(root, "BATCH_EXECUTOR", SimpleNamespace(submit=lambda *args: submitted.append(args)))
+    monkeypatch.setattr(root, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(root, "BATCHES", {})
+
+    async def post_twice():
+        files = [SimpleNamespace(filename="a.mp4")]
+        first = asyncio.create_task(root.create_batch(files, batch_id="lote_1"))
+        await asyncio.sleep(0)  # o primeiro POST está lendo os uploads
+        with pytest.raises(HTTPException) as conflict:
+            await root.create_batch(files, batch_id="lote_1")
+        release.set()
+        return await first, conflict.value
+
+    created, conflict = asyncio.run(asyncio.wait_for(post_twice(), 10))
+    assert conflict.status_code == 409
+    assert created['status'] == 'queued' and len(submitted) == 1
+
+
+def test_finished_batches_expire(tmp_path, monkeypatch):
+    now = time.time()
+    old = now - root.JOB_RETENTION_SECONDS - 60
+    monkeypatch.setattr(root, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(root, "BATCHES", {
+        "antigo": {"status": "done", "finished_ts": old},
+        "recente": {"status": "done", "finished_ts": now},
+        "rodando": {"status": "running", "finished_ts": None},
+    })
+    for batch_id in ("antigo", "recente", "rodando", "sem_registro"):
+        path = tmp_path / f"{batch_id}.jsonl"
+        path.write_text("{}\n")
+        if batch_id != "recente":
+            os.utime(path, (old, old))
+
+    root.purge_finished_batches()
+
+    assert set(root.BATCHES) == {"recente", "rodando"}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["recente.jsonl", "rodando.jsonl"]
@@ -0,0 +1,57 @@
+import pytest
+
+import root
+
+OVERLAP = 23  # janela de 0.8 s a 30 fps, menos 1
+
+
+def effective_ranges(parts):
+    return sorted((start, end) for _, end, start in parts)
+
+
+@pytest.mark.parametrize("frame_count", [1, 59, 60, 150, 239, 240, 1000, 5000, 20000])
+@pytest.mark.parametrize("workers", [1, 4, 7])
+def test_chunks_cover_the_video_once(frame_count, workers):
+    parts, stats = root.plan_chunks(frame_count, OVERLAP, workers)
+    ranges = effective_ranges(parts)
+
+    # intervalos efetivos contíguos, sem buraco nem sobreposição, cobrindo [0, frame_count)
+    assert ranges[0][0] == 0 and ranges[-1][1] == frame_count
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(end > start for start, end in ranges)
+    # o overlap só antecede o trecho efetivo, e não passa do início do vídeo
+    assert all(ini == max(0, start - OVERLAP) for ini, _, start in parts)
+    assert stats['chunks'] == len(parts)
+    assert stats['overlap_frames'] == sum(start - ini for ini, _, start in parts)
+
+
+def test_chunks_are_dispatched_largest_first():
+    parts, _ = root.plan_chunks(5000, OVERLAP, 4)
+    sizes = [end - ini for ini, end, _ in parts]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+@pytest.mark.parametrize("frame_count, workers, expected", [
+    (150, 4, [(0, 50), (50, 100), (100, 150)]),  # ceil(150 / 60) = 3 chunks iguais
+    (239, 4, [(0, 59), (59, 119), (119, 179), (179, 239)]),
+    (60, 4, [(0, 60)]),
+    (1, 4, [(0, 1)]),
+])
+def test_short_video_is_split_evenly(frame_count, workers, expected):
+    parts, _ = root.plan_chunks(frame_count, OVERLAP, workers)
+    assert effective_ranges(parts) == expected
+
+
+def test_unknown_frame_count_reads_to_the_end(monkeypatch):
+    monkeypatch.setattr(root, "FRAME_COST_EMA", None)
+    parts, stats = root.plan_chunks(0, OVERLAP, 4)
+    assert parts == [(0, 0, 0)] and stats['overlap_ratio'] == 0.0
+    assert root.schedule_chunks({'fps': 30.0, 'frame_count': 0}) == [(0, None, 0)]
+
+
+def test_last_chunk_is_left_open(monkeypatch):
+    monkeypatch.setattr(root, "FRAME_COST_EMA", None)
+    parts = root.schedule_chunks({'fps': 30.0, 'frame_count': 1000})
+    open_parts = [p for p in parts if p[1] is None]
+    assert len(open_parts) == 1
+    assert open_parts[0][2] == max(start for _, _, start in parts)
@@ -0,0 +1,100 @@
+import json
+
+import numpy as np
+import pytest
+
+import root
+
+
+def baseline_heel_strikes(heel_y, heel_visible, detected, window_size, cooldown_frames, tol=1e-3):
+    """
+    Regra original do loop por frame (rightHeel_history + detection_cooldown), para comparação.
+    """
+    rightHeel_history = []
+    detection_cooldown = 0
+    strikes, lowest = [], {}
+    for i, (y, visible, det) in enumerate(zip(heel_y, heel_visible, detected)):
+        if not det:
+            continue
+        if visible:
+            rightHeel_history.append(float(y))
+            if len(rightHeel_history) > window_size:
+                rightHeel_history.pop(0)
+            if len(rightHeel_history) == window_size:
+                lowest[i] = float(np.max(rightHeel_history))
+                if detection_cooldown == 0 and y >= lowest[i] - tol:
+                    strikes.append(i)
+                    detection_cooldown = cooldown_frames
+        if detection_cooldown > 0:
+            detection_cooldown -= 1
+    return strikes, lowest
+
+
+def heel_trace(n, fps, seed):
+    """
+    y do calcanhar de uma corrida (passada de ~0.7 s, com ruído e platôs no contato), com frames
+    sem o calcanhar visível e frames sem detecção nenhuma.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / fps
+    heel_y = 0.8 + 0.05 * np.sin(2 * np.pi * t / 0.7) + rng.normal(0, 0.004, n)
+    heel_y = np.round(np.minimum(heel_y, 0.845), 3)  # platôs: empates dentro da tolerância
+    heel_visible = rng.random(n) > 0.1
+    detected = rng.random(n) > 0.05
+    return heel_y, heel_visible, detected
+
+
+@pytest.mark.parametrize("fps, seed", [(30.0, 0), (60.0, 1), (24.0, 2)])
+def test_detector_matches_the_original_rule(fps, seed):
+    heel_y, heel_visible, detected = heel_trace(int(fps * 20), fps, seed)
+    window_size = max(1, int(round(fps * root.WINDOW_SECONDS)))
+    cooldown_frames = max(1, int(round(fps * root.COOLDOWN_SECONDS)))
+    expected, expected_lowest = baseline_heel_strikes(heel_y, heel_visible, detected, window_size, cooldown_frames)
+    assert len(expected) > 10
+
+    # modo incremental, frame a frame
+    detector = root.create_heel_detector(fps)
+    events = {}
+    for i in range(len(heel_y)):
+        event = detector.push(i, heel_y[i] if heel_visible[i] else None, bool(detected[i]))
+        if event is not None:
+            events[i] = event
+    assert [i for i, e in events.items() if e['strike']] == expected
+    assert {i: e['lowest_y'] for i, e in events.items()} == expected_lowest
+
+    # modo offline, de uma vez e continuando em pedaços
+    offline = root.create_heel_detector(fps).detect(heel_y, heel_visible, detected)
+    assert list(np.flatnonzero(offline['strike'])) == expected
+    assert sorted(np.flatnonzero(offline['tracked'])) == sorted(expected_lowest)
+
+    detector = root.create_heel_detector(fps)
+    strikes = []
+    for a, b in [(0, 7), (7, 8), (8, 150), (150, 151), (151, len(heel_y))]:
+        part = detector.detect(heel_y[a:b], heel_visible[a:b], detected[a:b])
+        strikes += [a + i for i in np.flatnonzero(part['strike'])]
+    assert strikes == expected
+
+
+@pytest.mark.parametrize("boundary", [5, 150, 301])
+def test_state_hand_off_across_a_chunk_boundary(boundary):
+    # um worker detecta até o fim do seu chunk e passa o estado (JSON) para o próximo
+    fps = 30.0
+    heel_y, heel_visible, detected = heel_trace(600, fps, 3)
+    expected = root.create_heel_detector(fps).detect(heel_y, heel_visible, detected)
+
+    first = root.create_heel_detector(fps)
+    head = first.detect(heel_y[:boundary], heel_visible[:boundary], detected[:boundary])
+    state = json.loads(json.dumps(first.get_state()))
+    second = root.HeelStrikeDetector.from_state(state)
+    tail = second.detect(heel_y[boundary:], heel_visible[boundary:], detected[boundary:])
+
+    strikes = np.concatenate([head['strike'], tail['strike']])
+    np.testing.assert_array_equal(strikes, expected['strike'])
+    np.testing.assert_array_equal(np.concatenate([head['lowest_y'], tail['lowest_y']]), expected['lowest_y'])
+
+    # e o push frame a frame continua do mesmo estado
+    pushed = root.HeelStrikeDetector.from_state(state)
+    events = [pushed.push(i, heel_y[i] if heel_visible[i] else None, bool(detected[i]))
+              for i in range(boundary, len(heel_y))]
+    assert [i for i, e in zip(range(boundary, len(heel_y)), events) if e and e['strike']] == \
+        list(boundary + np.flatnonzero(tail['strike']))
@@ -0,0 +1,180 @@
+import os
+
+import cv2
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from conftest import new_meta
+
+
+def test_multiproc_with_overreported_frame_count(worker_pool, synthetic_video):
+    # contêiner informando 4x os frames reais: os chunks depois do fim voltam vazios
+    path, n = synthetic_video
+    meta = new_meta(path)
+    meta['frame_count'] = 4 * n
+
+    landmarks = worker_pool.process_frames_multiproc(meta)
+
+    assert len(landmarks) == n
+    assert meta['frame_count'] == n
+    assert not np.isnan(landmarks[:, worker_pool.HIP_IDX, 0]).any()
+
+    store = worker_pool.analyze_landmarks(landmarks, meta)
+    summary = worker_pool.summarize_analysis(store, meta['frame_count'])
+    # o StubPose esconde o joelho em 2 de cada 50 frames
+    assert summary['visibility']['issues'] == 2 * n // 50
+
+
+def test_multiproc_matches_sequential(worker_pool, synthetic_video):
+    path, _ = synthetic_video
+    parallel = worker_pool.process_frames_multiproc(new_meta(path))
+    sequential = worker_pool.process_frames_sequential(new_meta(path))
+    np.testing.assert_array_equal(parallel, sequential)
+
+
+def test_frame_counters_match_the_inference_loop(pipeline, synthetic_video):
+    path, n = synthetic_video
+    meta = new_meta(path)
+    landmarks = pipeline.process_frames_sequential(meta)
+    recount = pipeline.frame_counters(landmarks, np.ones(n, dtype=bool))
+    assert recount == {key: meta['counters'][key] for key in recount}
+
+
+def test_adaptive_counts_refined_frames_once(worker_pool, synthetic_video, monkeypatch):
+    # passo 2 forçado (o vídeo é de 30 fps) e sem a volta para a taxa cheia
+    monkeypatch.setattr(worker_pool, "ADAPTIVE_MIN_STEP", 1)
+    monkeypatch.setattr(worker_pool, "ADAPTIVE_MAX_REFINE_RATIO", 1.0)
+    path, n = synthetic_video
+    meta = new_meta(path)
+    worker_pool.process_frames_adaptive(meta)
+    counters = meta['counters']
+    assert counters['frames_inferred'] + counters['frames_skipped'] == n
+    assert counters['frames_inferred'] < n
+    # o aquecimento de cada trecho refinado também chama o Pose
+    assert counters['pose_calls'] >= counters['frames_inferred']
+    assert counters['low_visibility'] <= 2 * n // 50
+
+
+def test_adaptive_refine_regions_are_merged_across_the_warmup(worker_pool, synthetic_video):
+    path, _ = synthetic_video
+    meta = new_meta(path)
+    landmarks = worker_pool.process_frames_multiproc(meta)
+    inferred = np.zeros(len(landmarks), dtype=bool)
+    inferred[::2] = True
+    regions = worker_pool.adaptive_refine_regions(landmarks, inferred, meta, 2)
+    assert regions
+    for (_, end), (start, _) in zip(regions, regions[1:]):
+        assert start - end > worker_pool.ADAPTIVE_WARMUP_FRAMES
+
+
+def test_adaptive_falls_back_to_full_rate(worker_pool, synthetic_video, monkeypatch):
+    path, n = synthetic_video
+    full_meta = new_meta(path)
+    full = worker_pool.process_frames_multiproc(full_meta)
+    # uma chamada por frame e mais uma a cada troca do recorte do ROI (reset do tracking)
+    assert full_meta['counters']['pose_calls'] >= n
+
+    # 30 fps: passo 2 abaixo de ADAPTIVE_MIN_STEP
+    meta = new_meta(path)
+    np.testing.assert_array_equal(worker_pool.process_frames_adaptive(meta), full)
+    assert meta['counters']['pose_calls'] == full_meta['counters']['pose_calls']
+
+    # trechos refinados cobrindo o vídeo: passo 2 em taxa cheia no vídeo inteiro
+    monkeypatch.setattr(worker_pool, "ADAPTIVE_MIN_STEP", 1)
+    monkeypatch.setattr(worker_pool, "ADAPTIVE_MAX_REFINE_RATIO", 0.0)
+    meta = new_meta(path)
+    np.testing.assert_array_equal(worker_pool.process_frames_adaptive(meta), full)
+    assert meta['counters']['frames_inferred'] == n and meta['counters']['frames_skipped'] == 0
+
+
+def test_multiproc_on_variable_rate_video(worker_pool, phone_videos):
+    # chunks que chegam no início avançando desde o frame 0: mesmos frames do modo sequencial
+    paths, n = phone_videos
+    meta = new_meta(paths["h264_vfr_gap"])
+    assert not meta['seek_exact']
+    parallel = worker_pool.process_frames_multiproc(meta)
+    sequential = worker_pool.process_frames_sequential(new_meta(paths["h264_vfr_gap"]))
+    assert len(parallel) == n
+    np.testing.assert_array_equal(parallel, sequential)
+
+
+def test_result_images_read_the_chosen_frames_once(worker_pool, synthetic_video, monkeypatch):
+    path, _ = synthetic_video
+    meta = new_meta(path)
+    landmarks = worker_pool.process_frames_multiproc(meta)
+    summary = worker_pool.summarize_analysis(worker_pool.analyze_landmarks(landmarks, meta), meta['frame_count'])
+
+    reads = []
+    read_video_frames = worker_pool.read_video_frames
+    monkeypatch.setattr(worker_pool, "read_video_frames", lambda *a: reads.append(a[1]) or read_video_frames(*a))
+    monkeypatch.setattr(worker_pool, "read_video_frame", None)  # nada de um VideoCapture por imagem
+    images = worker_pool.render_result_images(meta, landmarks, summary)
+
+    chosen = {summary[category][field] for category, field, _, _ in worker_pool.RESULT_IMAGES} - {None}
+    assert len(reads) == 1 and set(reads[0]) == chosen
+    assert len(images) == len([f for c, f, _, _ in worker_pool.RESULT_IMAGES if summary[c][f] is not None])
+    for url in images.values():
+        assert os.path.getsize(os.path.join(worker_pool.OUT_DIR, os.path.relpath(url, "out"))) > 0
+
+
+class SmoothingPose:
+    """
+    Pose em modo vídeo de brinquedo: acha a pessoa (bloco vermelho) na imagem recebida e suaviza
+    os landmarks com uma média móvel nas coordenadas normalizadas dessa imagem, como o
+    smooth_landmarks do MediaPipe; reset() zera a suavização.
+    """
+    def __init__(self, *args, smooth_landmarks=True, **kwargs):
+        self.smooth = smooth_landmarks
+        self.prev = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def reset(self):
+        self.prev = None
+
+    def process(self, rgb):
+        h, w = rgb.shape[:2]
+        ys, xs = np.nonzero((rgb[:, :, 0] > 180) & (rgb[:, :, 1] < 90))
+        if not len(xs):
+            self.prev = None
+            return type('Results', (), {'pose_landmarks': None})()
+        x0, x1, y0, y1 = xs.min() / w, (xs.max() + 1) / w, ys.min() / h, (ys.max() + 1) / h
+        points = np.array([(x0 + (x1 - x0) * (k % 6) / 5, y0 + (y1 - y0) * (k // 6) / 5) for k in range(33)])
+        if self.smooth and self.prev is not None:
+            points = 0.5 * self.prev + 0.5 * points
+        self.prev = points
+        proto = landmark_pb2.NormalizedLandmarkList()
+        for x, y in points:
+            proto.landmark.add(x=float(x), y=float(y), z=0.0, visibility=0.95)
+        return type('Results', (), {'pose_landmarks': proto})()
+
+
+def test_roi_crop_matches_the_full_frame_on_a_moving_subject(pipeline, tmp_path, monkeypatch):
+    # pessoa andando para o lado na esteira, com a passada alargando a caixa e o corpo subindo e descendo
+    w, h, n = 480, 270, 120
+    path = str(tmp_path / "moving.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (w, h))
+    for i in range(n):
+        frame = np.full((h, w, 3), 90, dtype=np.uint8)
+        x, y, width = 150 + 80 * i // n, 100 + int(8 * np.sin(i / 3)), 40 + int(30 * abs(np.sin(i / 6)))
+        frame[y:y + 90, x:x + width] = (0, 0, 255)
+        writer.write(frame)
+    writer.release()
+    monkeypatch.setattr(pipeline.mp_pose, "Pose", SmoothingPose)
+
+    def run(crop):
+        monkeypatch.setattr(pipeline, "ROI_CROP_ENABLED", crop)
+        with pipeline.create_pose() as pose:
+            return pipeline.infer_frames_range(pose, new_meta(path), 0, None, 0)
+
+    full, cropped = run(False), run(True)
+    error = (np.abs(cropped['landmarks'][:, :, :2] - full['landmarks'][:, :, :2]) * [w, h]).max(axis=(1, 2))
+    # recorte parado na maior parte do vídeo; quando ele muda o Pose é zerado e a diferença
+    # fica limitada ao atraso da suavização que recomeça (recortes misturados: dezenas de px)
+    assert cropped['counters']['pose_resets'] <= n // 15
+    assert np.median(error) < 0.5
+    assert error.max() < 6
@@ -0,0 +1,47 @@
+import asyncio
+
+import cv2
+
+import benchmark
+import root
+
+
+def run_websocket(messages, send_error=None):
+    """
+    Sessão direta no app ASGI em /ws/live: entrega 'messages' (depois do connect) e devolve as
+    mensagens enviadas pelo servidor. send_error: exceção levantada ao enviar um frame analisado.
+    """
+    scope = {"type": "websocket", "asgi": {"version": "3.0"}, "path": "/ws/live", "raw_path": b"/ws/live",
+             "query_string": b"fps=30", "root_path": "", "headers": [], "subprotocols": [],
+             "client": ("test", 1), "server": ("test", 80), "scheme": "ws"}
+    incoming = [{"type": "websocket.connect"}] + messages
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if send_error is not None and message["type"] == "websocket.send":
+            raise send_error
+        sent.append(message)
+
+    asyncio.run(asyncio.wait_for(root.app(scope, receive, send), 30))
+    return sent
+
+
+def test_full_server_accepts_then_closes_with_1013(monkeypatch):
+    monkeypatch.setattr(root, "LIVE_MAX_SESSIONS", 0)
+    sent = run_websocket([])
+    assert [m["type"] for m in sent] == ["websocket.accept", "websocket.close"]
+    assert sent[1]["code"] == 1013
+    assert root.LIVE_SESSIONS == 0
+
+
+def test_dropped_client_releases_the_session_slot(pipeline):
+    ok, jpeg = cv2.imencode(".jpg", benchmark.draw_synthetic_frame(5, 320, 180, 30))
+    frame = {"type": "websocket.receive", "bytes": jpeg.tobytes()}
+    sent = run_websocket([frame], send_error=RuntimeError("Unexpected ASGI message 'websocket.send'"))
+    assert sent[0]["type"] == "websocket.accept"
+    assert root.LIVE_SESSIONS == 0
@@ -0,0 +1,110 @@
+import cv2
+
+import benchmark
+import root
+
+
+class CountingCapture:
+    """
+    VideoCapture que conta os frames decodificados por grab()/read().
+    """
+    def __init__(self, path):
+        self.cap = cv2.VideoCapture(path)
+        self.decoded = 0
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def grab(self):
+        self.decoded += 1
+        return self.cap.grab()
+
+    def read(self):
+        self.decoded += 1
+        return self.cap.read()
+
+
+def frame_number(image):
+    """
+    Número do frame desenhado pelo benchmark nos blocos do topo da imagem.
+    """
+    h, w = image.shape[:2]
+    idx = 0
+    for b, (x0, y0, x1, y1) in enumerate(benchmark.code_blocks(w, h)):
+        if image[(y0 + y1) // 2, (x0 + x1) // 2].mean() > 127:
+            idx |= 1 << b
+    return idx
+
+
+def test_seek_lands_on_target(synthetic_video):
+    path, n = synthetic_video
+    for target in (1, 29, 30, 31, 77, n - 1):
+        cap = CountingCapture(path)
+        assert root.seek_video(cap, target)
+        ok, image = cap.read()
+        assert ok and frame_number(image) == target
+        assert cap.decoded == 1  # sem preroll
+
+
+def test_read_video_frames_in_one_pass(synthetic_video):
+    path, n = synthetic_video
+    frames = root.read_video_frames(path, [77, 3, n - 1, 3, n + 5])
+    assert sorted(frames) == [3, 77, n - 1]
+    assert all(frame_number(image) == idx for idx, image in frames.items())
+
+
+def test_seek_past_end_decodes_nothing(synthetic_video):
+    path, n = synthetic_video
+    for target in (n, n + 1, 4 * n):
+        cap = CountingCapture(path)
+        if root.seek_video(cap, target):
+            assert not cap.read()[0]  # parado exatamente no fim
+        assert cap.decoded <= 1
+
+
+def test_iter_video_frames_range(synthetic_video):
+    path, n = synthetic_video
+    frames = list(root.iter_video_frames(path, 100, 110))
+    assert [i for i, _ in frames] == list(range(100, 110))
+    assert all(frame_number(image) == i for i, image in frames)
+    assert list(root.iter_video_frames(path, 2 * n, 3 * n)) == []
+    assert [i for i, _ in root.iter_video_frames(path, n - 3, None)] == [n - 3, n - 2, n - 1]
+
+
+def test_seek_on_phone_videos(phone_videos):
+    paths, n = phone_videos
+    for name, path in paths.items():
+        constant_rate = "vfr" not in name
+        seek_exact = root.probe_video(path)['seek_exact']
+        assert seek_exact == constant_rate, name
+        for target in list(range(1, n, 7)) + [n - 1]:
+            cap = CountingCapture(path)
+            assert root.seek_video(cap, target, seek_exact), (name, target)
+            ok, image = cap.read()
+            assert ok and frame_number(image) == target, (name, target)
+            if constant_rate:
+                assert cap.decoded == 1  # seek direto, sem avançar desde o início
+
+
+def test_variable_rate_video_is_split_one_chunk_per_worker(phone_videos, monkeypatch):
+    paths, n = phone_videos
+    monkeypatch.setattr(root, "NUM_PROCS", 4)
+    monkeypatch.setattr(root, "FRAME_COST_EMA", None)
+    meta = root.probe_video(paths["h264_vfr_gap"])
+    parts = root.schedule_chunks(meta)
+    sizes = sorted((end or n) - start for _, end, start in parts)
+    assert len(parts) <= root.NUM_PROCS and sizes[-1] - sizes[0] <= 1
+
+
+def test_frames_of_variable_rate_video_keep_their_index(phone_videos):
+    paths, n = phone_videos
+    path = paths["h264_vfr_gap"]
+    for start in (0, 37, 75, 112):
+        frames = root.iter_video_frames(path, start, start + 5, seek_exact=False)
+        assert [frame_number(image) for _, image in frames] == list(range(start, start + 5))
+    assert frame_number(root.read_video_frame(path, n - 1, seek_exact=False)) == n - 1
+    frames = root.read_video_frames(path, [120, 5, 61], seek_exact=False)
+    assert {idx: frame_number(image) for idx, image in frames.items()} == {5: 5, 61: 61, 120: 120}